@@ -0,0 +1,199 @@
+"""Writing of datasets derived from a recorded one (trimmed, merged, resampled), in the v2.1 layout.
+
+`DerivedDatasetWriter` writes the parquet tables and the `meta/` files of the new dataset, with the
+stats of the low-dimensional features computed on the new tables like `save_episode` does.
+
+`transcode_video` cuts, duplicates or resizes the frames of one source video into any number of new
+videos with a single decoding pass, and returns the stats of every new video. Run it in a process
+pool (`make_transcode_pool`) with one task per source video.
+"""
+
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from pathlib import Path
+
+import av
+import numpy as np
+import pandas as pd
+
+from lerobot.datasets.compute_stats import compute_episode_stats, sample_indices
+from lerobot.datasets.utils import DEFAULT_CHUNK_SIZE, serialize_dict, write_info, write_jsonlines
+from lerobot.datasets.video_utils import get_video_info
+
+from data.image_writers import add_video_stream, image_stats
+
+# Columns rewritten by `DerivedDatasetWriter.write_episode_data`
+INDEX_KEYS = ["index", "episode_index", "frame_index", "timestamp", "task_index"]
+
+
+def column_array(df: pd.DataFrame, key: str) -> np.ndarray:
+    """`(N, ...)` array of a parquet column, whose rows are arrays for the vector features."""
+    values = df[key].to_numpy()
+    return np.stack(values) if len(values) and isinstance(values[0], np.ndarray) else values
+
+
+def dataset_bytes(root: Path) -> int:
+    """Size of the `data/` and `videos/` files of a dataset."""
+    return sum(f.stat().st_size for sub in ["data", "videos"] for f in (root / sub).rglob("*") if f.is_file())
+
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard link `dst` to `src`, or copy it across filesystems."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def transcode_video(
+    src_path: str,
+    outputs: list[tuple[str, list[int]]],
+    fps: int,
+    size: tuple[int, int] | None = None,
+) -> list[dict[str, np.ndarray]]:
+    """
+    Decode `src_path` once and write every `(dst_path, frame_indices)` of `outputs`: the new video is
+    made of the source frames `frame_indices` (non decreasing, repeated indices duplicate a frame),
+    resized to `size` (height, width) if given. Returns the image stats of every new video, computed
+    like `compute_episode_stats` on the frames as written.
+    """
+    containers, streams, positions, samples = [], [], [], []
+    for dst_path, frame_indices in outputs:
+        if len(frame_indices) == 0:
+            raise ValueError(f"No frame to write in {dst_path}.")
+        Path(dst_path).parent.mkdir(parents=True, exist_ok=True)
+        containers.append(av.open(str(dst_path), "w"))
+        streams.append(None)
+        positions.append(0)
+        samples.append((set(sample_indices(len(frame_indices))), []))
+
+    with av.open(str(src_path)) as src:
+        for src_index, frame in enumerate(src.decode(video=0)):
+            if all(positions[i] >= len(frame_indices) for i, (_, frame_indices) in enumerate(outputs)):
+                break
+            height, width = size if size is not None else (frame.height, frame.width)
+            frame = frame.reformat(width=width, height=height, format="rgb24", interpolation="AREA")
+            for i, (_, frame_indices) in enumerate(outputs):
+                while positions[i] < len(frame_indices) and frame_indices[positions[i]] == src_index:
+                    if streams[i] is None:
+                        streams[i] = add_video_stream(containers[i], fps, height, width)
+                    if positions[i] in samples[i][0]:
+                        samples[i][1].append(frame.to_ndarray())
+                    # Frame number in the new video, in the 1/fps time base of the new stream.
+                    frame.time_base = Fraction(1, fps)
+                    frame.pts = positions[i]
+                    containers[i].mux(streams[i].encode(frame))
+                    positions[i] += 1
+
+    all_stats = []
+    for i, (dst_path, frame_indices) in enumerate(outputs):
+        if positions[i] < len(frame_indices):
+            raise ValueError(f"{src_path} has no frame {frame_indices[positions[i]]} (needed for {dst_path}).")
+        containers[i].mux(streams[i].encode())
+        containers[i].close()
+        all_stats.append(image_stats(np.stack(samples[i][1])))
+    return all_stats
+
+
+def make_transcode_pool(num_workers: int) -> ProcessPoolExecutor:
+    # Spawned workers, as for `BackgroundEpisodeEncoder`: the encoder is not fork-safe once a thread has used it.
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class DerivedDatasetWriter:
+    """
+    Args:
+        root: directory of the new dataset, removed first if it exists.
+        info: `meta/info.json` of the source dataset. Its features may be edited before the first
+            episode (e.g. a new video shape), the totals and splits are rewritten by `finalize`.
+    """
+
+    def __init__(self, root: Path | str, info: dict):
+        self.root = Path(root)
+        if self.root.exists():
+            shutil.rmtree(self.root)
+        (self.root / "meta").mkdir(parents=True)
+        self.info = info
+        self.info["chunks_size"] = self.info.get("chunks_size", DEFAULT_CHUNK_SIZE)
+        self.features = info["features"]
+        self.video_keys = [key for key, ft in self.features.items() if ft["dtype"] == "video"]
+        self.tasks: dict[str, int] = {}
+        self.episodes: dict[int, dict] = {}
+        self.episodes_stats: dict[int, dict] = {}
+
+    def _format_path(self, template: str, ep_index: int, **kwargs) -> Path:
+        episode_chunk = ep_index // self.info["chunks_size"]
+        return self.root / template.format(episode_chunk=episode_chunk, episode_index=ep_index, **kwargs)
+
+    def data_path(self, ep_index: int) -> Path:
+        return self._format_path(self.info["data_path"], ep_index)
+
+    def video_path(self, ep_index: int, video_key: str) -> Path:
+        return self._format_path(self.info["video_path"], ep_index, video_key=video_key)
+
+    def add_task(self, task: str) -> int:
+        return self.tasks.setdefault(task, len(self.tasks))
+
+    def write_episode_data(
+        self, ep_index: int, df: pd.DataFrame, tasks: list[str], first_index: int, stats: dict | None = None
+    ):
+        """
+        Write `df` (source rows of any episode, in order) as episode `ep_index` whose first frame gets
+        the global `first_index`. The index columns are rewritten; `task_index` of the rows must
+        already refer to `self.tasks`. If the rows are those of a whole source episode, pass its
+        `stats`: only the stats of the index columns are computed then.
+        """
+        fps = self.info["fps"]
+        df = df.reset_index(drop=True)
+        df["episode_index"] = ep_index
+        df["frame_index"] = np.arange(len(df))
+        df["index"] = first_index + np.arange(len(df))
+        df["timestamp"] = (np.arange(len(df)) / fps).astype(np.float32)
+
+        path = self.data_path(ep_index)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(path, index=False)
+
+        keys = INDEX_KEYS if stats is not None else self.features
+        episode_data = {
+            key: column_array(df, key)
+            for key in keys
+            if self.features[key]["dtype"] not in ["image", "video", "string"] and key in df.columns
+        }
+        self.episodes[ep_index] = {"episode_index": ep_index, "tasks": tasks, "length": len(df)}
+        self.episodes_stats[ep_index] = {**(stats or {}), **compute_episode_stats(episode_data, self.features)}
+
+    def add_video_stats(self, ep_index: int, video_key: str, stats: dict[str, np.ndarray]):
+        self.episodes_stats[ep_index][video_key] = stats
+
+    def finalize(self):
+        """Write `meta/` once all the episodes and their videos are written."""
+        ep_indices = sorted(self.episodes)
+        if ep_indices != list(range(len(ep_indices))):
+            raise ValueError("Episodes must be numbered 0..N-1 without gaps.")
+        # Sorted by episode: `episode_data_index` follows the order of `episodes.jsonl`.
+        write_jsonlines([self.episodes[ep] for ep in ep_indices], self.root / "meta/episodes.jsonl")
+        write_jsonlines(
+            [{"episode_index": ep, "stats": serialize_dict(self.episodes_stats[ep])} for ep in ep_indices],
+            self.root / "meta/episodes_stats.jsonl",
+        )
+        write_jsonlines(
+            [{"task_index": task_index, "task": task} for task, task_index in self.tasks.items()],
+            self.root / "meta/tasks.jsonl",
+        )
+
+        num_episodes = len(ep_indices)
+        self.info["total_episodes"] = num_episodes
+        self.info["total_frames"] = sum(ep["length"] for ep in self.episodes.values())
+        self.info["total_tasks"] = len(self.tasks)
+        self.info["total_videos"] = num_episodes * len(self.video_keys)
+        self.info["total_chunks"] = -(-num_episodes // self.info["chunks_size"])
+        self.info["splits"] = {"train": f"0:{num_episodes}"}
+        for key in self.video_keys:
+            if num_episodes:
+                self.features[key]["info"] = get_video_info(self.video_path(0, key))
+        write_info(self.info, self.root)
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import numpy as np
+
+from lerobot.teleoperators import Teleoperator
+from lerobot.utils.robot_utils import busy_wait
+
+from robot.robots.piper.piper_follower import PIPERFollower
+
+
+class ArmStateBuffer:
+    """
+    Fixed-size ring buffer of timestamped arm samples (`time.perf_counter()` time, follower state and
+    the action sent), written by the arm loop and interpolated at camera timestamps by the recording loop.
+    """
+
+    def __init__(self, num_motors: int, capacity: int):
+        self.capacity = capacity
+        self.times = np.full(capacity, -np.inf)
+        self.states = np.zeros((capacity, num_motors))
+        self.actions = np.zeros((capacity, num_motors))
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def push(self, t: float, state: np.ndarray, action: np.ndarray):
+        with self._lock:
+            i = self.count % self.capacity
+            self.times[i] = t
+            self.states[i] = state
+            self.actions[i] = action
+            self.count += 1
+
+    def _ordered(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            n = min(self.count, self.capacity)
+            start = self.count - n
+            order = np.arange(start, self.count) % self.capacity
+            return self.times[order], self.states[order], self.actions[order]
+
+    def interpolate(self, t: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        State and action linearly interpolated at time `t`. Times outside of the buffered window are
+        clamped to the oldest / latest sample.
+        """
+        times, states, actions = self._ordered()
+        if len(times) == 0:
+            raise RuntimeError("No arm sample recorded yet.")
+        i = int(np.searchsorted(times, t))
+        if i == 0:
+            return states[0], actions[0]
+        if i == len(times):
+            return states[-1], actions[-1]
+        w = (t - times[i - 1]) / (times[i] - times[i - 1])
+        return (1 - w) * states[i - 1] + w * states[i], (1 - w) * actions[i - 1] + w * actions[i]
+
+    def latest(self) -> tuple[float, np.ndarray, np.ndarray]:
+        with self._lock:
+            i = (self.count - 1) % self.capacity
+            return self.times[i], self.states[i].copy(), self.actions[i].copy()
+
+
+class DualRateTeleop:
+    """
+    Arm loop running at `arm_hz` in a background thread, independent of the camera FPS: mirrors
+    `teleop.get_action()` to `robot.send_action()` (or only reads the follower when `teleop` is None)
+    and buffers every sample. The recording loop reads the cameras only and calls `sample` with the
+    capture time to get the arm state and action at that instant. An exception in the arm loop stops
+    it and is raised again by the next `sample`, so the recording does not go on with a frozen arm.
+    """
+
+    def __init__(self, robot: PIPERFollower, teleop: Teleoperator | None = None, arm_hz: float = 200, buffer_s: float = 2.0):
+        self.robot = robot
+        self.teleop = teleop
+        self.arm_hz = arm_hz
+        self.motor_keys = list(robot.action_features)
+        self.buffer = ArmStateBuffer(len(self.motor_keys), capacity=int(buffer_s * arm_hz))
+        self.overruns = 0
+        self.error: Exception | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        # Wait for the first sample so `sample` can be called right away.
+        while self.buffer.count == 0 and self._thread.is_alive():
+            time.sleep(1e-3)
+        self._check()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError("The arm loop stopped.") from self.error
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            self.error = e
+
+    def _loop(self):
+        period_s = 1 / self.arm_hz
+        next_t = time.perf_counter()
+        while not self._stop.is_set():
+            state = self.robot.get_arm_observation()
+            if self.teleop is not None:
+                action = self.teleop.get_action()
+                self.robot.send_action(action)
+            else:
+                action = state
+            self.buffer.push(
+                time.perf_counter(),
+                np.fromiter((state[k] for k in self.motor_keys), dtype=np.float64, count=len(self.motor_keys)),
+                np.fromiter((action[k] for k in self.motor_keys), dtype=np.float64, count=len(self.motor_keys)),
+            )
+
+            # Absolute schedule, a late tick does not shift the following ones.
+            next_t += period_s
+            remaining_s = next_t - time.perf_counter()
+            if remaining_s < 0:
+                self.overruns += 1
+                next_t = time.perf_counter()
+            busy_wait(remaining_s)
+
+    def sample(self, t: float) -> tuple[dict[str, float], dict[str, float]]:
+        """Follower state and sent action interpolated at time `t`, as `{"<motor>.pos": value}` dicts."""
+        self._check()
+        state, action = self.buffer.interpolate(t)
+        return (
+            {k: float(v) for k, v in zip(self.motor_keys, state)},
+            {k: float(v) for k, v in zip(self.motor_keys, action)},
+        )
+
+    def rate_hz(self) -> float:
+        """Measured arm loop rate over the buffered window."""
+        times, _, _ = self.buffer._ordered()
+        return (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 else 0.0
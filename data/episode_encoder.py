@@ -0,0 +1,297 @@
+"""Background video encoding of finished episodes while the next one is recording.
+
+`BackgroundEpisodeEncoder.save_episode` replaces `LeRobotDataset.save_episode` in the record loop:
+it hands the finished episode over and returns right away, with the dataset buffer already pointing
+at the next episode. The camera streams are encoded in a process pool (one task per camera), then a
+single commit thread writes the parquet table, the stats and the `meta/` entries of the episodes in
+order, once all of their videos exist. An episode is therefore either fully visible in `meta/` or
+not at all.
+
+Every handed-over episode is recorded in `meta/pending_episodes.json` together with its non-image
+columns (`meta/pending/episode_XXXXXX.npz`) until it is committed. After a crash, the PNG frames are
+still under `images/` and the pending episodes can be finished with:
+
+    python -m data.episode_encoder --repo_id test2/piper_test86
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from lerobot.datasets.compute_stats import compute_episode_stats
+from lerobot.datasets.lerobot_dataset import LeRobotDataset
+from lerobot.datasets.utils import write_info
+from lerobot.datasets.video_utils import encode_video_frames
+
+from data.image_writers import encode_raw_frames, is_raw_image_dir, raw_image_stats
+
+JOURNAL_PATH = "meta/pending_episodes.json"
+PENDING_DIR = "meta/pending"
+# Columns filled at commit time, from the committed metadata
+_COMMIT_KEYS = ["index", "episode_index", "task_index"]
+
+
+def _encode_camera(img_dir: str, video_path: str, fps: int, num_frames: int) -> float:
+    """Process pool task: encode one camera stream. Returns the encoding time in seconds."""
+    start = time.perf_counter()
+    video_path = Path(video_path)
+    # Encode next to the final file and rename it, so an interrupted encoding never looks complete.
+    tmp_path = video_path.with_name(f"{video_path.stem}.tmp{video_path.suffix}")
+    if is_raw_image_dir(img_dir):
+        encode_raw_frames(img_dir, tmp_path, fps, num_frames)
+    else:
+        encode_video_frames(img_dir, tmp_path, fps, overwrite=True)
+    os.replace(tmp_path, video_path)
+    return time.perf_counter() - start
+
+
+class BackgroundEpisodeEncoder:
+    """
+    Args:
+        dataset: dataset being recorded, created with `use_videos=True`.
+        num_workers: encoder processes, i.e. how many camera streams are encoded at the same time.
+            Defaults to the number of cameras.
+        max_pending_episodes: `save_episode` blocks while this many episodes are still being encoded,
+            which bounds the disk space taken by the PNG frames.
+    """
+
+    def __init__(self, dataset: LeRobotDataset, num_workers: int | None = None, max_pending_episodes: int = 2):
+        self.dataset = dataset
+        self.root = dataset.root
+        self.video_keys = dataset.meta.video_keys
+        self.encoder = ProcessPoolExecutor(
+            max_workers=num_workers or max(len(self.video_keys), 1),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.committer = ThreadPoolExecutor(max_workers=1)
+        self._slots = threading.BoundedSemaphore(max_pending_episodes)
+        self._lock = threading.Lock()
+        self.jobs: dict[int, dict] = {}
+        self.next_episode_index = max([dataset.meta.total_episodes, *[i + 1 for i in self._read_journal()]])
+
+    # ---- journal ----
+
+    def _read_journal(self) -> dict[int, dict]:
+        path = self.root / JOURNAL_PATH
+        if not path.is_file():
+            return {}
+        with open(path) as f:
+            return {entry["episode_index"]: entry for entry in json.load(f)}
+
+    def _write_journal(self, entries: dict[int, dict]):
+        path = self.root / JOURNAL_PATH
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump([entries[i] for i in sorted(entries)], f, indent=4)
+        os.replace(tmp_path, path)
+
+    def _journal_add(self, episode_index: int, length: int):
+        with self._lock:
+            entries = self._read_journal()
+            entries[episode_index] = {"episode_index": episode_index, "length": length, "queued_at": time.time()}
+            self._write_journal(entries)
+
+    def _journal_remove(self, episode_index: int):
+        with self._lock:
+            entries = self._read_journal()
+            entries.pop(episode_index, None)
+            self._write_journal(entries)
+        (self.root / PENDING_DIR / f"episode_{episode_index:06d}.npz").unlink(missing_ok=True)
+
+    # ---- recording side ----
+
+    def save_episode(self):
+        """Hand the current episode buffer over to the background encoder and start a new buffer."""
+        dataset = self.dataset
+        episode_buffer = dataset.episode_buffer
+        if episode_buffer is None or episode_buffer["size"] == 0:
+            raise ValueError("You must add one or several frames with `add_frame` before calling `save_episode`.")
+        episode_index = episode_buffer["episode_index"]
+
+        self._slots.acquire()
+        # Only the frames still queued in the image writer, not the whole episode.
+        dataset._wait_image_writer()
+
+        tasks = episode_buffer["task"]
+        arrays = {
+            key: np.stack(episode_buffer[key])
+            for key, ft in dataset.features.items()
+            if key not in _COMMIT_KEYS and ft["dtype"] not in ["image", "video"]
+        }
+        pending_dir = self.root / PENDING_DIR
+        pending_dir.mkdir(parents=True, exist_ok=True)
+        np.savez(pending_dir / f"episode_{episode_index:06d}.npz", task=np.array(tasks), **arrays)
+        self._journal_add(episode_index, len(tasks))
+
+        self.next_episode_index = episode_index + 1
+        dataset.episode_buffer = dataset.create_episode_buffer(episode_index=self.next_episode_index)
+        self._submit(episode_index, arrays, tasks)
+
+    def clear_episode_buffer(self):
+        """Same as `LeRobotDataset.clear_episode_buffer`, keeping the episode index past the pending episodes."""
+        dataset = self.dataset
+        dataset._wait_image_writer()
+        for key in dataset.meta.camera_keys:
+            img_dir = self._img_dir(dataset.episode_buffer["episode_index"], key)
+            if img_dir.is_dir():
+                shutil.rmtree(img_dir)
+        dataset.episode_buffer = dataset.create_episode_buffer(episode_index=self.next_episode_index)
+
+    def _img_dir(self, episode_index: int, key: str) -> Path:
+        return self.dataset._get_image_file_path(episode_index=episode_index, image_key=key, frame_index=0).parent
+
+    def _submit(self, episode_index: int, arrays: dict, tasks: list[str]):
+        with self._lock:
+            self.jobs[episode_index] = {
+                "length": len(tasks),
+                "cameras_done": 0,
+                "cameras_total": 0,
+                "state": "encoding",
+                "queued_t": time.perf_counter(),
+                "done_t": None,
+            }
+        futures = []
+        for key in self.video_keys:
+            video_path = self.root / self.dataset.meta.get_video_file_path(episode_index, key)
+            if video_path.is_file():
+                # Already encoded before a crash.
+                continue
+            video_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                self.jobs[episode_index]["cameras_total"] += 1
+            future = self.encoder.submit(
+                _encode_camera, str(self._img_dir(episode_index, key)), str(video_path), self.dataset.fps, len(tasks)
+            )
+            future.add_done_callback(lambda _, i=episode_index: self._camera_done(i))
+            futures.append(future)
+        self.committer.submit(self._commit, episode_index, arrays, tasks, futures)
+
+    def _camera_done(self, episode_index: int):
+        with self._lock:
+            self.jobs[episode_index]["cameras_done"] += 1
+
+    # ---- commit side ----
+
+    def _commit(self, episode_index: int, arrays: dict, tasks: list[str], futures: list[Future]):
+        try:
+            for future in futures:
+                future.result()
+            self._set_state(episode_index, "committing")
+            self._commit_metadata(episode_index, arrays, tasks)
+            self._journal_remove(episode_index)
+            self._set_state(episode_index, "done")
+        except Exception:
+            # The episode stays in the journal and can be finished with `recover`.
+            logging.exception(f"Saving episode {episode_index} failed")
+            self._set_state(episode_index, "failed")
+        finally:
+            self._slots.release()
+
+    def _set_state(self, episode_index: int, state: str):
+        with self._lock:
+            job = self.jobs[episode_index]
+            job["state"] = state
+            if state in ["done", "failed"]:
+                job["done_t"] = time.perf_counter()
+
+    def _commit_metadata(self, episode_index: int, arrays: dict, tasks: list[str]):
+        """The metadata part of `LeRobotDataset.save_episode`, run once the videos are encoded."""
+        dataset = self.dataset
+        meta = dataset.meta
+        if episode_index != meta.total_episodes:
+            raise RuntimeError(f"Episode {episode_index} committed out of order ({meta.total_episodes} episodes saved).")
+
+        length = len(tasks)
+        episode_buffer = dict(arrays)
+        episode_buffer["index"] = np.arange(meta.total_frames, meta.total_frames + length)
+        episode_buffer["episode_index"] = np.full((length,), episode_index)
+        episode_tasks = list(set(tasks))
+        for task in episode_tasks:
+            if meta.get_task_index(task) is None:
+                meta.add_task(task)
+        episode_buffer["task_index"] = np.array([meta.get_task_index(task) for task in tasks])
+        # Stats sample the PNG frames, which are removed only after the commit.
+        raw_keys = [key for key in meta.camera_keys if is_raw_image_dir(self._img_dir(episode_index, key))]
+        for key in meta.camera_keys:
+            if key not in raw_keys:
+                episode_buffer[key] = [
+                    str(dataset._get_image_file_path(episode_index=episode_index, image_key=key, frame_index=i))
+                    for i in range(length)
+                ]
+
+        dataset._save_episode_table(episode_buffer, episode_index)
+        ep_stats = compute_episode_stats(episode_buffer, dataset.features)
+        for key in raw_keys:
+            ep_stats[key] = raw_image_stats(self._img_dir(episode_index, key), length)
+        meta.save_episode(episode_index, length, episode_tasks, ep_stats)
+        if episode_index == 0 and len(self.video_keys) > 0:
+            meta.update_video_info()
+            write_info(meta.info, meta.root)
+
+        for key in self.video_keys:
+            shutil.rmtree(self._img_dir(episode_index, key), ignore_errors=True)
+
+    # ---- recovery and status ----
+
+    def recover(self):
+        """Resubmit the episodes left in the journal by a previous run."""
+        committed = self.dataset.meta.total_episodes
+        for episode_index in sorted(self._read_journal()):
+            if episode_index < committed:
+                # Committed right before the crash, only the journal entry is left.
+                self._journal_remove(episode_index)
+                continue
+            logging.info(f"Recovering pending episode {episode_index}")
+            with np.load(self.root / PENDING_DIR / f"episode_{episode_index:06d}.npz") as data:
+                tasks = data["task"].tolist()
+                arrays = {key: data[key] for key in data.files if key != "task"}
+            self._slots.acquire()
+            self._submit(episode_index, arrays, tasks)
+
+    def status(self) -> str:
+        now = time.perf_counter()
+        lines = []
+        with self._lock:
+            for episode_index, job in sorted(self.jobs.items()):
+                elapsed_s = (job["done_t"] or now) - job["queued_t"]
+                lines.append(
+                    f"episode {episode_index}: {job['state']} "
+                    f"({job['cameras_done']}/{job['cameras_total']} cameras, {job['length']} frames, {elapsed_s:.0f}s)"
+                )
+        return "\n".join(lines) if lines else "no episode queued"
+
+    def num_pending(self) -> int:
+        with self._lock:
+            return sum(job["state"] in ["encoding", "committing"] for job in self.jobs.values())
+
+    def wait(self):
+        """Block until every queued episode is committed."""
+        self.committer.submit(lambda: None).result()
+
+    def close(self):
+        self.wait()
+        self.committer.shutdown()
+        self.encoder.shutdown()
+        print(self.status())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repo_id", type=str, help="Dataset with pending episodes.", required=True)
+    parser.add_argument("--root", type=str, help="Local dataset directory.", default=None)
+    parser.add_argument("--num_workers", type=int, help="Encoder processes.", default=None)
+    args = parser.parse_args()
+
+    dataset = LeRobotDataset(args.repo_id, root=args.root)
+    encoder = BackgroundEpisodeEncoder(dataset, num_workers=args.num_workers)
+    encoder.recover()
+    encoder.close()
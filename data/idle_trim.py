@@ -0,0 +1,220 @@
+"""Detection and removal of the idle segments of the recorded episodes.
+
+Episodes start and end with the arm at rest while the operator gets ready, and often pause in the
+middle. These frames teach the policy to stand still. The speed of every frame is the largest
+joint or gripper speed of `observation.state` and `action` (0.001°/s, 0.001 mm/s); a frame becomes
+active above `--high_speed` and idle again below `--low_speed` (hysteresis, so that the noise around a
+single threshold does not chop the episode). Idle runs shorter than `--min_idle_s` are kept, and
+`--margin_s` of rest is kept next to the motion on both sides of a removed run. Everything is
+vectorized over all the frames of the dataset at once.
+
+With `--write_mask`, the dataset is left as is and a boolean mask over the `index` column is written
+to `meta/idle_mask.npy`, False for the idle frames. Train without them with
+`python -m train.train_dp ... --frame_mask <dataset>/meta/idle_mask.npy`:
+
+    python -m data.idle_trim --dataset_path test2/piper_test86 --write_mask
+
+With `--output_path`, a trimmed copy is written instead: the idle frames are removed from the tables
+and the videos, the rest of every episode is re-indexed (`frame_index`, `timestamp`, `index`, the
+capture timestamps) and its stats recomputed. The arm is at rest on both sides of a removed run, so
+the remaining frames of an episode are concatenated; episodes left without frames are dropped.
+Episodes without idle frames are hard-linked, the others are re-encoded in a process pool:
+
+    python -m data.idle_trim --dataset_path test2/piper_test86 --output_path /data/piper_test86_trimmed
+"""
+
+import argparse
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+from lerobot.datasets.lerobot_dataset import LeRobotDatasetMetadata
+
+from data.derived_dataset import (
+    DerivedDatasetWriter,
+    dataset_bytes,
+    link_or_copy,
+    make_transcode_pool,
+    transcode_video,
+)
+from data.timestamp_check import CAPTURE_TIMESTAMP_PREFIX
+
+IDLE_MASK_PATH = "meta/idle_mask.npy"
+MOTION_PREFIXES = ("joint_", "gripper")
+MOTION_KEYS = ["observation.state", "action"]
+
+
+def load_motion(meta: LeRobotDatasetMetadata) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`index`, `episode_index` and the `(N, D)` joint and gripper dims of state and action, sorted by `index`."""
+    columns = {
+        key: [i for i, name in enumerate(meta.features[key]["names"]) if name.startswith(MOTION_PREFIXES)]
+        for key in MOTION_KEYS
+    }
+    index, episode_index, motion = [], [], []
+    for ep_idx in range(meta.total_episodes):
+        df = pd.read_parquet(meta.root / meta.get_data_file_path(ep_idx), columns=["index", "episode_index", *MOTION_KEYS])
+        index.append(df["index"].to_numpy())
+        episode_index.append(df["episode_index"].to_numpy())
+        motion.append(np.concatenate([np.stack(df[key].to_numpy())[:, dims] for key, dims in columns.items()], axis=1))
+    index, episode_index, motion = np.concatenate(index), np.concatenate(episode_index), np.concatenate(motion)
+    order = np.argsort(index, kind="stable")
+    return index[order], episode_index[order], motion[order].astype(np.float64)
+
+
+def episode_starts(episode_index: np.ndarray) -> np.ndarray:
+    starts = np.ones(len(episode_index), dtype=bool)
+    starts[1:] = episode_index[1:] != episode_index[:-1]
+    return starts
+
+
+def motion_speed(motion: np.ndarray, episode_index: np.ndarray, fps: int) -> np.ndarray:
+    """Largest speed over the dims between every frame and the previous one (the next one for the first frame)."""
+    speed = np.zeros(len(motion))
+    speed[1:] = np.abs(np.diff(motion, axis=0)).max(axis=1) * fps
+    starts = np.flatnonzero(episode_starts(episode_index))
+    # No previous frame in the episode: same speed as the second frame (0 for one-frame episodes).
+    second = np.minimum(starts + 1, len(motion) - 1)
+    speed[starts] = np.where(episode_index[second] == episode_index[starts], speed[second], 0.0)
+    return speed
+
+
+def hysteresis(speed: np.ndarray, episode_index: np.ndarray, low: float, high: float) -> np.ndarray:
+    """
+    Active mask: a frame is active from the first one above `high` until the first one below `low`.
+    Every episode starts idle unless its first frame is above `high`.
+    """
+    mark = np.zeros(len(speed), dtype=np.int8)
+    mark[speed > high] = 1
+    mark[speed < low] = -1
+    starts = episode_starts(episode_index)
+    mark[starts & (mark == 0)] = -1
+    # Forward fill the last decided frame; every episode start is decided, so it never leaks across episodes.
+    last = np.maximum.accumulate(np.where(mark != 0, np.arange(len(mark)), 0))
+    return mark[last] > 0
+
+
+def idle_frames(
+    active: np.ndarray, episode_index: np.ndarray, fps: int, min_idle_s: float, margin_s: float
+) -> np.ndarray:
+    """Mask of the frames to remove: the idle runs of at least `min_idle_s`, minus `margin_s` next to the motion."""
+    n = len(active)
+    run_starts = episode_starts(episode_index)
+    run_starts[1:] |= active[1:] != active[:-1]
+    starts = np.flatnonzero(run_starts)
+    ends = np.append(starts[1:], n)
+    run_episode = episode_index[starts]
+    removed_runs = ~active[starts] & (ends - starts >= int(np.ceil(min_idle_s * fps)))
+
+    # Runs alternate within an episode, so a neighbour run in the same episode is an active one.
+    margin = int(np.ceil(margin_s * fps))
+    has_prev = np.append(False, run_episode[1:] == run_episode[:-1])
+    has_next = np.append(run_episode[1:] == run_episode[:-1], False)
+    remove_start = starts + margin * has_prev
+    remove_end = ends - margin * has_next
+    keep = removed_runs & (remove_end > remove_start)
+
+    bounds = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(bounds, remove_start[keep], 1)
+    np.add.at(bounds, remove_end[keep], -1)
+    return np.cumsum(bounds)[:n] > 0
+
+
+def episode_bytes(meta: LeRobotDatasetMetadata, ep_idx: int) -> int:
+    paths = [meta.get_data_file_path(ep_idx)] + [meta.get_video_file_path(ep_idx, key) for key in meta.video_keys]
+    return sum((meta.root / path).stat().st_size for path in paths)
+
+
+def write_trimmed(
+    meta: LeRobotDatasetMetadata, removed: np.ndarray, index: np.ndarray, output_path: str, num_workers: int
+) -> DerivedDatasetWriter:
+    """Copy of the dataset without the `removed` frames (mask aligned with `index`), see the module docstring."""
+    removed_index = set(index[removed].tolist())
+    writer = DerivedDatasetWriter(output_path, copy.deepcopy(meta.info))
+    # Same tasks, same task indices.
+    for task_index in sorted(meta.tasks):
+        writer.add_task(meta.tasks[task_index])
+    capture_keys = [key for key in meta.features if key.startswith(CAPTURE_TIMESTAMP_PREFIX)]
+
+    pool = make_transcode_pool(num_workers)
+    futures = {}
+    new_ep, first_index = 0, 0
+    for ep_idx in range(meta.total_episodes):
+        df = pd.read_parquet(meta.root / meta.get_data_file_path(ep_idx))
+        kept = ~df["index"].isin(removed_index).to_numpy()
+        if not kept.any():
+            continue
+        old_timestamp = df["timestamp"].to_numpy(dtype=np.float64)
+        df = df[kept].reset_index(drop=True)
+        # The capture timestamps follow the nominal ones across the removed frames.
+        shift = old_timestamp[kept] - np.arange(len(df)) / meta.fps
+        for key in capture_keys:
+            df[key] = [t - s for t, s in zip(df[key].to_numpy(), shift, strict=True)]
+        writer.write_episode_data(new_ep, df, meta.episodes[ep_idx]["tasks"], first_index)
+
+        for key in meta.video_keys:
+            src = meta.root / meta.get_video_file_path(ep_idx, key)
+            if kept.all():
+                link_or_copy(src, writer.video_path(new_ep, key))
+                writer.add_video_stats(new_ep, key, meta.episodes_stats[ep_idx][key])
+            else:
+                outputs = [(str(writer.video_path(new_ep, key)), np.flatnonzero(kept).tolist())]
+                futures[(new_ep, key)] = pool.submit(transcode_video, str(src), outputs, meta.fps)
+        new_ep += 1
+        first_index += len(df)
+
+    for (ep, key), future in futures.items():
+        writer.add_video_stats(ep, key, future.result()[0])
+    pool.shutdown()
+    writer.finalize()
+    return writer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_path", type=str, help="Path to the dataset.", required=True)
+    parser.add_argument("--low_speed", type=float, help="Idle below this speed (0.001°/s, 0.001 mm/s).", default=1000)
+    parser.add_argument("--high_speed", type=float, help="Active above this speed (0.001°/s, 0.001 mm/s).", default=3000)
+    parser.add_argument("--min_idle_s", type=float, help="Remove idle runs at least this long.", default=1.0)
+    parser.add_argument("--margin_s", type=float, help="Keep this much rest next to the motion.", default=0.3)
+    parser.add_argument("--write_mask", action="store_true", help=f"Write the frame mask to {IDLE_MASK_PATH}.")
+    parser.add_argument("--output_path", type=str, help="Write a trimmed copy of the dataset there.", default=None)
+    parser.add_argument("--num_workers", type=int, help="Video re-encoding processes.", default=os.cpu_count())
+    args = parser.parse_args()
+    if not args.write_mask and args.output_path is None:
+        parser.error("Nothing to do, pass --write_mask and/or --output_path.")
+
+    meta = LeRobotDatasetMetadata(args.dataset_path)
+    index, episode_index, motion = load_motion(meta)
+    active = hysteresis(motion_speed(motion, episode_index, meta.fps), episode_index, args.low_speed, args.high_speed)
+    removed = idle_frames(active, episode_index, meta.fps, args.min_idle_s, args.margin_s)
+
+    frames = pd.DataFrame({"frames": 1, "active": active, "removed": removed}).groupby(episode_index).sum()
+    print(frames.to_string())
+    print(
+        f"\n{len(index)} frames, {int(active.sum())} active: {int(removed.sum())} frames removed "
+        f"({removed.mean():.1%}, {removed.sum() / meta.fps:.1f}s), {int((frames['removed'] == frames['frames']).sum())} "
+        f"episodes entirely idle"
+    )
+
+    if args.write_mask:
+        frame_mask = np.ones(index.max() + 1, dtype=bool)
+        frame_mask[index] = ~removed
+        np.save(meta.root / IDLE_MASK_PATH, frame_mask)
+        # The frames stay on disk, estimated share of the bytes they take.
+        ep_bytes = np.array([episode_bytes(meta, ep) for ep in frames.index])
+        removed_bytes = (ep_bytes * frames["removed"].to_numpy() / frames["frames"].to_numpy()).sum()
+        print(
+            f"Mask written to {meta.root / IDLE_MASK_PATH}, the masked frames take about {removed_bytes / 1e6:.1f}MB "
+            f"of {ep_bytes.sum() / 1e6:.1f}MB"
+        )
+
+    if args.output_path is not None:
+        writer = write_trimmed(meta, removed, index, args.output_path, args.num_workers)
+        src_bytes, dst_bytes = dataset_bytes(meta.root), dataset_bytes(writer.root)
+        print(
+            f"Trimmed dataset written to {writer.root}: {writer.info['total_episodes']} episodes, "
+            f"{writer.info['total_frames']} frames | {(src_bytes - dst_bytes) / 1e6:.1f}MB removed "
+            f"({src_bytes / 1e6:.1f}MB -> {dst_bytes / 1e6:.1f}MB)"
+        )
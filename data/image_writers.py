@@ -0,0 +1,330 @@
+"""Image writer backends for the frames written by `LeRobotDataset.add_frame` before video encoding.
+
+All the backends expose the `AsyncImageWriter` interface used by the dataset (`save_image`,
+`wait_until_done`, `stop`) and replace it with `dataset.image_writer = make_image_writer(...)`:
+
+- "png":      PIL PNG at the default compression level, the `AsyncImageWriter` behaviour.
+- "png_fast": PNG at `compress_level=1`, several times cheaper to write for slightly larger files.
+              Still plain PNG files, so every downstream tool keeps working.
+- "raw":      uncompressed uint8 frames appended to memory-mapped chunk files, one directory per
+              camera and episode. No encoding cost at all; the chunks are streamed straight into the
+              video encoder by `encode_raw_frames` (requires `BackgroundEpisodeEncoder`).
+
+Compare the backends on this machine with:
+
+    python -m data.image_writers --height 480 --width 640 --num_frames 300
+"""
+
+import argparse
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import av
+import numpy as np
+import PIL.Image
+import torch
+
+from lerobot.datasets.compute_stats import auto_downsample_height_width, get_feature_stats, sample_indices
+from lerobot.datasets.image_writer import AsyncImageWriter, image_array_to_pil_image
+
+IMAGE_WRITER_BACKENDS = ["png", "png_fast", "raw"]
+RAW_INFO_FILE = "frames.json"
+RAW_CHUNK_FILE = "chunk_{chunk_index:04d}.u8"
+
+
+class ThreadedImageWriter(ABC):
+    """Thread pool draining a queue of `(image, fpath)`, subclasses implement `write`."""
+
+    def __init__(self, num_threads: int = 4):
+        if num_threads <= 0:
+            raise ValueError("Number of threads must be greater than zero.")
+        self.num_threads = num_threads
+        self.queue = queue.Queue()
+        self.threads = [threading.Thread(target=self._loop, daemon=True) for _ in range(num_threads)]
+        for t in self.threads:
+            t.start()
+        self._stopped = False
+
+    def _loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            image, fpath = item
+            try:
+                self.write(image, Path(fpath))
+            except Exception as e:
+                print(f"Error writing image {fpath}: {e}")
+            self.queue.task_done()
+
+    @abstractmethod
+    def write(self, image: np.ndarray, fpath: Path):
+        """Write one frame, called from the pool threads."""
+
+    def save_image(self, image: torch.Tensor | np.ndarray | PIL.Image.Image, fpath: Path):
+        if isinstance(image, torch.Tensor):
+            image = image.cpu().numpy()
+        self.queue.put((image, fpath))
+
+    def wait_until_done(self):
+        self.queue.join()
+
+    def stop(self):
+        if self._stopped:
+            return
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self._stopped = True
+
+
+class PNGImageWriter(ThreadedImageWriter):
+    def __init__(self, num_threads: int = 4, compress_level: int = 1):
+        super().__init__(num_threads)
+        self.compress_level = compress_level
+
+    def write(self, image: np.ndarray | PIL.Image.Image, fpath: Path):
+        img = image if isinstance(image, PIL.Image.Image) else image_array_to_pil_image(image)
+        img.save(fpath, compress_level=self.compress_level)
+
+
+class RawImageWriter(ThreadedImageWriter):
+    """
+    Writes the frame `fpath` (`.../episode_XXXXXX/frame_YYYYYY.png`, as generated by the dataset)
+    at offset `YYYYYY` of the uint8 chunk files of its directory, `chunk_frames` frames per file.
+    The frame shape is stored in `frames.json` next to the chunks.
+    """
+
+    def __init__(self, num_threads: int = 4, chunk_frames: int = 300):
+        super().__init__(num_threads)
+        self.chunk_frames = chunk_frames
+        self._chunks: dict[tuple[Path, int], np.memmap] = {}
+        self._lock = threading.Lock()
+
+    def _chunk(self, img_dir: Path, chunk_index: int, shape: tuple) -> np.memmap:
+        key = (img_dir, chunk_index)
+        with self._lock:
+            if key not in self._chunks:
+                if chunk_index == 0:
+                    info = {"shape": list(shape), "chunk_frames": self.chunk_frames}
+                    with open(img_dir / RAW_INFO_FILE, "w") as f:
+                        json.dump(info, f)
+                path = img_dir / RAW_CHUNK_FILE.format(chunk_index=chunk_index)
+                self._chunks[key] = np.memmap(
+                    path,
+                    dtype=np.uint8,
+                    mode="r+" if path.is_file() else "w+",
+                    shape=(self.chunk_frames, *shape),
+                )
+            return self._chunks[key]
+
+    def write(self, image: np.ndarray | PIL.Image.Image, fpath: Path):
+        image = np.asarray(image)
+        if image.shape[0] == 3:
+            image = image.transpose(1, 2, 0)
+        if image.dtype != np.uint8:
+            image = (image * 255).astype(np.uint8)
+        frame_index = int(fpath.stem.split("_")[-1])
+        chunk_index, offset = divmod(frame_index, self.chunk_frames)
+        self._chunk(fpath.parent, chunk_index, image.shape)[offset] = image
+
+    def wait_until_done(self):
+        super().wait_until_done()
+        # Every queued frame is written, the chunks of the finished episodes can be released.
+        with self._lock:
+            for chunk in self._chunks.values():
+                chunk.flush()
+            self._chunks.clear()
+
+
+def make_image_writer(backend: str, num_threads: int = 4):
+    if backend == "png":
+        return AsyncImageWriter(num_processes=0, num_threads=num_threads)
+    if backend == "png_fast":
+        return PNGImageWriter(num_threads=num_threads, compress_level=1)
+    if backend == "raw":
+        return RawImageWriter(num_threads=num_threads)
+    raise ValueError(f"Unknown image writer backend: {backend}. Available: {IMAGE_WRITER_BACKENDS}")
+
+
+# ---- reading the raw chunks ----
+
+
+def is_raw_image_dir(img_dir: Path | str) -> bool:
+    return (Path(img_dir) / RAW_INFO_FILE).is_file()
+
+
+def iter_raw_frames(img_dir: Path | str, num_frames: int):
+    """Yield the `(H, W, C)` frames of a raw image directory in order, one chunk mapped at a time."""
+    img_dir = Path(img_dir)
+    with open(img_dir / RAW_INFO_FILE) as f:
+        info = json.load(f)
+    shape, chunk_frames = tuple(info["shape"]), info["chunk_frames"]
+    for chunk_index in range(-(-num_frames // chunk_frames)):
+        chunk = np.memmap(
+            img_dir / RAW_CHUNK_FILE.format(chunk_index=chunk_index),
+            dtype=np.uint8,
+            mode="r",
+            shape=(chunk_frames, *shape),
+        )
+        yield from chunk[: num_frames - chunk_index * chunk_frames]
+
+
+def read_raw_frames(img_dir: Path | str, indices: list[int]) -> np.ndarray:
+    img_dir = Path(img_dir)
+    with open(img_dir / RAW_INFO_FILE) as f:
+        info = json.load(f)
+    shape, chunk_frames = tuple(info["shape"]), info["chunk_frames"]
+    frames = np.empty((len(indices), *shape), dtype=np.uint8)
+    for i, frame_index in enumerate(indices):
+        chunk_index, offset = divmod(frame_index, chunk_frames)
+        chunk = np.memmap(
+            img_dir / RAW_CHUNK_FILE.format(chunk_index=chunk_index),
+            dtype=np.uint8,
+            mode="r",
+            shape=(chunk_frames, *shape),
+        )
+        frames[i] = chunk[offset]
+    return frames
+
+
+def image_stats(frames: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Image branch of `compute_episode_stats` on `(N, H, W, C)` uint8 frames already sampled with
+    `sample_indices`: every frame is downsampled on its own, as `sample_images` does.
+    """
+    images = np.stack([auto_downsample_height_width(frame.transpose(2, 0, 1)) for frame in frames])
+    stats = get_feature_stats(images, axis=(0, 2, 3), keepdims=True)
+    return {k: v if k == "count" else np.squeeze(v / 255.0, axis=0) for k, v in stats.items()}
+
+
+def raw_image_stats(img_dir: Path | str, num_frames: int) -> dict[str, np.ndarray]:
+    """Same as the image branch of `compute_episode_stats`, reading the raw chunks instead of PNG files."""
+    return image_stats(read_raw_frames(img_dir, sample_indices(num_frames)))
+
+
+def add_video_stream(
+    output: av.container.OutputContainer,
+    fps: int,
+    height: int,
+    width: int,
+    vcodec: str = "libsvtav1",
+    pix_fmt: str = "yuv420p",
+    g: int | None = 2,
+    crf: int | None = 30,
+) -> av.video.stream.VideoStream:
+    """Video stream of `output` encoded like `encode_video_frames`."""
+    video_options = {}
+    if g is not None:
+        video_options["g"] = str(g)
+    if crf is not None:
+        video_options["crf"] = str(crf)
+    output_stream = output.add_stream(vcodec, fps, options=video_options)
+    output_stream.pix_fmt = pix_fmt
+    output_stream.width = width
+    output_stream.height = height
+    return output_stream
+
+
+def encode_raw_frames(
+    img_dir: Path | str,
+    video_path: Path | str,
+    fps: int,
+    num_frames: int,
+    vcodec: str = "libsvtav1",
+    pix_fmt: str = "yuv420p",
+    g: int | None = 2,
+    crf: int | None = 30,
+):
+    """`encode_video_frames` with the same defaults, fed from the raw chunks instead of PNG files."""
+    with open(Path(img_dir) / RAW_INFO_FILE) as f:
+        height, width, _ = json.load(f)["shape"]
+    with av.open(str(video_path), "w") as output:
+        output_stream = add_video_stream(output, fps, height, width, vcodec, pix_fmt, g, crf)
+        for frame in iter_raw_frames(img_dir, num_frames):
+            output.mux(output_stream.encode(av.VideoFrame.from_ndarray(frame, format="rgb24")))
+        output.mux(output_stream.encode())
+
+
+# ---- tuning and benchmark ----
+
+
+def make_test_frames(height: int, width: int, num_distinct: int = 8, seed: int = 0) -> list[np.ndarray]:
+    """Smooth images with sensor-like noise, compressible like camera frames (pure noise is not)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    frames = []
+    for _ in range(num_distinct):
+        fx, fy, phase = rng.uniform(0.005, 0.03, size=2).tolist() + [rng.uniform(0, 2 * np.pi)]
+        base = 127 + 100 * np.sin(fx * x + phase)[..., None] * np.cos(fy * y)[..., None] * np.array([1.0, 0.8, 0.6])
+        frames.append(np.clip(base + rng.normal(0, 4, size=(height, width, 3)), 0, 255).astype(np.uint8))
+    return frames
+
+
+def measure_writer(backend: str, num_threads: int, frames: list[np.ndarray], num_frames: int, root: Path) -> dict:
+    """Frames/sec and bytes/frame of `backend` writing `num_frames` frames into `root`."""
+    img_dir = root / f"{backend}_{num_threads}" / "episode_000000"
+    img_dir.mkdir(parents=True)
+    writer = make_image_writer(backend, num_threads)
+    start = time.perf_counter()
+    for i in range(num_frames):
+        writer.save_image(frames[i % len(frames)], img_dir / f"frame_{i:06d}.png")
+    writer.wait_until_done()
+    elapsed_s = time.perf_counter() - start
+    writer.stop()
+    num_bytes = sum(f.stat().st_size for f in img_dir.iterdir())
+    shutil.rmtree(img_dir)
+    return {"fps": num_frames / elapsed_s, "bytes_per_frame": num_bytes / num_frames}
+
+
+def autotune_num_threads(
+    backend: str, height: int, width: int, target_fps: float, max_threads: int = 16, num_frames: int = 120, margin: float = 1.5
+) -> int:
+    """
+    Smallest power-of-two thread count whose measured throughput is at least `margin * target_fps`
+    (e.g. FPS times the number of cameras), or the fastest one if none reaches it.
+    """
+    frames = make_test_frames(height, width)
+    best_threads, best_fps = 1, 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        num_threads = 1
+        while num_threads <= max_threads:
+            fps = measure_writer(backend, num_threads, frames, num_frames, Path(tmp))["fps"]
+            if fps >= margin * target_fps:
+                return num_threads
+            if fps > best_fps:
+                best_threads, best_fps = num_threads, fps
+            num_threads *= 2
+    return best_threads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--num_frames", type=int, help="Frames written per measurement.", default=300)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 12])
+    parser.add_argument("--backends", type=str, nargs="+", default=IMAGE_WRITER_BACKENDS)
+    parser.add_argument("--root", type=str, help="Directory on the disk used for recording.", default=None)
+    args = parser.parse_args()
+
+    frames = make_test_frames(args.height, args.width)
+    root = Path(tempfile.mkdtemp(dir=args.root))
+    try:
+        print(f"{'BACKEND':<10} | {'THREADS':>7} | {'FRAMES/S':>9} | {'KB/FRAME':>9}")
+        for backend in args.backends:
+            for num_threads in args.threads:
+                result = measure_writer(backend, num_threads, frames, args.num_frames, root)
+                print(
+                    f"{backend:<10} | {num_threads:>7} | {result['fps']:>9.1f} | {result['bytes_per_frame'] / 1024:>9.1f}"
+                )
+    finally:
+        shutil.rmtree(root)
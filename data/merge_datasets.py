@@ -0,0 +1,74 @@
+"""Merge of several recorded datasets of the same robot into a new one.
+
+The episodes are numbered in the order of `--dataset_paths`, their frames get consecutive `index`
+values and the `task_index` of every frame is remapped to the union of the task tables, exactly as
+`train.multi_dataset.MultiDataset` numbers them without copying anything. The per-episode stats of
+the sources are reused (only the index columns are recomputed), so the merged stats are the same
+aggregation as for the sources, without reading the frames again. Videos are hard-linked when the
+datasets are on the same filesystem and copied otherwise; episodes are written by a thread pool.
+
+    python -m data.merge_datasets --dataset_paths test2/piper_test81 test2/piper_test86 \\
+        --output_path /data/piper_test81_86
+"""
+
+import argparse
+import copy
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from data.derived_dataset import DerivedDatasetWriter, dataset_bytes, link_or_copy
+from train.multi_dataset import MultiDatasetMetadata
+
+
+def _merge_episode(writer: DerivedDatasetWriter, multi_meta: MultiDatasetMetadata, i: int, ep_idx: int) -> int:
+    """Write episode `ep_idx` of dataset `i` at its merged position. Returns its number of frames."""
+    meta = multi_meta.metas[i]
+    new_ep = multi_meta.episode_offsets[i] + ep_idx
+    df = pd.read_parquet(meta.root / meta.get_data_file_path(ep_idx))
+    df["task_index"] = df["task_index"].map(multi_meta.task_maps[i])
+    # Frames of the previous episodes of this dataset, the sources are numbered the same way.
+    first_index = multi_meta.frame_offsets[i] + int(df["index"].iloc[0])
+    writer.write_episode_data(new_ep, df, meta.episodes[ep_idx]["tasks"], first_index, meta.episodes_stats[ep_idx])
+    for key in meta.video_keys:
+        link_or_copy(meta.root / meta.get_video_file_path(ep_idx, key), writer.video_path(new_ep, key))
+    return len(df)
+
+
+def merge_datasets(multi_meta: MultiDatasetMetadata, output_path: str, num_workers: int) -> DerivedDatasetWriter:
+    writer = DerivedDatasetWriter(output_path, copy.deepcopy(multi_meta.metas[0].info))
+    for task_index in sorted(multi_meta.tasks):
+        writer.add_task(multi_meta.tasks[task_index])
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        futures = [
+            pool.submit(_merge_episode, writer, multi_meta, i, ep_idx)
+            for i, meta in enumerate(multi_meta.metas)
+            for ep_idx in range(meta.total_episodes)
+        ]
+        for future in futures:
+            future.result()
+    writer.finalize()
+    return writer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_paths", type=str, nargs="+", help="Datasets to merge, in this order.", required=True)
+    parser.add_argument("--output_path", type=str, help="Directory of the merged dataset.", required=True)
+    parser.add_argument("--num_workers", type=int, help="Episodes written in parallel.", default=os.cpu_count())
+    args = parser.parse_args()
+
+    multi_meta = MultiDatasetMetadata(args.dataset_paths)
+    start = time.perf_counter()
+    writer = merge_datasets(multi_meta, args.output_path, args.num_workers)
+    elapsed_s = time.perf_counter() - start
+    for meta in multi_meta.metas:
+        print(f"{meta.repo_id}: {meta.total_episodes} episodes, {meta.total_frames} frames, {meta.total_tasks} tasks")
+    print(
+        f"Merged into {writer.root} in {elapsed_s:.1f}s: {writer.info['total_episodes']} episodes, "
+        f"{writer.info['total_frames']} frames, {writer.info['total_tasks']} tasks, "
+        f"{dataset_bytes(writer.root) / 1e6:.1f}MB"
+    )
@@ -16,6 +16,11 @@ from lerobot.utils.utils import (
 )
 from lerobot.utils.visualization_utils import _init_rerun, log_rerun_data
 
+from data.dual_rate import DualRateTeleop
+from data.episode_encoder import BackgroundEpisodeEncoder
+from data.image_writers import autotune_num_threads, make_image_writer
+from data.rolling_buffer import RollingEpisodeBuffer
+from data.timestamp_check import capture_timestamp_features, capture_timestamp_frame
 from robot.robots.piper.config_piper_follower import PIPERFollowerConfig
 from robot.robots.piper.piper_follower import PIPERFollower
 from robot.teleoperators.piper.config_piper_leader import PIPERLeaderConfig
@@ -24,6 +29,10 @@ from robot.teleoperators.piper.piper_leader import PIPERLeader
 
 
 USE_TELEOPERATOR = False
+# Mirror the leader to the follower at ARM_HZ in a background thread, independently of the camera FPS.
+# Recorded frames get the arm state and action interpolated at the camera capture time.
+DUAL_RATE = True
+ARM_HZ = 200
 # --------- Configuration for dataset ---------
 REPO_ID = "test2/piper_test86"
 NUM_EPISODES = 2
@@ -32,11 +41,26 @@ EPISODE_TIME_SEC = 3600
 # Number of seconds for resetting the environment after each episode.
 RESET_TIME_SEC = 3600
 TASK_DESCRIPTION = "My task description"
+# Encode the videos of finished episodes in background processes while the next episode is recording
+BACKGROUND_ENCODING = True
+NUM_ENCODER_PROCESSES = 3
+# Recording waits when this many episodes are still being encoded (bounds the disk used by PNG frames)
+MAX_PENDING_EPISODES = 2
+# Flush the low-dimensional data of the episode to parquet parts every ROLLING_FLUSH_S seconds, which
+# bounds memory and the data lost in a crash (None: keep the whole episode in memory until it is saved)
+ROLLING_FLUSH_S = 10
+
+# Save the time every frame was actually read at, per sensor, next to the nominal `timestamp`.
+# Check a recorded dataset with `python -m data.timestamp_check`
+RECORD_CAPTURE_TIMESTAMPS = True
 
 # --------- Configuration for camera ---------
 FPS = 30
-NUM_IMAGE_WRITER_PROCESSES = 0
-NUM_IMAGE_WRITER_THREADS_PER_CAMERA = 4
+# "png" (default PIL compression), "png_fast" (compress_level=1) or "raw" (uint8 memmap chunks, needs
+# BACKGROUND_ENCODING). Compare them on this machine with `python -m data.image_writers`
+IMAGE_WRITER_BACKEND = "png_fast"
+# None: pick the smallest thread count that keeps up with FPS * number of cameras on this machine
+NUM_IMAGE_WRITER_THREADS = None
 
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
@@ -75,6 +99,8 @@ if USE_TELEOPERATOR:
 action_features = hw_to_dataset_features(robot.action_features, "action")
 obs_features = hw_to_dataset_features(robot.observation_features, "observation")
 dataset_features = {**action_features, **obs_features}
+if RECORD_CAPTURE_TIMESTAMPS:
+    dataset_features.update(capture_timestamp_features(["arm", *CAMERA_NAMES]))
 
 # Create the dataset
 dataset = LeRobotDataset.create(
@@ -83,15 +109,36 @@ dataset = LeRobotDataset.create(
     features=dataset_features,
     robot_type=robot.name,
     use_videos=True,
-    image_writer_processes=NUM_IMAGE_WRITER_PROCESSES,
-    image_writer_threads=NUM_IMAGE_WRITER_THREADS_PER_CAMERA * len(CAMERA_NAMES),
 )
 
+if IMAGE_WRITER_BACKEND == "raw" and not BACKGROUND_ENCODING:
+    raise ValueError("The raw image writer backend is only supported with BACKGROUND_ENCODING.")
+num_image_writer_threads = NUM_IMAGE_WRITER_THREADS
+if num_image_writer_threads is None:
+    num_image_writer_threads = autotune_num_threads(
+        IMAGE_WRITER_BACKEND, CAMERA_HEIGHT, CAMERA_WIDTH, target_fps=FPS * len(CAMERA_NAMES), max_threads=16
+    )
+    print(f"{IMAGE_WRITER_BACKEND} image writer: {num_image_writer_threads} threads")
+dataset.image_writer = make_image_writer(IMAGE_WRITER_BACKEND, num_image_writer_threads)
+
+episode_encoder = None
+if BACKGROUND_ENCODING:
+    episode_encoder = BackgroundEpisodeEncoder(
+        dataset, num_workers=NUM_ENCODER_PROCESSES, max_pending_episodes=MAX_PENDING_EPISODES
+    )
+
+rolling = RollingEpisodeBuffer(dataset, flush_every_s=ROLLING_FLUSH_S) if ROLLING_FLUSH_S else None
+
 listener, events = init_keyboard_listener()
 
 if not robot.is_connected or (USE_TELEOPERATOR and not teleop.is_connected):
     raise ValueError("Robot, leader arm of keyboard is not connected!")
 
+arm_engine = None
+if DUAL_RATE:
+    # Keeps running through resets and `save_episode`, so the follower never stops tracking the leader.
+    arm_engine = DualRateTeleop(robot, teleop if USE_TELEOPERATOR else None, arm_hz=ARM_HZ).start()
+
 
 @safe_stop_image_writer
 def record_loop(
@@ -104,6 +151,8 @@ def record_loop(
     control_time_s: int | None = None,
     single_task: str | None = None,
     display_data: bool = False,
+    arm_engine: DualRateTeleop | None = None,
+    rolling: RollingEpisodeBuffer | None = None,
 ):
     if dataset is not None and dataset.fps != fps:
         raise ValueError(f"The dataset fps should be equal to requested fps ({dataset.fps} != {fps}).")
@@ -112,6 +161,9 @@ def record_loop(
     if policy is not None:
         policy.reset()
 
+    # The arm loop sends the actions, only the cameras are read at this rate.
+    dual_rate = arm_engine is not None and policy is None
+
     timestamp = 0
     start_episode_t = time.perf_counter()
     while timestamp < control_time_s:
@@ -121,12 +173,23 @@ def record_loop(
             events["exit_early"] = False
             break
 
-        observation = robot.get_observation()
+        if dual_rate:
+            observation = robot.get_camera_observation()
+            # Arm state at the time the frames were received, which the arm loop has passed once they are read.
+            arm_t = min(robot.camera_frame_times.values())
+            state, arm_action = arm_engine.sample(arm_t)
+            observation.update(state)
+        else:
+            observation = robot.get_arm_observation()
+            arm_t = time.perf_counter()
+            observation.update(robot.get_camera_observation())
 
         if policy is not None or dataset is not None:
             observation_frame = build_dataset_frame(dataset.features, observation, prefix="observation")
 
-        if policy is not None:
+        if dual_rate:
+            action = arm_action
+        elif policy is not None:
             action_values = predict_action(
                 observation_frame,
                 policy,
@@ -143,7 +206,7 @@ def record_loop(
 
         # Action can eventually be clipped using `max_relative_target`,
         # so action actually sent is saved in the dataset.
-        if policy is None and teleop is None:
+        if policy is None and (teleop is None or dual_rate):
             sent_action = action
         else:
             sent_action = robot.send_action(action)
@@ -151,7 +214,12 @@ def record_loop(
         if dataset is not None:
             action_frame = build_dataset_frame(dataset.features, sent_action, prefix="action")
             frame = {**observation_frame, **action_frame}
+            if RECORD_CAPTURE_TIMESTAMPS:
+                sensor_times = {"arm": arm_t, **robot.camera_frame_times}
+                frame.update(capture_timestamp_frame(sensor_times, start_episode_t))
             dataset.add_frame(frame, task=single_task)
+            if rolling is not None:
+                rolling.maybe_flush()
 
         if display_data:
             log_rerun_data(observation, action)
@@ -176,6 +244,8 @@ while recorded_episodes < NUM_EPISODES and not events["stop_recording"]:
         control_time_s=EPISODE_TIME_SEC,
         single_task=TASK_DESCRIPTION,
         display_data=True,
+        arm_engine=arm_engine,
+        rolling=rolling,
     )
 
     # Logic for reset env
@@ -191,22 +261,45 @@ while recorded_episodes < NUM_EPISODES and not events["stop_recording"]:
             control_time_s=RESET_TIME_SEC,
             single_task=TASK_DESCRIPTION,
             display_data=True,
+            arm_engine=arm_engine,
         )
 
     if events["rerecord_episode"]:
         log_say("Re-record episode")
         events["rerecord_episode"] = False
         events["exit_early"] = False
-        dataset.clear_episode_buffer()
+        if rolling is not None:
+            rolling.clear(dataset.episode_buffer["episode_index"])
+        if episode_encoder is not None:
+            episode_encoder.clear_episode_buffer()
+        else:
+            dataset.clear_episode_buffer()
         continue
 
-    dataset.save_episode()
+    episode_index = dataset.episode_buffer["episode_index"]
+    if rolling is not None:
+        rolling.consolidate()
+    if episode_encoder is not None:
+        episode_encoder.save_episode()
+        log_say(f"Episode {recorded_episodes} queued for encoding")
+        print(episode_encoder.status())
+    else:
+        dataset.save_episode()
+    if rolling is not None:
+        rolling.clear(episode_index)
     recorded_episodes += 1
 
 # Upload to hub and clean up
 # dataset.push_to_hub()
 
+if arm_engine is not None:
+    print(f"arm loop: {arm_engine.rate_hz():.0f} Hz, {arm_engine.overruns} overruns")
+    arm_engine.stop()
 robot.disconnect()
 if USE_TELEOPERATOR:
     teleop.disconnect()
 listener.stop()
+
+if episode_encoder is not None:
+    log_say(f"Waiting for {episode_encoder.num_pending()} episodes to be encoded")
+    episode_encoder.close()
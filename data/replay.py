@@ -1,38 +1,114 @@
 import time
 
+import numpy as np
+
 from lerobot.datasets.lerobot_dataset import LeRobotDataset
 from lerobot.utils.robot_utils import busy_wait
 from lerobot.utils.utils import log_say
 
 from robot.robots.piper.config_piper_follower import PIPERFollowerConfig
 from robot.robots.piper.piper_follower import PIPERFollower
+from robot.robots.piper.trajectory import TrajectoryStreamer
 
 
 REPO_ID = "test2/piper_test81"
-EPISODE_IDX = 0
+# Episodes are replayed back to back in this order
+EPISODES = [0]
+# Replay only [START_OFFSET_S, END_OFFSET_S) of every episode, in seconds from the episode start (None: to the end)
+START_OFFSET_S = 0.0
+END_OFFSET_S = None
+# Playback speed: 2.0 replays twice as fast as recorded, 0.5 at half speed
+TIME_SCALE = 1.0
+# Replay against a simulated motor bus and report the timing accuracy instead of moving the arm
+DRY_RUN = False
+# Stream targets interpolated between the recorded actions at this rate (None: send the recorded actions as is)
+STREAM_HZ = None
+# Limits of the streamed targets per action dimension, in its units per second (0.001°/s for the joints)
+MAX_VELOCITY = 60000
+MAX_ACCELERATION = 300000
+
+
+def load_episode_arrays(dataset: LeRobotDataset) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Load the `action`, `timestamp` and `episode_index` columns once as contiguous NumPy arrays,
+    instead of materializing a dataset row on every tick.
+    """
+    columns = dataset.hf_dataset.with_format("numpy").select_columns(["action", "timestamp", "episode_index"])
+    actions = np.ascontiguousarray(np.stack(columns["action"]), dtype=np.float64)
+    timestamps = np.asarray(columns["timestamp"], dtype=np.float64)
+    episode_index = np.asarray(columns["episode_index"], dtype=np.int64)
+    return actions, timestamps, episode_index
+
+
+def replay_episode(robot: PIPERFollower, actions: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+    """
+    Send `actions[i]` at `timestamps[i] / TIME_SCALE` after the start. The schedule is absolute, so a
+    late tick does not delay the following ones. Returns the send time of every row relative to the start.
+    """
+    targets = (timestamps - timestamps[0]) / TIME_SCALE
+    sent = np.empty(len(actions))
+    start = time.perf_counter()
+    for i in range(len(actions)):
+        busy_wait(targets[i] - (time.perf_counter() - start))
+        sent[i] = time.perf_counter() - start
+        robot.send_action_array(actions[i])
+    return sent
+
+
+def stream_episode(robot: PIPERFollower, actions: np.ndarray, timestamps: np.ndarray) -> TrajectoryStreamer:
+    """Same schedule as `replay_episode`, the recorded actions being the waypoints of a `TrajectoryStreamer`."""
+    state = robot.get_arm_observation()
+    streamer = TrajectoryStreamer(robot, STREAM_HZ, MAX_VELOCITY, MAX_ACCELERATION)
+    streamer.start([state[f"{motor}.pos"] for motor in robot.bus.motors])
+    streamer.set_trajectory(actions, time.perf_counter() + (timestamps - timestamps[0]) / TIME_SCALE)
+    while not streamer.is_done():
+        time.sleep(0.01)
+    streamer.stop()
+    return streamer
+
+
+def print_timing_report(targets: np.ndarray, sent: np.ndarray):
+    error_ms = 1e3 * (sent - targets)
+    period_ms = 1e3 * np.diff(sent)
+    print(
+        f"frames: {len(sent)} | send time error: mean {error_ms.mean():.2f}ms "
+        f"p99 {np.percentile(np.abs(error_ms), 99):.2f}ms max {np.abs(error_ms).max():.2f}ms | "
+        f"period: mean {period_ms.mean():.2f}ms std {period_ms.std():.2f}ms"
+    )
+
 
 # Create the robot and teleoperator configurations
-robot_config = PIPERFollowerConfig()
+robot_config = PIPERFollowerConfig(mock=DRY_RUN)
 
 robot = PIPERFollower(robot_config)
 
-dataset = LeRobotDataset(REPO_ID, episodes=[EPISODE_IDX])
-actions = dataset.hf_dataset.select_columns("action")
+dataset = LeRobotDataset(REPO_ID, episodes=EPISODES)
+actions, timestamps, episode_index = load_episode_arrays(dataset)
 
 robot.connect()
 
 if not robot.is_connected:
     raise ValueError("Robot is not connected!")
 
-log_say(f"Replaying episode {EPISODE_IDX}")
-for idx in range(dataset.num_frames):
-    t0 = time.perf_counter()
-
-    action = {
-        name: float(actions[idx]["action"][i]) for i, name in enumerate(dataset.features["action"]["names"])
-    }
-    robot.send_action(action)
+for ep_idx in EPISODES:
+    ep_mask = episode_index == ep_idx
+    ep_timestamps = timestamps[ep_mask]
+    ep_mask &= timestamps >= ep_timestamps[0] + START_OFFSET_S
+    if END_OFFSET_S is not None:
+        ep_mask &= timestamps < ep_timestamps[0] + END_OFFSET_S
+    ep_actions = actions[ep_mask]
+    ep_timestamps = timestamps[ep_mask]
+    if len(ep_actions) == 0:
+        log_say(f"Episode {ep_idx} has no frames in the requested window, skipping")
+        continue
 
-    busy_wait(max(1.0 / dataset.fps - (time.perf_counter() - t0), 0.0))
+    log_say(f"Replaying episode {ep_idx}")
+    if STREAM_HZ is not None:
+        streamer = stream_episode(robot, ep_actions, ep_timestamps)
+        print(f"streamed {streamer.ticks} targets, {streamer.limited_ticks} limited, {streamer.overruns} overruns")
+        continue
+    sent = replay_episode(robot, ep_actions, ep_timestamps)
+    if DRY_RUN:
+        print_timing_report((ep_timestamps - ep_timestamps[0]) / TIME_SCALE, sent)
 
 robot.disconnect()
@@ -0,0 +1,167 @@
+"""Conversion of a recorded dataset to another frame rate and camera resolution.
+
+The datasets are recorded at 30 fps and 640x480 while the diffusion policy looks at frames 0.1s
+apart, cropped from much smaller images: training decodes three times more frames than it samples,
+at a resolution it throws away. This script writes a derived dataset at `--fps` with videos
+re-encoded at `--resolution`.
+
+New frame `k` is at `k / fps`. Its image is the nearest source frame. With `--alignment nearest` the
+state, action and other columns come from the same source frame, so all the modalities of a frame
+are from one instant. With `--alignment linear` the float columns (state, action, capture
+timestamps) are interpolated between the two source frames around `k / fps`. For an integer ratio
+(30 -> 10 fps) every new frame falls on a source frame, and both give the same result.
+
+The videos are re-encoded in a process pool, with one task per episode and camera. The stats of
+every episode are recomputed on the new frames. At the end, the decoding time of a training sample
+(the frames of `--delta_s` for every camera) is measured on both datasets and extrapolated to one
+epoch:
+
+    python -m data.resample --dataset_path test2/piper_test86 --output_path /data/piper_test86_10hz \\
+        --fps 10 --resolution 240 320
+"""
+
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from lerobot.datasets.lerobot_dataset import LeRobotDatasetMetadata
+from lerobot.datasets.video_utils import decode_video_frames
+
+from data.derived_dataset import (
+    INDEX_KEYS,
+    DerivedDatasetWriter,
+    column_array,
+    dataset_bytes,
+    make_transcode_pool,
+    transcode_video,
+)
+
+ALIGNMENTS = ["nearest", "linear"]
+
+
+def resample_positions(num_frames: int, src_fps: int, fps: int) -> np.ndarray:
+    """Position in source frames (fractional) of every new frame of an episode of `num_frames` frames."""
+    num_new = int(np.floor((num_frames - 1) * fps / src_fps + 1e-9)) + 1
+    return np.arange(num_new) * src_fps / fps
+
+
+def resample_episode(df: pd.DataFrame, features: dict, positions: np.ndarray, alignment: str) -> pd.DataFrame:
+    """Rows of `df` at `positions`, the nearest ones or with the float columns interpolated."""
+    nearest = np.minimum(np.round(positions).astype(np.int64), len(df) - 1)
+    new_df = df.iloc[nearest].reset_index(drop=True)
+    if alignment == "nearest":
+        return new_df
+
+    lo = np.floor(positions).astype(np.int64)
+    hi = np.minimum(lo + 1, len(df) - 1)
+    w = positions - lo
+    for key in df.columns:
+        if key in INDEX_KEYS or not features.get(key, {}).get("dtype", "").startswith("float"):
+            continue
+        values = column_array(df, key).astype(np.float64)
+        weight = w.reshape(-1, *[1] * (values.ndim - 1))
+        interpolated = ((1 - weight) * values[lo] + weight * values[hi]).astype(features[key]["dtype"])
+        new_df[key] = list(interpolated) if values.ndim > 1 else interpolated
+    return new_df
+
+
+def set_video_shape(feature: dict, height: int, width: int):
+    sizes = {"height": height, "width": width, "channels": 3}
+    feature["shape"] = [sizes[name] for name in feature["names"]]
+    feature.pop("info", None)
+
+
+def write_resampled(
+    meta: LeRobotDatasetMetadata,
+    output_path: str,
+    fps: int,
+    resolution: tuple[int, int] | None,
+    alignment: str,
+    num_workers: int,
+) -> DerivedDatasetWriter:
+    info = copy.deepcopy(meta.info)
+    info["fps"] = fps
+    writer = DerivedDatasetWriter(output_path, info)
+    if resolution is not None:
+        for key in writer.video_keys:
+            set_video_shape(writer.features[key], *resolution)
+    for task_index in sorted(meta.tasks):
+        writer.add_task(meta.tasks[task_index])
+
+    pool = make_transcode_pool(num_workers)
+    futures = {}
+    first_index = 0
+    for ep_idx in range(meta.total_episodes):
+        df = pd.read_parquet(meta.root / meta.get_data_file_path(ep_idx))
+        positions = resample_positions(len(df), meta.fps, fps)
+        new_df = resample_episode(df, meta.features, positions, alignment)
+        writer.write_episode_data(ep_idx, new_df, meta.episodes[ep_idx]["tasks"], first_index)
+        first_index += len(new_df)
+
+        frame_indices = np.minimum(np.round(positions).astype(np.int64), len(df) - 1).tolist()
+        for key in meta.video_keys:
+            src = str(meta.root / meta.get_video_file_path(ep_idx, key))
+            outputs = [(str(writer.video_path(ep_idx, key)), frame_indices)]
+            futures[(ep_idx, key)] = pool.submit(transcode_video, src, outputs, fps, resolution)
+
+    for (ep_idx, key), future in futures.items():
+        writer.add_video_stats(ep_idx, key, future.result()[0])
+    pool.shutdown()
+    writer.finalize()
+    return writer
+
+
+def measure_decode(meta: LeRobotDatasetMetadata, delta_s: list[float], num_samples: int, seed: int = 0) -> float:
+    """Mean time in seconds to decode the camera frames of one training sample, at random frames."""
+    rng = np.random.default_rng(seed)
+    lengths = np.array([meta.episodes[ep]["length"] for ep in range(meta.total_episodes)])
+    episodes = rng.integers(0, meta.total_episodes, size=num_samples)
+    elapsed_s = 0.0
+    for ep_idx in episodes.tolist():
+        t = rng.integers(0, lengths[ep_idx]) / meta.fps
+        timestamps = [float(np.clip(t + d, 0, (lengths[ep_idx] - 1) / meta.fps)) for d in delta_s]
+        # Same delta timestamps rounded to the frames of this dataset, as `LeRobotDataset` does.
+        timestamps = [round(ts * meta.fps) / meta.fps for ts in timestamps]
+        start = time.perf_counter()
+        for key in meta.video_keys:
+            decode_video_frames(meta.root / meta.get_video_file_path(ep_idx, key), timestamps, 1e-4)
+        elapsed_s += time.perf_counter() - start
+    return elapsed_s / num_samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_path", type=str, help="Path to the dataset.", required=True)
+    parser.add_argument("--output_path", type=str, help="Directory of the converted dataset.", required=True)
+    parser.add_argument("--fps", type=int, help="Target frame rate.", required=True)
+    parser.add_argument("--resolution", type=int, nargs=2, help="Target height and width (default: unchanged).", default=None)
+    parser.add_argument("--alignment", type=str, choices=ALIGNMENTS, help="State/action alignment.", default="nearest")
+    parser.add_argument("--num_workers", type=int, help="Video re-encoding processes.", default=os.cpu_count())
+    parser.add_argument("--delta_s", type=float, nargs="+", help="Camera frames of a training sample.", default=[-0.1, 0.0])
+    parser.add_argument("--decode_samples", type=int, help="Samples timed per dataset (0: skip).", default=200)
+    args = parser.parse_args()
+
+    meta = LeRobotDatasetMetadata(args.dataset_path)
+    start = time.perf_counter()
+    writer = write_resampled(meta, args.output_path, args.fps, args.resolution, args.alignment, args.num_workers)
+    elapsed_s = time.perf_counter() - start
+    new_meta = LeRobotDatasetMetadata(str(writer.root))
+    src_bytes, dst_bytes = dataset_bytes(meta.root), dataset_bytes(new_meta.root)
+    print(
+        f"Converted in {elapsed_s:.1f}s to {new_meta.root}: {meta.total_frames} -> {new_meta.total_frames} frames, "
+        f"{src_bytes / 1e6:.1f}MB -> {dst_bytes / 1e6:.1f}MB ({dst_bytes / src_bytes:.1%})"
+    )
+
+    if args.decode_samples > 0 and meta.video_keys:
+        src_s = measure_decode(meta, args.delta_s, args.decode_samples)
+        dst_s = measure_decode(new_meta, args.delta_s, args.decode_samples)
+        # One epoch samples every frame once.
+        src_epoch_s, dst_epoch_s = src_s * meta.total_frames, dst_s * new_meta.total_frames
+        print(
+            f"Decoding per sample: {1e3 * src_s:.1f}ms -> {1e3 * dst_s:.1f}ms ({src_s / dst_s:.2f}x) | "
+            f"per epoch: {src_epoch_s:.0f}s -> {dst_epoch_s:.0f}s ({src_epoch_s / dst_epoch_s:.2f}x less decoding)"
+        )
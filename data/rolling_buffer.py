@@ -0,0 +1,148 @@
+"""Rolling storage of the episode being recorded, for hour-long episodes.
+
+`dataset.add_frame` keeps every frame of the episode in `dataset.episode_buffer` as Python lists
+until `save_episode`. `RollingEpisodeBuffer.maybe_flush` moves the low-dimensional columns (and the
+image paths, which are implied by the frame index) to a parquet part file every `flush_every_s`
+seconds of recording, so the buffer never holds more than that. `consolidate` reassembles the parts
+as one logical episode right before saving it.
+
+The parts live in `meta/recording/episode_XXXXXX/part_XXXX.parquet`. After a crash, the episode is
+saved up to its last flushed part (at most `flush_every_s` seconds are lost) with:
+
+    python -m data.rolling_buffer --repo_id test2/piper_test86
+"""
+
+import argparse
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lerobot.datasets.lerobot_dataset import LeRobotDataset
+
+from data.episode_encoder import BackgroundEpisodeEncoder
+
+RECORDING_DIR = "meta/recording"
+# Columns filled when the episode is saved, from the committed metadata
+_SAVE_KEYS = ["index", "episode_index", "task_index"]
+
+
+class RollingEpisodeBuffer:
+    def __init__(self, dataset: LeRobotDataset, flush_every_s: float = 10.0):
+        self.dataset = dataset
+        self.flush_every_frames = max(1, round(flush_every_s * dataset.fps))
+        self.columns = [
+            key
+            for key, ft in dataset.features.items()
+            if key not in _SAVE_KEYS and ft["dtype"] not in ["image", "video"]
+        ]
+        self.num_flushed = 0
+        self.num_parts = 0
+
+    def part_dir(self, episode_index: int) -> Path:
+        return self.dataset.root / RECORDING_DIR / f"episode_{episode_index:06d}"
+
+    def maybe_flush(self):
+        """Call after every `add_frame`, flushes once `flush_every_s` seconds of frames are buffered."""
+        buffer = self.dataset.episode_buffer
+        if buffer is not None and buffer["size"] - self.num_flushed >= self.flush_every_frames:
+            self.flush()
+
+    def flush(self):
+        buffer = self.dataset.episode_buffer
+        if buffer is None or buffer["size"] == self.num_flushed:
+            return
+        part = {key: list(np.stack(buffer[key])) if np.ndim(buffer[key][0]) > 0 else buffer[key] for key in self.columns}
+        part["task"] = buffer["task"]
+
+        part_dir = self.part_dir(buffer["episode_index"])
+        part_dir.mkdir(parents=True, exist_ok=True)
+        part_path = part_dir / f"part_{self.num_parts:04d}.parquet"
+        # A part is either complete or absent.
+        tmp_path = part_path.with_suffix(".tmp")
+        pd.DataFrame(part).to_parquet(tmp_path)
+        os.replace(tmp_path, part_path)
+
+        for key in [*self.columns, "task", *self.dataset.meta.camera_keys]:
+            buffer[key] = []
+        self.num_flushed = buffer["size"]
+        self.num_parts += 1
+
+    def consolidate(self):
+        """Put the flushed parts back in front of the buffered frames, as stacked arrays."""
+        buffer = self.dataset.episode_buffer
+        episode_index = buffer["episode_index"]
+        parts = [pd.read_parquet(self.part_dir(episode_index) / f"part_{i:04d}.parquet") for i in range(self.num_parts)]
+        for key in self.columns:
+            chunks = [np.stack(part[key].to_numpy()) for part in parts]
+            if buffer[key]:
+                chunks.append(np.stack(buffer[key]))
+            buffer[key] = np.concatenate(chunks)
+        buffer["task"] = [task for part in parts for task in part["task"]] + buffer["task"]
+        for key in self.dataset.meta.camera_keys:
+            buffer[key] = [
+                str(self.dataset._get_image_file_path(episode_index=episode_index, image_key=key, frame_index=i))
+                for i in range(buffer["size"])
+            ]
+        self.num_flushed = 0
+        self.num_parts = 0
+
+    def clear(self, episode_index: int):
+        """Remove the parts of `episode_index`, once it is saved or discarded."""
+        shutil.rmtree(self.part_dir(episode_index), ignore_errors=True)
+        self.num_flushed = 0
+        self.num_parts = 0
+
+
+def recover_episode(dataset: LeRobotDataset, rolling: RollingEpisodeBuffer, episode_index: int):
+    """
+    Rebuild `dataset.episode_buffer` from the parts of an interrupted episode. Frames captured after
+    the last part are dropped, including their images.
+    """
+    part_paths = sorted(rolling.part_dir(episode_index).glob("part_*.parquet"))
+    parts = [pd.read_parquet(path) for path in part_paths]
+    size = sum(len(part) for part in parts)
+
+    dataset.episode_buffer = dataset.create_episode_buffer(episode_index=episode_index)
+    if size == 0:
+        return
+    dataset.episode_buffer["size"] = size
+    rolling.num_parts = len(parts)
+    rolling.num_flushed = size
+    rolling.consolidate()
+
+    for key in dataset.meta.camera_keys:
+        img_dir = dataset._get_image_file_path(episode_index=episode_index, image_key=key, frame_index=0).parent
+        for img_path in img_dir.glob("frame_*.png"):
+            if int(img_path.stem.split("_")[-1]) >= size:
+                img_path.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repo_id", type=str, help="Dataset with an interrupted episode.", required=True)
+    parser.add_argument("--root", type=str, help="Local dataset directory.", default=None)
+    args = parser.parse_args()
+
+    dataset = LeRobotDataset(args.repo_id, root=args.root)
+    episode_encoder = BackgroundEpisodeEncoder(dataset)
+    # Episodes handed over to the encoder come first.
+    episode_encoder.recover()
+
+    rolling = RollingEpisodeBuffer(dataset)
+    for part_dir in sorted((dataset.root / RECORDING_DIR).glob("episode_*")):
+        episode_index = int(part_dir.name.split("_")[-1])
+        if episode_index != episode_encoder.next_episode_index:
+            logging.warning(f"Skipping {part_dir}, the next episode to save is {episode_encoder.next_episode_index}")
+            continue
+        recover_episode(dataset, rolling, episode_index)
+        if dataset.episode_buffer["size"] == 0:
+            rolling.clear(episode_index)
+            continue
+        logging.info(f"Saving {dataset.episode_buffer['size']} frames of interrupted episode {episode_index}")
+        episode_encoder.save_episode()
+        rolling.clear(episode_index)
+    episode_encoder.close()
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import numpy as np
+
+from lerobot.utils.visualization_utils import log_rerun_data
+
+
+class TerminalDashboard:
+    """
+    Terminal table of the latest action, redrawn at `refresh_hz` by a background thread. The control
+    loop only swaps in a reference to its latest values with `update`, so it never pays for the
+    formatting or the terminal writes.
+    """
+
+    def __init__(self, names: list[str], refresh_hz: float = 5.0):
+        self.names = list(names)
+        self.refresh_hz = refresh_hz
+        self.display_len = max(len(name) for name in self.names)
+        self._snapshot = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._lines_drawn = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def update(self, action: dict, work_s: float, loop_s: float):
+        # A single reference assignment, atomic under the GIL.
+        self._snapshot = (action, work_s, loop_s)
+
+    def _render(self, action: dict, work_s: float, loop_s: float) -> str:
+        lines = ["-" * (self.display_len + 10), f"{'NAME':<{self.display_len}} | {'NORM':>7}"]
+        lines += [f"{name:<{self.display_len}} | {action.get(name, float('nan')):>7.2f}" for name in self.names]
+        lines += ["", f"time: {loop_s * 1e3:.2f}ms ({1 / loop_s:.0f} Hz), work: {work_s * 1e3:.2f}ms"]
+        return "\n".join(lines)
+
+    def _run(self):
+        while not self._stop.wait(1 / self.refresh_hz):
+            snapshot = self._snapshot
+            if snapshot is None:
+                continue
+            text = self._render(*snapshot)
+            # Move the cursor back over the previous table and redraw it in a single write.
+            prefix = f"\033[{self._lines_drawn}A" if self._lines_drawn else ""
+            print(prefix + text, flush=True)
+            self._lines_drawn = text.count("\n") + 1
+
+
+class RerunThrottle:
+    """
+    Calls `log_rerun_data` at most `rate_hz` times per second, with the camera images downsampled by
+    `image_stride` in both directions (a strided view, no copy).
+    """
+
+    def __init__(self, rate_hz: float = 10.0, image_stride: int = 4):
+        self.period_s = 1 / rate_hz if rate_hz > 0 else float("inf")
+        self.image_stride = image_stride
+        self._last_log_t = -float("inf")
+
+    def __call__(self, observation: dict, action: dict):
+        now = time.perf_counter()
+        if now - self._last_log_t < self.period_s:
+            return
+        self._last_log_t = now
+        if self.image_stride > 1:
+            observation = {
+                k: (v[:: self.image_stride, :: self.image_stride] if isinstance(v, np.ndarray) and v.ndim == 3 else v)
+                for k, v in observation.items()
+            }
+        log_rerun_data(observation, action)
+
+
+class LoopTimer:
+    """Per-tick timings of a control loop, summarized when the loop ends."""
+
+    def __init__(self):
+        self.work_s = []
+        self.loop_s = []
+
+    def add(self, work_s: float, loop_s: float):
+        self.work_s.append(work_s)
+        self.loop_s.append(loop_s)
+
+    def summary(self) -> str:
+        if not self.work_s:
+            return "no ticks recorded"
+        work_ms = 1e3 * np.asarray(self.work_s)
+        loop_ms = 1e3 * np.asarray(self.loop_s)
+        return (
+            f"ticks: {len(work_ms)} | work: mean {work_ms.mean():.2f}ms p99 {np.percentile(work_ms, 99):.2f}ms "
+            f"max {work_ms.max():.2f}ms | loop: mean {loop_ms.mean():.2f}ms p99 {np.percentile(loop_ms, 99):.2f}ms"
+        )
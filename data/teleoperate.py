@@ -5,6 +5,9 @@ from lerobot.utils.robot_utils import busy_wait
 from lerobot.utils.visualization_utils import _init_rerun, log_rerun_data
 from lerobot.cameras.realsense.configuration_realsense import RealSenseCameraConfig
 
+from data.dual_rate import DualRateTeleop
+from data.teleop_display import LoopTimer, RerunThrottle, TerminalDashboard
+
 from robot.robots.piper.config_piper_follower import PIPERFollowerConfig
 from robot.robots.piper.piper_follower import PIPERFollower
 from robot.teleoperators.piper.config_piper_leader import PIPERLeaderConfig
@@ -13,6 +16,16 @@ from robot.teleoperators.piper.piper_leader import PIPERLeader
 
 USE_TELEOPERATOR = False
 FPS = 30
+# Mirror the leader to the follower at ARM_HZ in a background thread instead of at the camera FPS
+DUAL_RATE = True
+ARM_HZ = 200
+# "dashboard": table redrawn by a background thread at DASHBOARD_HZ, rerun logging throttled to RERUN_HZ
+#              with images downsampled by RERUN_IMAGE_STRIDE
+# "legacy":    table printed and full images logged on every tick
+DISPLAY_MODE = "dashboard"
+DASHBOARD_HZ = 5
+RERUN_HZ = 10
+RERUN_IMAGE_STRIDE = 4
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
 CAMERA_NAMES = ["image", "wrist_image_left", "wrist_image_right"]
@@ -48,26 +61,57 @@ _init_rerun(session_name="piper_teleop_session")
 if not robot.is_connected or (USE_TELEOPERATOR and not teleop.is_connected):
     raise ValueError("Robot is not connected!")
 
+arm_engine = DualRateTeleop(robot, teleop if USE_TELEOPERATOR else None, arm_hz=ARM_HZ).start() if DUAL_RATE else None
+
 display_len = max(len(key) for key in robot.action_features)
+dashboard = None
+if DISPLAY_MODE == "dashboard":
+    dashboard = TerminalDashboard(list(robot.action_features), refresh_hz=DASHBOARD_HZ).start()
+    log_data = RerunThrottle(rate_hz=RERUN_HZ, image_stride=RERUN_IMAGE_STRIDE)
+else:
+    log_data = log_rerun_data
+
+loop_timer = LoopTimer()
 start = time.perf_counter()
-while True:
-    loop_start = time.perf_counter()
+try:
+    while True:
+        loop_start = time.perf_counter()
 
-    observation = robot.get_observation()
-    action = teleop.get_action() if USE_TELEOPERATOR else {k: v for k, v in observation.items() if k.endswith(".pos")}
-    log_rerun_data(observation, action)
+        if arm_engine is not None:
+            observation = robot.get_camera_observation()
+            state, action = arm_engine.sample(min(robot.camera_frame_times.values()))
+            observation.update(state)
+        else:
+            observation = robot.get_observation()
+            action = teleop.get_action() if USE_TELEOPERATOR else {k: v for k, v in observation.items() if k.endswith(".pos")}
+        log_data(observation, action)
 
-    if USE_TELEOPERATOR:
-        robot.send_action(action)
-    dt_s = time.perf_counter() - loop_start
-    busy_wait(1 / FPS - dt_s)
+        if USE_TELEOPERATOR and arm_engine is None:
+            robot.send_action(action)
 
-    loop_s = time.perf_counter() - loop_start
+        if DISPLAY_MODE == "legacy":
+            print("\n" + "-" * (display_len + 10))
+            print(f"{'NAME':<{display_len}} | {'NORM':>7}")
+            for motor, value in action.items():
+                print(f"{motor:<{display_len}} | {value:>7.2f}")
+            loop_s = loop_timer.loop_s[-1] if loop_timer.loop_s else 1 / FPS
+            print(f"\ntime: {loop_s * 1e3:.2f}ms ({1 / loop_s:.0f} Hz)")
+            move_cursor_up(len(action) + 5)
 
-    print("\n" + "-" * (display_len + 10))
-    print(f"{'NAME':<{display_len}} | {'NORM':>7}")
-    for motor, value in action.items():
-        print(f"{motor:<{display_len}} | {value:>7.2f}")
-    print(f"\ntime: {loop_s * 1e3:.2f}ms ({1 / loop_s:.0f} Hz)")
+        dt_s = time.perf_counter() - loop_start
+        busy_wait(1 / FPS - dt_s)
 
-    move_cursor_up(len(action) + 5)
+        loop_s = time.perf_counter() - loop_start
+        loop_timer.add(dt_s, loop_s)
+        if dashboard is not None:
+            dashboard.update(action, dt_s, loop_s)
+except KeyboardInterrupt:
+    pass
+finally:
+    if dashboard is not None:
+        dashboard.stop()
+    if arm_engine is not None:
+        arm_engine.stop()
+        print(f"\narm loop: {arm_engine.rate_hz():.0f} Hz, {arm_engine.overruns} overruns")
+    # Compare DISPLAY_MODE = "legacy" and "dashboard": `work` is the time spent per tick before waiting
+    print(f"\n[{DISPLAY_MODE}] {loop_timer.summary()}")
@@ -0,0 +1,181 @@
+"""Integrity check of the capture timestamps recorded next to the nominal `timestamp` column.
+
+`record.py` (`RECORD_CAPTURE_TIMESTAMPS = True`) saves, for every frame, when each sensor captured it
+(`capture_timestamp.arm`, `capture_timestamp.<camera>`, in seconds since the episode start), while
+`timestamp` stays `frame_index / fps`. The arm time is the one its state was sampled at, the camera
+time the one the camera reader thread received the frame at (`PIPERFollower.camera_frame_times`, a
+few ms after the exposure) rather than when the control loop read it, so that the gaps and
+duplicates below come from the camera and not from the loop jitter. This script loads these columns
+for all the episodes at once and indexes, with vectorized NumPy:
+
+- gaps:       consecutive reads of a sensor more than `gap_factor` periods apart (dropped frames),
+- duplicates: consecutive reads less than `dup_factor` periods apart (a frame read twice),
+- skew:       frames whose sensors were read more than `max_skew_ms` apart,
+- drift:      how far the capture clock is behind the nominal timestamps at the end of the episode.
+
+The event index is written to `meta/timestamp_index.parquet`. With `--write_mask`, a boolean mask
+over the `index` column is written to `meta/frame_mask.npy`, masking the frames whose action
+horizon (`--before_s`) or observation history (`--after_s`) overlaps an event. Train without them with
+`python -m train.train_dp ... --frame_mask <dataset>/meta/frame_mask.npy`.
+
+    python -m data.timestamp_check --dataset_path test2/piper_test86 --write_mask
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from lerobot.datasets.lerobot_dataset import LeRobotDatasetMetadata
+
+CAPTURE_TIMESTAMP_PREFIX = "capture_timestamp."
+TIMESTAMP_INDEX_PATH = "meta/timestamp_index.parquet"
+FRAME_MASK_PATH = "meta/frame_mask.npy"
+
+
+def capture_timestamp_features(sensors: list[str]) -> dict[str, dict]:
+    return {
+        f"{CAPTURE_TIMESTAMP_PREFIX}{sensor}": {"dtype": "float64", "shape": (1,), "names": None}
+        for sensor in sensors
+    }
+
+
+def capture_timestamp_frame(sensor_times: dict[str, float], start_episode_t: float) -> dict[str, np.ndarray]:
+    """Frame columns from `time.perf_counter()` capture times, relative to the episode start."""
+    return {
+        f"{CAPTURE_TIMESTAMP_PREFIX}{sensor}": np.array([t - start_episode_t], dtype=np.float64)
+        for sensor, t in sensor_times.items()
+    }
+
+
+def load_capture_timestamps(meta: LeRobotDatasetMetadata) -> pd.DataFrame:
+    """`index`, `episode_index`, `timestamp` and one column per sensor for every frame, sorted by `index`."""
+    sensor_keys = [key for key in meta.features if key.startswith(CAPTURE_TIMESTAMP_PREFIX)]
+    if not sensor_keys:
+        raise ValueError(f"No {CAPTURE_TIMESTAMP_PREFIX}* column in {meta.root}, record with RECORD_CAPTURE_TIMESTAMPS.")
+    columns = ["index", "episode_index", "timestamp", *sensor_keys]
+    frames = []
+    for ep_idx in range(meta.total_episodes):
+        df = pd.read_parquet(meta.root / meta.get_data_file_path(ep_idx), columns=columns)
+        for key in sensor_keys:
+            df[key] = np.concatenate(df[key].to_numpy())
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True).sort_values("index", ignore_index=True)
+    return df.rename(columns={key: key[len(CAPTURE_TIMESTAMP_PREFIX):] for key in sensor_keys})
+
+
+def find_events(
+    df: pd.DataFrame, fps: int, gap_factor: float = 1.5, dup_factor: float = 0.5, max_skew_s: float | None = None
+) -> pd.DataFrame:
+    """
+    One row per event: `kind` ("gap", "duplicate", "skew"), `sensor`, `position` (row of `df`), `index`,
+    `episode_index`, `value_s` (time since the previous read, or the skew) and `dropped` (frames lost
+    in a gap).
+    """
+    period = 1 / fps
+    max_skew_s = 0.5 * period if max_skew_s is None else max_skew_s
+    sensors = [c for c in df.columns if c not in ["index", "episode_index", "timestamp"]]
+    episode_index = df["episode_index"].to_numpy()
+    same_episode = episode_index[1:] == episode_index[:-1]
+
+    events = []
+    for sensor in sensors:
+        dt = np.diff(df[sensor].to_numpy())
+        for kind, flags in [("gap", dt > gap_factor * period), ("duplicate", dt < dup_factor * period)]:
+            position = np.flatnonzero(same_episode & flags) + 1
+            value_s = dt[position - 1]
+            events.append(
+                pd.DataFrame(
+                    {
+                        "kind": kind,
+                        "sensor": sensor,
+                        "position": position,
+                        "value_s": value_s,
+                        "dropped": np.maximum(np.round(value_s * fps).astype(np.int64) - 1, 0),
+                    }
+                )
+            )
+
+    times = df[sensors].to_numpy()
+    skew = times.max(axis=1) - times.min(axis=1)
+    position = np.flatnonzero(skew > max_skew_s)
+    # The sensor read last is the one lagging behind.
+    late = np.asarray(sensors)[times[position].argmax(axis=1)] if len(position) else []
+    events.append(pd.DataFrame({"kind": "skew", "sensor": late, "position": position, "value_s": skew[position], "dropped": 0}))
+
+    events = pd.concat(events, ignore_index=True).sort_values("position", ignore_index=True)
+    events["index"] = df["index"].to_numpy()[events["position"]]
+    events["episode_index"] = episode_index[events["position"]]
+    return events
+
+
+def summarize_episodes(df: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
+    sensors = [c for c in df.columns if c not in ["index", "episode_index", "timestamp"]]
+    last = df.groupby("episode_index").tail(1).set_index("episode_index")
+    first = df.groupby("episode_index").head(1).set_index("episode_index")
+    # Capture clock minus nominal clock at the last frame, for the slowest sensor.
+    drift = (last[sensors].max(axis=1) - first[sensors].min(axis=1)) - (last["timestamp"] - first["timestamp"])
+    counts = events.pivot_table(index="episode_index", columns="kind", values="position", aggfunc="count")
+    summary = pd.DataFrame({"frames": df.groupby("episode_index").size(), "drift_s": drift})
+    summary = summary.join(counts.reindex(columns=["gap", "duplicate", "skew"])).fillna(0)
+    summary["dropped"] = events[events["kind"] == "gap"].groupby("episode_index")["dropped"].sum()
+    skew = events[events["kind"] == "skew"].groupby("episode_index")["value_s"].max()
+    summary["max_skew_ms"] = 1e3 * skew
+    return summary.fillna(0)
+
+
+def make_frame_mask(df: pd.DataFrame, events: pd.DataFrame, fps: int, before_s: float, after_s: float) -> np.ndarray:
+    """
+    Boolean mask over the `index` column, False for the frames less than `before_s` before or
+    `after_s` after an event.
+    """
+    n = len(df)
+    before = int(np.ceil(before_s * fps))
+    after = int(np.ceil(after_s * fps))
+    position = events["position"].to_numpy()
+    # +1 / -1 at the window bounds, the running sum is > 0 inside a window.
+    bounds = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(bounds, np.clip(position - before, 0, n), 1)
+    np.add.at(bounds, np.clip(position + after + 1, 0, n), -1)
+    valid = np.cumsum(bounds)[:n] == 0
+
+    index = df["index"].to_numpy()
+    frame_mask = np.ones(index.max() + 1, dtype=bool)
+    frame_mask[index] = valid
+    return frame_mask
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_path", type=str, help="Path to the dataset.", required=True)
+    parser.add_argument("--gap_factor", type=float, help="Gap above this many frame periods.", default=1.5)
+    parser.add_argument("--dup_factor", type=float, help="Duplicate below this many frame periods.", default=0.5)
+    parser.add_argument("--max_skew_ms", type=float, help="Skew between sensors (default: half a period).", default=None)
+    parser.add_argument("--write_mask", action="store_true", help=f"Write the frame mask to {FRAME_MASK_PATH}.")
+    parser.add_argument("--before_s", type=float, help="Mask frames this long before an event (action horizon).", default=1.5)
+    parser.add_argument("--after_s", type=float, help="Mask frames this long after an event (observation history).", default=0.1)
+    args = parser.parse_args()
+
+    meta = LeRobotDatasetMetadata(args.dataset_path)
+    df = load_capture_timestamps(meta)
+    events = find_events(
+        df,
+        meta.fps,
+        gap_factor=args.gap_factor,
+        dup_factor=args.dup_factor,
+        max_skew_s=args.max_skew_ms / 1e3 if args.max_skew_ms is not None else None,
+    )
+    events.to_parquet(meta.root / TIMESTAMP_INDEX_PATH)
+
+    summary = summarize_episodes(df, events)
+    print(summary.to_string(float_format=lambda x: f"{x:.3f}"))
+    print(
+        f"\n{len(df)} frames, {len(summary)} episodes: {int(summary['gap'].sum())} gaps "
+        f"({int(summary['dropped'].sum())} dropped frames), {int(summary['duplicate'].sum())} duplicates, "
+        f"{int(summary['skew'].sum())} skewed frames. Index written to {meta.root / TIMESTAMP_INDEX_PATH}"
+    )
+
+    if args.write_mask:
+        frame_mask = make_frame_mask(df, events, meta.fps, args.before_s, args.after_s)
+        np.save(meta.root / FRAME_MASK_PATH, frame_mask)
+        print(f"{int((~frame_mask).sum())} of {len(frame_mask)} frames masked, written to {meta.root / FRAME_MASK_PATH}")
@@ -1,5 +1,8 @@
 import random
 import argparse
+import time
+from collections import deque
+from dataclasses import dataclass
 from typing import Any, Dict
 
 import torch
@@ -7,7 +10,8 @@ import zmq
 import numpy as np
 
 from lerobot.datasets.lerobot_dataset import LeRobotDataset
-from deploy.web_utils import TorchSerializer
+from deploy.session import SessionGapError
+from deploy.web_utils import RequestDroppedError, TorchSerializer, is_dropped_reply
 
 
 class BaseInferenceClient:
@@ -16,6 +20,7 @@ class BaseInferenceClient:
         self.host = host
         self.port = port
         self.timeout_ms = timeout_ms
+        self.bytes_sent = 0
         self._init_socket()
 
     def _init_socket(self):
@@ -37,8 +42,34 @@ class BaseInferenceClient:
         """
         self.call_endpoint("kill", requires_input=False)
 
+    def server_stats(self) -> dict:
+        """Requests served and dropped (stale, deadline) by the server."""
+        return self.call_endpoint("server_stats", requires_input=False)
+
+    def _make_request(
+        self, endpoint: str, data: dict | None, requires_input: bool, deadline_s: float | None
+    ) -> bytes:
+        request: dict = {"endpoint": endpoint}
+        if requires_input:
+            request["data"] = data
+        if deadline_s is not None:
+            request["deadline"] = time.time() + deadline_s
+
+        payload = TorchSerializer.to_bytes(request)
+        self.bytes_sent += len(payload)
+        return payload
+
+    @staticmethod
+    def _parse_reply(message: bytes):
+        if message == b"ERROR":
+            raise RuntimeError("Server error")
+        reply = TorchSerializer.from_bytes(message)
+        if is_dropped_reply(reply):
+            raise RequestDroppedError(reply["dropped"])
+        return reply
+
     def call_endpoint(
-        self, endpoint: str, data: dict | None = None, requires_input: bool = True
+        self, endpoint: str, data: dict | None = None, requires_input: bool = True, deadline_s: float | None = None
     ) -> dict:
         """
         Call an endpoint on the server.
@@ -47,16 +78,11 @@ class BaseInferenceClient:
             endpoint: The name of the endpoint.
             data: The input data for the endpoint.
             requires_input: Whether the endpoint requires input data.
+            deadline_s: The server skips the request if it cannot start it within this delay, and
+                `RequestDroppedError` is raised.
         """
-        request: dict = {"endpoint": endpoint}
-        if requires_input:
-            request["data"] = data
-
-        self.socket.send(TorchSerializer.to_bytes(request))
-        message = self.socket.recv()
-        if message == b"ERROR":
-            raise RuntimeError("Server error")
-        return TorchSerializer.from_bytes(message)
+        self.socket.send(self._make_request(endpoint, data, requires_input, deadline_s))
+        return self._parse_reply(self.socket.recv())
 
     def __del__(self):
         """Cleanup resources on destruction"""
@@ -77,6 +103,139 @@ class ExternalRobotInferenceClient(BaseInferenceClient):
         """
         return self.call_endpoint("get_action", observations)
 
+    def predict_chunk(self, observations: Dict[str, Any]) -> torch.Tensor:
+        """
+        Get the action chunks for a batch of observation histories, without touching the
+        policy queues on the server.
+        """
+        return self.call_endpoint("predict_chunk", observations)
+
+    def load_model(self, model_path: str) -> dict:
+        """
+        Ask the server to load, warm up and swap in the checkpoint at `model_path` (a path on the
+        server). Returns immediately, `model_info` tells when the swap is done.
+        """
+        return self.call_endpoint("load_model", {"model_path": model_path})
+
+    def model_info(self) -> dict:
+        """Current checkpoint, checkpoint being loaded, last load error and swap count."""
+        return self.call_endpoint("model_info", requires_input=False)
+
+
+class SessionInferenceClient(ExternalRobotInferenceClient):
+    """
+    Streaming client: sends only the newest observation of every tick, the server keeps the history
+    of the session (see `deploy/session.py`). Timesteps are numbered by the caller (e.g. the frame
+    index of the control loop) or incremented automatically.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 5555, gap_policy: str = "fill", session_id: str | None = None):
+        super().__init__(host, port)
+        self.gap_policy = gap_policy
+        self.open_session(session_id)
+
+    def open_session(self, session_id: str | None = None):
+        """(Re)open the session, the server history starts empty."""
+        reply = self.call_endpoint("open_session", {"session_id": session_id, "gap_policy": self.gap_policy})
+        self.session_id = reply["session_id"]
+        self.n_obs_steps = reply["n_obs_steps"]
+        self.history_stride = reply["history_stride"]
+        self.timestep = -1
+
+    def step(self, observation: Dict[str, torch.Tensor], timestep: int | None = None) -> torch.Tensor:
+        """
+        `observation` holds unbatched tensors of the newest frame, images may be uint8. Returns the
+        action for `timestep`. Raises `SessionGapError` if the server rejected the timestep.
+        """
+        self.timestep = self.timestep + 1 if timestep is None else timestep
+        reply = self.call_endpoint(
+            "step", {"session_id": self.session_id, "timestep": self.timestep, "observation": observation}
+        )
+        if "rejected" in reply:
+            raise SessionGapError(reply["rejected"])
+        return reply["action"]
+
+    def cache_stats(self) -> dict:
+        """Hit rate and encoder time saved by the server feature cache."""
+        return self.call_endpoint("cache_stats", requires_input=False)
+
+    def close_session(self) -> dict:
+        """Server-side stats of the session (steps, inferences, gaps, bytes received, inference time)."""
+        return self.call_endpoint("close_session", {"session_id": self.session_id})
+
+
+@dataclass
+class StreamReply:
+    request_id: int
+    sent_t: float
+    received_t: float
+    result: Any = None
+    # "stale", "deadline" or "error" when there is no result
+    dropped: str | None = None
+
+
+class StreamingInferenceClient(BaseInferenceClient):
+    """
+    Pipelined client: `submit` returns immediately, so a control loop can send its newest
+    observation every tick without waiting for the previous inference. Against a server with
+    `overload_policy="latest"`, the observations the server could not keep up with are dropped as
+    stale instead of queuing. The server answers the requests of a client in the order they were
+    sent (a superseded request is answered before the one superseding it), which `poll` relies on.
+    """
+
+    def _init_socket(self):
+        self.socket = self.context.socket(zmq.DEALER)
+        # Do not block the exit on the requests the server will never read.
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(f"tcp://{self.host}:{self.port}")
+        self.in_flight: deque[tuple[int, float]] = deque()
+        self.next_request_id = 0
+
+    def submit(
+        self, endpoint: str, data: dict | None = None, requires_input: bool = True, deadline_s: float | None = None
+    ) -> int:
+        payload = self._make_request(endpoint, data, requires_input, deadline_s)
+        # Same envelope as a REQ socket, for REP and ROUTER servers alike.
+        self.socket.send_multipart([b"", payload])
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        self.in_flight.append((request_id, time.perf_counter()))
+        return request_id
+
+    def poll(self, timeout_ms: int = 0) -> list[StreamReply]:
+        """Replies received so far, waiting up to `timeout_ms` for the first one."""
+        replies = []
+        while self.in_flight and self.socket.poll(timeout_ms if not replies else 0):
+            message = self.socket.recv_multipart()[-1]
+            request_id, sent_t = self.in_flight.popleft()
+            reply = StreamReply(request_id, sent_t, time.perf_counter())
+            try:
+                reply.result = self._parse_reply(message)
+            except RequestDroppedError as e:
+                reply.dropped = e.reason
+            except RuntimeError:
+                reply.dropped = "error"
+            replies.append(reply)
+        return replies
+
+    def call_endpoint(
+        self, endpoint: str, data: dict | None = None, requires_input: bool = True, deadline_s: float | None = None
+    ) -> dict:
+        """Blocking call, the replies of the requests submitted before it are discarded."""
+        request_id = self.submit(endpoint, data, requires_input, deadline_s)
+        while True:
+            replies = self.poll(self.timeout_ms)
+            if not replies:
+                raise TimeoutError(f"No reply to {endpoint} within {self.timeout_ms} ms")
+            for reply in replies:
+                if reply.request_id != request_id:
+                    continue
+                if reply.dropped == "error":
+                    raise RuntimeError("Server error")
+                if reply.dropped is not None:
+                    raise RequestDroppedError(reply.dropped)
+                return reply.result
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
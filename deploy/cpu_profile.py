@@ -0,0 +1,242 @@
+"""CPU deployment profile of the diffusion policy: threads, core pinning and int8 quantization.
+
+On a machine without GPU, `deploy/server.py --cpu_profile profile.json` applies a `CPUProfile`
+before serving:
+
+- `cpu_cores` pins the server process to these cores (the cameras keep the others), and
+  `num_threads` / `num_interop_threads` size the torch thread pools (default: one intra-op thread
+  per pinned core).
+- `quantization="dynamic"` converts every `nn.Linear` (UNet timestep MLP and FiLM encoders, image
+  feature projection) to int8 with activations quantized on the fly. PyTorch has no dynamic
+  quantization of convolutions.
+- `quantization="static"` also converts the convolutions of the ResNet backbone and the
+  Conv1d-GroupNorm blocks of the UNet to int8 with FX graph mode post-training quantization. The
+  activation ranges are calibrated by running the policy on `calibration_episodes` of
+  `dataset_path`, through the whole denoising loop.
+
+Example profile:
+
+    {"num_threads": 4, "cpu_cores": [4, 5, 6, 7], "quantization": "static", "backend": "x86",
+     "dataset_path": "test2/piper_test86", "calibration_episodes": [0, 1, 2]}
+
+Latency and accuracy against the fp32 model on recorded episodes, with the same diffusion noise for
+both models:
+
+    python -m deploy.cpu_profile --model_path ... --profile profile.json --episodes 40 41 42
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import torch
+from torch import nn
+
+from deploy.evaluate_offline import interleaved_indices, make_eval_dataset, print_report, summarize
+from deploy.warmup import InputBuffers
+from train.evaluate import action_window, predict_action_chunk
+
+QUANTIZATION_MODES = ["none", "dynamic", "static"]
+
+
+@dataclass
+class CPUProfile:
+    num_threads: int | None = None
+    num_interop_threads: int | None = None
+    cpu_cores: list[int] | None = None
+    quantization: str = "dynamic"
+    # "x86" (fbgemm) on Intel/AMD, "qnnpack" on ARM boxes
+    backend: str = "x86"
+    dataset_path: str | None = None
+    calibration_episodes: list[int] = field(default_factory=lambda: [0])
+    calibration_batches: int = 16
+
+    def __post_init__(self):
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization: {self.quantization}. Available: {QUANTIZATION_MODES}")
+        if self.quantization == "static" and self.dataset_path is None:
+            raise ValueError("Static quantization needs a `dataset_path` to calibrate on.")
+
+    @classmethod
+    def from_json(cls, path: str) -> "CPUProfile":
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+def apply_cpu_profile(profile: CPUProfile):
+    """Process-wide settings, call before the first inference."""
+    if profile.cpu_cores:
+        os.sched_setaffinity(0, profile.cpu_cores)
+    num_threads = profile.num_threads or (len(profile.cpu_cores) if profile.cpu_cores else None)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if profile.num_interop_threads:
+        try:
+            torch.set_num_interop_threads(profile.num_interop_threads)
+        except RuntimeError:
+            # Only possible before the inter-op pool is started.
+            logging.warning("The inter-op thread pool is already running, num_interop_threads is ignored.")
+    torch.backends.quantized.engine = profile.backend
+    print(
+        f"CPU profile: cores {sorted(os.sched_getaffinity(0))}, {torch.get_num_threads()} intra-op threads, "
+        f"{torch.get_num_interop_threads()} inter-op threads, quantization {profile.quantization} ({profile.backend})"
+    )
+
+
+def _rgb_encoders(policy) -> list[nn.Module]:
+    encoder = policy.diffusion.rgb_encoder
+    return list(encoder) if isinstance(encoder, nn.ModuleList) else [encoder]
+
+
+def _conv_blocks(policy) -> list[nn.Module]:
+    from lerobot.policies.diffusion.modeling_diffusion import DiffusionConv1dBlock
+
+    return [m for m in policy.diffusion.unet.modules() if isinstance(m, DiffusionConv1dBlock)]
+
+
+def prepare_static(policy, backend: str):
+    """Replace the backbones and the UNet conv blocks by FX graph modules with observers."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    config = policy.config
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    image_shape = next(iter(config.image_features.values())).shape
+    crop_shape = config.crop_shape if config.crop_shape is not None else image_shape[1:]
+    for encoder in _rgb_encoders(policy) if config.image_features else []:
+        example = (torch.randn(1, image_shape[0], *crop_shape),)
+        encoder.backbone = prepare_fx(encoder.backbone, qconfig_mapping, example)
+    for block in _conv_blocks(policy):
+        example = (torch.randn(1, block.block[0].in_channels, config.horizon),)
+        block.block = prepare_fx(block.block, qconfig_mapping, example)
+
+
+def convert_static(policy):
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    for encoder in _rgb_encoders(policy) if policy.config.image_features else []:
+        encoder.backbone = convert_fx(encoder.backbone)
+    for block in _conv_blocks(policy):
+        block.block = convert_fx(block.block)
+
+
+def calibrate(policy, profile: CPUProfile):
+    dataset, observation_keys = make_eval_dataset(profile.dataset_path)
+    sampler = torch.utils.data.SubsetRandomSampler(
+        interleaved_indices(dataset.episode_data_index, profile.calibration_episodes)
+    )
+    dataloader = torch.utils.data.DataLoader(dataset, batch_size=8, sampler=sampler, num_workers=2)
+    input_buffers = InputBuffers(torch.device("cpu"))
+    for i, batch in enumerate(dataloader):
+        if i >= profile.calibration_batches:
+            break
+        predict_action_chunk(policy, input_buffers.load({key: batch[key] for key in observation_keys}))
+
+
+def quantize_policy(policy, profile: CPUProfile):
+    """Quantize the eval-mode, CPU `policy` in place as configured by `profile`."""
+    policy.eval()
+    if profile.quantization == "static":
+        prepare_static(policy, profile.backend)
+        calibrate(policy, profile)
+        convert_static(policy)
+    if profile.quantization in ["dynamic", "static"]:
+        torch.ao.quantization.quantize_dynamic(policy.diffusion, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return policy
+
+
+def load_fp32_policy(model_path: str):
+    from lerobot.policies.diffusion.modeling_diffusion import DiffusionPolicy
+
+    policy = DiffusionPolicy.from_pretrained(model_path)
+    policy.config.device = "cpu"
+    return policy.to("cpu").eval()
+
+
+def load_cpu_policy(model_path: str, profile: CPUProfile):
+    apply_cpu_profile(profile)
+    return quantize_policy(load_fp32_policy(model_path), profile)
+
+
+def compare(fp32_policy, quantized_policy, dataloader, observation_keys: list[str], joint_names: list[str]) -> dict:
+    """Reports of both models against the ground truth, and the int8 - fp32 deviation of the chunks."""
+    results = {"fp32": ([], []), "int8": ([], [])}
+    deviations, valid, batch_sizes = [], [], []
+    input_buffers = InputBuffers(torch.device("cpu"))
+    for i, batch in enumerate(dataloader):
+        observations = input_buffers.load({key: batch[key] for key in observation_keys})
+        gt, gt_valid = action_window(batch, fp32_policy.config.n_obs_steps, fp32_policy.config.n_action_steps)
+        preds = {}
+        for name, policy in [("fp32", fp32_policy), ("int8", quantized_policy)]:
+            # Same initial noise and scheduler noise for both models.
+            torch.manual_seed(i)
+            start = time.perf_counter()
+            preds[name] = predict_action_chunk(policy, observations)
+            results[name][0].append(time.perf_counter() - start)
+            results[name][1].append((preds[name] - gt).numpy())
+        deviations.append((preds["int8"] - preds["fp32"]).numpy())
+        valid.append(gt_valid.numpy())
+        batch_sizes.append(len(gt))
+
+    valid = np.concatenate(valid)
+    # The first batch pays for the warm-up and is not representative.
+    skip = 1 if len(batch_sizes) > 1 else 0
+    reports = {
+        name: summarize(
+            np.concatenate(errors), valid, np.asarray(latencies_s[skip:]), np.asarray(batch_sizes[skip:]), joint_names
+        )
+        for name, (latencies_s, errors) in results.items()
+    }
+    deviation = summarize(
+        np.concatenate(deviations), valid, np.asarray(results["int8"][0][skip:]), np.asarray(batch_sizes[skip:]), joint_names
+    )
+    reports["int8_vs_fp32"] = deviation["per_joint"]
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", type=str, help="Checkpoint to quantize.", required=True)
+    parser.add_argument("--profile", type=str, help="CPUProfile as JSON.", required=True)
+    parser.add_argument("--dataset_path", type=str, help="Dataset of the evaluated episodes (default: the profile's).", default=None)
+    parser.add_argument("--episodes", type=int, nargs="+", help="Held-out episodes to replay.", required=True)
+    parser.add_argument("--batch_size", type=int, help="Timesteps per inference (1 as in the server).", default=1)
+    parser.add_argument("--frame_stride", type=int, help="Evaluate every N-th timestep.", default=10)
+    parser.add_argument("--output", type=str, help="Write the reports as JSON to this file.", default=None)
+    args = parser.parse_args()
+
+    profile = CPUProfile.from_json(args.profile)
+    apply_cpu_profile(profile)
+    fp32_policy = load_fp32_policy(args.model_path)
+    quantized_policy = quantize_policy(copy.deepcopy(fp32_policy), profile)
+
+    dataset, observation_keys = make_eval_dataset(args.dataset_path or profile.dataset_path)
+    dataloader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        sampler=interleaved_indices(dataset.episode_data_index, args.episodes, args.frame_stride),
+        num_workers=2,
+    )
+    reports = compare(fp32_policy, quantized_policy, dataloader, observation_keys, dataset.features["action"]["names"])
+    for name in ["fp32", "int8"]:
+        print(f"\n=== {name} ===")
+        print_report(reports[name])
+
+    fp32_latency = reports["fp32"]["latency_ms"]["mean"]
+    int8_latency = reports["int8"]["latency_ms"]["mean"]
+    fp32_rmse = np.mean([e["rmse"] for e in reports["fp32"]["per_joint"].values()])
+    int8_rmse = np.mean([e["rmse"] for e in reports["int8"]["per_joint"].values()])
+    deviation_rmse = np.mean([e["rmse"] for e in reports["int8_vs_fp32"].values()])
+    print(
+        f"\nlatency {fp32_latency:.1f}ms -> {int8_latency:.1f}ms ({fp32_latency / int8_latency:.2f}x) | "
+        f"RMSE to ground truth {fp32_rmse:.3f} -> {int8_rmse:.3f} | RMSE int8 vs fp32 {deviation_rmse:.3f}"
+    )
+    if args.output is not None:
+        reports["profile"] = asdict(profile)
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=4)
@@ -0,0 +1,170 @@
+"""Offline evaluation of a policy against recorded episodes.
+
+Replays whole held-out episodes through the inference server (`predict_chunk` endpoint) or through
+an in-process policy (`--local`), compares the predicted chunks to the ground-truth `action`
+windows and records the latency of every request. Batches interleave the timesteps of all the
+evaluated episodes. The dataset workers hand out uint8 images, which are sent as such to the server
+and converted to float on the device in `--local` mode. Running once against the server and once with `--local` on the same machine
+isolates the network and serialization overhead.
+
+    python -m deploy.evaluate_offline --dataset_path ... --episodes 40 41 42 --host localhost
+    python -m deploy.evaluate_offline --dataset_path ... --episodes 40 41 42 --local --model_path ...
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from lerobot.datasets.lerobot_dataset import LeRobotDataset, LeRobotDatasetMetadata
+
+from deploy.warmup import InputBuffers
+from train.evaluate import action_window, predict_action_chunk
+from train.preprocess import ToUint8
+
+
+def interleaved_indices(
+    episode_data_index: dict[str, torch.Tensor], episodes: list[int], frame_stride: int = 1
+) -> list[int]:
+    """
+    Dataset indices of `episodes` ordered timestep by timestep across them, so every batch mixes
+    episodes. `episode_data_index` is the one of the dataset on all the episodes.
+    """
+    starts = episode_data_index["from"][episodes].numpy()
+    lengths = episode_data_index["to"][episodes].numpy() - starts
+    indices = []
+    for t in range(0, int(lengths.max()), frame_stride):
+        indices.extend((starts[lengths > t] + t).tolist())
+    return indices
+
+
+def make_eval_dataset(dataset_path: str) -> tuple[LeRobotDataset, list[str]]:
+    """
+    The dataset with the same history and horizon as in training (see train/train_dp.py), uint8
+    images, and the observation keys. All the episodes are loaded: lerobot looks the episode bounds
+    up by `episode_index`, so a dataset on a subset of the episodes other than a prefix cannot use
+    `delta_timestamps`. Select the evaluated ones with `interleaved_indices`.
+    """
+    dataset_metadata = LeRobotDatasetMetadata(dataset_path)
+    delta_timestamps = {
+        "observation.state": [-0.1, 0.0],
+        "action": [-0.1, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4],
+    }
+    for key in dataset_metadata.camera_keys:
+        delta_timestamps[key] = [-0.1, 0.0]
+    dataset = LeRobotDataset(dataset_path, delta_timestamps=delta_timestamps, image_transforms=ToUint8())
+    return dataset, ["observation.state", *dataset_metadata.camera_keys]
+
+
+def summarize(errors: np.ndarray, valid: np.ndarray, latencies_s: np.ndarray, batch_sizes: np.ndarray, joint_names: list[str]) -> dict:
+    """
+    `errors` is `(N, n_action_steps, action_dim)` predicted minus ground truth, `valid` its `(N, n_action_steps)`
+    mask (padded actions at the end of the episodes are ignored).
+    """
+    mask = valid[..., None].astype(np.float64)
+    count = np.maximum(mask.sum(axis=(0, 1)), 1)
+    mae = (np.abs(errors) * mask).sum(axis=(0, 1)) / count
+    rmse = np.sqrt((errors**2 * mask).sum(axis=(0, 1)) / count)
+    # Error growth along the chunk: RMSE over all joints at every step of the horizon.
+    step_count = np.maximum(valid.sum(axis=0), 1)
+    rmse_per_step = np.sqrt((errors**2 * mask).mean(axis=2).sum(axis=0) / step_count)
+    return {
+        "num_samples": int(errors.shape[0]),
+        "per_joint": {name: {"mae": float(m), "rmse": float(r)} for name, m, r in zip(joint_names, mae, rmse)},
+        "rmse_per_chunk_step": rmse_per_step.tolist(),
+        "latency_ms": {
+            "mean": float(1e3 * latencies_s.mean()),
+            "p50": float(1e3 * np.percentile(latencies_s, 50)),
+            "p90": float(1e3 * np.percentile(latencies_s, 90)),
+            "p99": float(1e3 * np.percentile(latencies_s, 99)),
+            "per_sample_mean": float(1e3 * (latencies_s / batch_sizes).mean()),
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"\nsamples: {report['num_samples']}")
+    name_len = max(len(name) for name in report["per_joint"])
+    print(f"{'JOINT':<{name_len}} | {'MAE':>10} | {'RMSE':>10}")
+    for name, errors in report["per_joint"].items():
+        print(f"{name:<{name_len}} | {errors['mae']:>10.3f} | {errors['rmse']:>10.3f}")
+    print("RMSE along the chunk: " + " ".join(f"{x:.2f}" for x in report["rmse_per_chunk_step"]))
+    latency = report["latency_ms"]
+    print(
+        f"latency per request: mean {latency['mean']:.1f}ms p50 {latency['p50']:.1f}ms "
+        f"p90 {latency['p90']:.1f}ms p99 {latency['p99']:.1f}ms | per sample {latency['per_sample_mean']:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_path", type=str, help="Path to the dataset.", required=True)
+    parser.add_argument("--episodes", type=int, nargs="+", help="Held-out episodes to replay.", required=True)
+    parser.add_argument("--batch_size", type=int, help="Timesteps per request.", default=32)
+    parser.add_argument("--frame_stride", type=int, help="Evaluate every N-th timestep.", default=1)
+    parser.add_argument("--host", type=str, help="Host address for the server.", default="localhost")
+    parser.add_argument("--port", type=int, help="Port number for the server.", default=5555)
+    parser.add_argument("--local", action="store_true", help="Run the policy in-process instead of the server.")
+    parser.add_argument("--model_path", type=str, help="Checkpoint for --local.", default=None)
+    parser.add_argument("--device", type=str, help="Device for --local.", default="cuda")
+    parser.add_argument("--num_workers", type=int, help="Dataset workers decoding the frames.", default=4)
+    parser.add_argument("--output", type=str, help="Write the report as JSON to this file.", default=None)
+    args = parser.parse_args()
+
+    dataset, observation_keys = make_eval_dataset(args.dataset_path)
+
+    if args.local:
+        from lerobot.policies.diffusion.modeling_diffusion import DiffusionPolicy
+
+        device = torch.device(args.device)
+        policy = DiffusionPolicy.from_pretrained(args.model_path).to(device).eval()
+        input_buffers = InputBuffers(device)
+
+        def predict(observations):
+            actions = predict_action_chunk(policy, input_buffers.load(observations))
+            return actions.cpu()
+    else:
+        from deploy.client import ExternalRobotInferenceClient
+
+        client = ExternalRobotInferenceClient(host=args.host, port=args.port)
+
+        def predict(observations):
+            return client.predict_chunk(observations)
+
+    dataloader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        sampler=interleaved_indices(dataset.episode_data_index, args.episodes, args.frame_stride),
+        num_workers=args.num_workers,
+    )
+    errors, valid, latencies_s, batch_sizes = [], [], [], []
+    for i, batch in enumerate(dataloader):
+        observations = {key: batch[key] for key in observation_keys}
+        start = time.perf_counter()
+        pred = predict(observations)
+        latency_s = time.perf_counter() - start
+
+        # The chunk starts at the last observation step.
+        gt, gt_valid = action_window(batch, batch["observation.state"].shape[1], pred.shape[1])
+        errors.append((pred.float() - gt).numpy())
+        valid.append(gt_valid.numpy())
+        # The first request pays for the warm-up and is not representative.
+        if i > 0:
+            latencies_s.append(latency_s)
+            batch_sizes.append(len(pred))
+
+    report = summarize(
+        np.concatenate(errors),
+        np.concatenate(valid),
+        np.asarray(latencies_s if latencies_s else [latency_s]),
+        np.asarray(batch_sizes if batch_sizes else [len(pred)]),
+        dataset.features["action"]["names"],
+    )
+    report["mode"] = "local" if args.local else f"server {args.host}:{args.port}"
+    report["episodes"] = args.episodes
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
@@ -0,0 +1,144 @@
+"""Cache of the vision encoder outputs across the inference calls of a session.
+
+`DiffusionModel._prepare_global_conditioning` encodes every frame of the history through the ResNet
+backbone. `predict_action_chunk_cached` does the same conditioning but looks the per-frame image
+features up in a `FeatureCache` keyed by `(session_id, timestep)` and only encodes the frames it has
+not seen. In eval mode the encoder is deterministic (center crop), so the cached features are exact.
+
+A session runs the policy once per chunk (`n_action_steps` ticks), so two inferences have no frame
+in common and the history of an inference only hits the cache if its older frames were encoded when
+they arrived: `SessionManager.step` calls `prefetch_frame_features` on the ticks answered from the
+chunk for the frames the next history will need. With `n_obs_steps = 2` the inference then encodes
+only its newest frame, the other one was encoded on an earlier tick that did not run the policy.
+"""
+
+import time
+from collections import OrderedDict
+
+import torch
+
+OBS_STATE = "observation.state"
+OBS_ENV_STATE = "observation.environment_state"
+
+
+class FeatureCache:
+    """
+    Bounded LRU of per-frame image features, `(num_cameras * feature_dim,)` tensors concatenated in
+    the camera order of the policy.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.features: OrderedDict[tuple[str, int], torch.Tensor] = OrderedDict()
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.encode_s = 0.0
+        self.prefetched = 0
+        self.prefetch_s = 0.0
+
+    def get(self, session_id: str, timestep: int) -> torch.Tensor | None:
+        key = (session_id, timestep)
+        if key in self.features:
+            self.features.move_to_end(key)
+            return self.features[key]
+        return None
+
+    def put(self, session_id: str, timestep: int, features: torch.Tensor):
+        self.features[(session_id, timestep)] = features
+        self.features.move_to_end((session_id, timestep))
+        while len(self.features) > self.capacity:
+            self.features.popitem(last=False)
+
+    def drop_session(self, session_id: str):
+        for key in [key for key in self.features if key[0] == session_id]:
+            del self.features[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        encode_per_frame_s = self.encode_s / self.misses if self.misses else 0.0
+        saved_s = self.hits * encode_per_frame_s
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "encode_ms_per_frame": 1e3 * encode_per_frame_s,
+            # Encoder time the hits would have cost the inferences, at the measured cost of a miss.
+            "saved_ms": 1e3 * saved_s,
+            "saved_ms_per_request": 1e3 * saved_s / max(self.requests, 1),
+            # Frames encoded ahead on the ticks answered from a chunk, and what that cost there.
+            "prefetched": self.prefetched,
+            "prefetch_ms": 1e3 * self.prefetch_s,
+        }
+
+
+def encode_frames(policy, images: torch.Tensor) -> torch.Tensor:
+    """`(N, num_cameras, C, H, W)` normalized images to `(N, num_cameras * feature_dim)` features."""
+    diffusion = policy.diffusion
+    num_frames, num_cameras = images.shape[:2]
+    if policy.config.use_separate_rgb_encoder_per_camera:
+        features = [encoder(images[:, i]) for i, encoder in enumerate(diffusion.rgb_encoder)]
+        return torch.cat(features, dim=-1)
+    features = diffusion.rgb_encoder(images.flatten(0, 1))
+    return features.reshape(num_frames, num_cameras * features.shape[-1])
+
+
+@torch.inference_mode()
+def prefetch_frame_features(policy, observation: dict, session_id: str, timestep: int, cache: FeatureCache):
+    """Encode the images of `observation` (unbatched, on the policy device) unless `timestep` is cached."""
+    if (session_id, timestep) in cache.features:
+        return
+    start = time.perf_counter()
+    image_keys = list(policy.config.image_features)
+    batch = policy.normalize_inputs({key: observation[key].unsqueeze(0) for key in image_keys})
+    # (1, num_cameras, C, H, W)
+    encoded = encode_frames(policy, torch.stack([batch[key] for key in image_keys], dim=1))
+    cache.put(session_id, timestep, encoded[0])
+    if encoded.is_cuda:
+        torch.cuda.synchronize(encoded.device)
+    cache.prefetched += 1
+    cache.prefetch_s += time.perf_counter() - start
+
+
+@torch.inference_mode()
+def predict_action_chunk_cached(
+    policy, batch: dict, session_id: str, timesteps: list[int], cache: FeatureCache
+) -> torch.Tensor:
+    """
+    Same as `train.evaluate.predict_action_chunk` for a single history (`B = 1`), where `timesteps`
+    identify the `n_obs_steps` frames of the history.
+    """
+    batch = policy.normalize_inputs(batch)
+    config = policy.config
+
+    # A padded history repeats a timestep, encode it once.
+    unique = list(dict.fromkeys(timesteps))
+    cached = {t: cache.get(session_id, t) for t in unique}
+    missing = [t for t in unique if cached[t] is None]
+    cache.requests += 1
+    cache.hits += len(unique) - len(missing)
+    cache.misses += len(missing)
+    if missing:
+        start = time.perf_counter()
+        # (1, n_obs_steps, C, H, W) per camera -> (num_missing, num_cameras, C, H, W)
+        positions = [timesteps.index(t) for t in missing]
+        images = torch.stack([batch[key][0, positions] for key in config.image_features], dim=1)
+        encoded = encode_frames(policy, images)
+        for t, f in zip(missing, encoded):
+            cached[t] = f
+            cache.put(session_id, t, f)
+        if encoded.is_cuda:
+            torch.cuda.synchronize(encoded.device)
+        cache.encode_s += time.perf_counter() - start
+
+    img_features = torch.stack([cached[t] for t in timesteps]).unsqueeze(0)
+    global_cond_feats = [batch[OBS_STATE], img_features]
+    if config.env_state_feature:
+        global_cond_feats.append(batch[OBS_ENV_STATE])
+    global_cond = torch.cat(global_cond_feats, dim=-1).flatten(start_dim=1)
+
+    actions = policy.diffusion.conditional_sample(1, global_cond=global_cond)
+    start = config.n_obs_steps - 1
+    actions = actions[:, start : start + config.n_action_steps]
+    return policy.unnormalize_outputs({"action": actions})["action"]
@@ -0,0 +1,87 @@
+"""Simulated overload: a model slower than the control loop, served with each overload policy.
+
+The model sleeps `--model_ms` per request and the client submits its newest observation (its
+capture time) every `1 / --rate_hz` s, without waiting for the replies. With "fifo" the queue grows
+for the whole run and so does the age of the observations the actions are computed from; with
+"latest" the age stays around one or two inference times.
+
+    python -m deploy.overload_benchmark --model_ms 150 --rate_hz 30 --duration_s 10
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from deploy.client import StreamingInferenceClient
+from deploy.server import OVERLOAD_POLICIES, BaseInferenceServer
+
+
+def serve_slow_model(port: int, overload_policy: str, model_s: float):
+    server = BaseInferenceServer(port=port, overload_policy=overload_policy)
+
+    def slow_model(data: dict) -> dict:
+        time.sleep(model_s)
+        return {"capture_t": data["capture_t"]}
+
+    server.register_endpoint("get_action", slow_model)
+    server.run()
+
+
+def run_control_loop(port: int, rate_hz: float, duration_s: float, deadline_s: float | None) -> dict:
+    client = StreamingInferenceClient(port=port)
+    period = 1 / rate_hz
+    replies = []
+    start = next_t = time.perf_counter()
+    while next_t - start < duration_s:
+        client.submit("get_action", {"capture_t": time.perf_counter()}, deadline_s=deadline_s)
+        next_t += period
+        while (remaining := next_t - time.perf_counter()) > 0:
+            if client.in_flight:
+                replies += client.poll(int(1e3 * remaining) + 1)
+            else:
+                time.sleep(remaining)
+
+    served = [r for r in replies if r.dropped is None]
+    # Age of the observation behind an action, when the action reaches the robot.
+    ages_ms = 1e3 * np.array([r.received_t - r.result["capture_t"] for r in served])
+    return {
+        "submitted": client.next_request_id,
+        "served": len(served),
+        "stale": sum(r.dropped == "stale" for r in replies),
+        "deadline": sum(r.dropped == "deadline" for r in replies),
+        "unanswered": len(client.in_flight),
+        "age_mean_ms": ages_ms.mean() if len(ages_ms) else float("nan"),
+        "age_p95_ms": np.percentile(ages_ms, 95) if len(ages_ms) else float("nan"),
+        "age_last_ms": ages_ms[-1] if len(ages_ms) else float("nan"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, help="First port, one server per policy.", default=5600)
+    parser.add_argument("--model_ms", type=float, help="Simulated inference time.", default=150)
+    parser.add_argument("--rate_hz", type=float, help="Control loop rate.", default=30)
+    parser.add_argument("--duration_s", type=float, help="Length of the control loop.", default=10)
+    parser.add_argument("--deadline_ms", type=float, help="Deadline carried by the requests (none by default).", default=None)
+    args = parser.parse_args()
+
+    deadline_s = args.deadline_ms / 1e3 if args.deadline_ms is not None else None
+    print(
+        f"Model {args.model_ms:.0f} ms, control loop {args.rate_hz:.0f} Hz ({1e3 / args.rate_hz:.1f} ms), "
+        f"{args.duration_s:.0f} s, deadline {args.deadline_ms} ms"
+    )
+    for i, overload_policy in enumerate(OVERLOAD_POLICIES):
+        port = args.port + i
+        # The fifo server is left working through its backlog, the daemon thread ends with the script.
+        threading.Thread(
+            target=serve_slow_model, args=(port, overload_policy, args.model_ms / 1e3), daemon=True
+        ).start()
+        result = run_control_loop(port, args.rate_hz, args.duration_s, deadline_s)
+        print(
+            f"{overload_policy:>6}: {result['submitted']} submitted, {result['served']} served, "
+            f"{result['stale']} stale, {result['deadline']} past deadline, {result['unanswered']} unanswered | "
+            f"observation age mean {result['age_mean_ms']:.0f} ms, p95 {result['age_p95_ms']:.0f} ms, "
+            f"last {result['age_last_ms']:.0f} ms"
+        )
@@ -1,12 +1,20 @@
 import argparse
+import threading
+import time
 
 import zmq
 
 from dataclasses import dataclass
 from typing import Callable
 
+import torch
+
 from lerobot.policies.diffusion.modeling_diffusion import DiffusionPolicy
-from deploy.web_utils import TorchSerializer
+from deploy.feature_cache import FeatureCache
+from deploy.session import SessionGapError, SessionManager
+from deploy.warmup import InputBuffers, warm_up
+from deploy.web_utils import TorchSerializer, dropped_reply
+from train.evaluate import predict_action_chunk
 
 # os.environ["CUDA_VISIBLE_DEVICES"] = "2"
 
@@ -17,22 +25,50 @@ class EndpointHandler:
     requires_input: bool = True
 
 
+OVERLOAD_POLICIES = ["fifo", "latest"]
+# Endpoints whose requests only matter on the newest observation, the only ones the "latest" policy coalesces.
+COALESCED_ENDPOINTS = ["get_action", "step"]
+
+
+@dataclass
+class ServerStats:
+    served: int = 0
+    dropped_stale: int = 0
+    dropped_deadline: int = 0
+    errors: int = 0
+
+
 class BaseInferenceServer:
     """
     An inference server that spin up a ZeroMQ socket and listen for incoming requests.
     Can add custom endpoints by calling `register_endpoint`.
+
+    With `overload_policy="fifo"`, every request is answered in arrival order. With "latest", all
+    the requests waiting on the socket are drained before running any, and of the `get_action`
+    requests of the same client, and of the `step` requests of the same session, only the newest is
+    run; the others get a stale reply. Every other request is run, and every reply sent, in arrival
+    order.
+    A request carrying a `deadline` (`time.time()`, client and server clocks synchronized) that has
+    passed when its turn comes is not run either. Dropped requests are answered with
+    `{"dropped": "stale" | "deadline"}`, which clients raise as `RequestDroppedError`.
     """
 
-    def __init__(self, host: str = "*", port: int = 5555):
+    def __init__(self, host: str = "*", port: int = 5555, overload_policy: str = "fifo"):
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {overload_policy}. Available: {OVERLOAD_POLICIES}")
         self.running = True
+        self.overload_policy = overload_policy
+        self.stats = ServerStats()
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REP)
+        # A ROUTER socket sees every queued request with the identity of its client, a REP one only the next.
+        self.socket = self.context.socket(zmq.REP if overload_policy == "fifo" else zmq.ROUTER)
         self.socket.bind(f"tcp://{host}:{port}")
         self._endpoints: dict[str, EndpointHandler] = {}
 
         # Register the ping endpoint by default
         self.register_endpoint("ping", self._handle_ping, requires_input=False)
         self.register_endpoint("kill", self._kill_server, requires_input=False)
+        self.register_endpoint("server_stats", self._server_stats, requires_input=False)
 
     def _kill_server(self):
         """
@@ -46,6 +82,9 @@ class BaseInferenceServer:
         """
         return {"status": "ok", "message": "Server is running"}
 
+    def _server_stats(self) -> dict:
+        return vars(self.stats)
+
     def register_endpoint(self, name: str, handler: Callable, requires_input: bool = True):
         """
         Register a new endpoint to the server.
@@ -57,41 +96,225 @@ class BaseInferenceServer:
         """
         self._endpoints[name] = EndpointHandler(handler, requires_input)
 
+    def _process(self, request: dict) -> bytes:
+        """Run the request and return the serialized reply."""
+        try:
+            deadline = request.get("deadline")
+            if deadline is not None and time.time() > deadline:
+                self.stats.dropped_deadline += 1
+                return TorchSerializer.to_bytes(dropped_reply("deadline"))
+
+            endpoint = request.get("endpoint", "get_action")
+            if endpoint not in self._endpoints:
+                raise ValueError(f"Unknown endpoint: {endpoint}")
+
+            handler = self._endpoints[endpoint]
+            result = (
+                handler.handler(request.get("data", {}))
+                if handler.requires_input
+                else handler.handler()
+            )
+            self.stats.served += 1
+            return TorchSerializer.to_bytes(result)
+        except Exception as e:
+            print(f"Error in server: {e}")
+            import traceback
+
+            print(traceback.format_exc())
+            self.stats.errors += 1
+            return b"ERROR"
+
+    def _receive_latest(self, pending: list, newest: dict, flags: int = 0) -> bool:
+        """
+        Append the next request of the socket to `pending` as an `[envelope, request]` entry. The
+        request of an entry answered without running (malformed, or superseded by a newer one found
+        with `newest`) is replaced by its reply, so the replies still go out in arrival order: a
+        DEALER client matches them to its requests by their order.
+        """
+        try:
+            frames = self.socket.recv_multipart(flags)
+        except zmq.Again:
+            return False
+        # [identity, b"", payload] from REQ and DEALER clients alike, the reply reuses the envelope.
+        envelope, message = frames[:-1], frames[-1]
+        try:
+            request = TorchSerializer.from_bytes(message)
+        except Exception as e:
+            print(f"Error in server: {e}")
+            self.stats.errors += 1
+            pending.append([envelope, b"ERROR"])
+            return True
+        entry = [envelope, request]
+        pending.append(entry)
+        endpoint = request.get("endpoint", "get_action")
+        if endpoint not in COALESCED_ENDPOINTS:
+            return True
+        if endpoint == "step":
+            key = (endpoint, request.get("data", {}).get("session_id"))
+        else:
+            key = (endpoint, request.get("client_id", envelope[0]))
+        if key in newest:
+            self.stats.dropped_stale += 1
+            newest[key][1] = TorchSerializer.to_bytes(dropped_reply("stale"))
+        newest[key] = entry
+        return True
+
     def run(self):
         addr = self.socket.getsockopt_string(zmq.LAST_ENDPOINT)
-        print(f"Server is ready and listening on {addr}")
+        print(f"Server is ready and listening on {addr} (overload policy: {self.overload_policy})")
         while self.running:
-            try:
+            if self.overload_policy == "fifo":
                 message = self.socket.recv()
-                request = TorchSerializer.from_bytes(message)
-                endpoint = request.get("endpoint", "get_action")
-
-                if endpoint not in self._endpoints:
-                    raise ValueError(f"Unknown endpoint: {endpoint}")
-
-                handler = self._endpoints[endpoint]
-                result = (
-                    handler.handler(request.get("data", {}))
-                    if handler.requires_input
-                    else handler.handler()
-                )
-                self.socket.send(TorchSerializer.to_bytes(result))
-            except Exception as e:
-                print(f"Error in server: {e}")
-                import traceback
+                try:
+                    request = TorchSerializer.from_bytes(message)
+                except Exception as e:
+                    print(f"Error in server: {e}")
+                    self.stats.errors += 1
+                    self.socket.send(b"ERROR")
+                    continue
+                self.socket.send(self._process(request))
+                continue
 
-                print(traceback.format_exc())
-                self.socket.send(b"ERROR")
+            pending, newest = [], {}
+            self._receive_latest(pending, newest)
+            while self._receive_latest(pending, newest, zmq.NOBLOCK):
+                pass
+            # Requests arriving while these run are coalesced at the next round.
+            for envelope, request in pending:
+                reply = request if isinstance(request, bytes) else self._process(request)
+                self.socket.send_multipart([*envelope, reply])
+        print(f"Server stopped: {vars(self.stats)}")
 
 
 class RobotInferenceServer(BaseInferenceServer):
     """
     Server with three endpoints for real robot policies
+
+    The model is warmed up before serving. `load_model` loads another checkpoint with `model_loader`
+    in a background thread, warms it up and swaps it in between two requests; the requests arriving
+    in the meantime are served by the current model.
     """
 
-    def __init__(self, model, host: str = "*", port: int = 5555):
-        super().__init__(host, port)
-        self.register_endpoint("get_action", model.select_action)
+    def __init__(
+        self,
+        model,
+        host: str = "*",
+        port: int = 5555,
+        history_stride: int = 1,
+        feature_cache_size: int = 64,
+        overload_policy: str = "fifo",
+        model_loader: Callable | None = None,
+        warmup_iters: int = 3,
+    ):
+        super().__init__(host, port, overload_policy)
+        self.model = model
+        self.model_loader = model_loader or self._load_pretrained
+        self.warmup_iters = warmup_iters
+        # Held by the requests using the model, and by the swap.
+        self.model_lock = threading.Lock()
+        self._loader = None
+        self.model_status = {"model_path": None, "loading": None, "error": None, "swaps": 0, "warmup_ms": []}
+        self.feature_cache = FeatureCache(feature_cache_size) if feature_cache_size > 0 else None
+        self.input_buffers = InputBuffers(next(model.parameters()).device)
+        self.sessions = SessionManager(
+            model, stride=history_stride, feature_cache=self.feature_cache, input_buffers=self.input_buffers
+        )
+        self.register_endpoint("get_action", self._locked(self._select_action))
+        self.register_endpoint("predict_chunk", self._locked(self._predict_chunk))
+        self.register_endpoint("open_session", self._locked(self._open_session))
+        self.register_endpoint("step", self._locked(self._step))
+        self.register_endpoint("close_session", self._locked(self._close_session))
+        self.register_endpoint("cache_stats", self._cache_stats, requires_input=False)
+        self.register_endpoint("load_model", self._load_model)
+        self.register_endpoint("model_info", self._model_info, requires_input=False)
+
+        if warmup_iters > 0:
+            latencies_s = warm_up(model, self.sessions, self.input_buffers, warmup_iters)
+            self.model_status["warmup_ms"] = [1e3 * t for t in latencies_s]
+            print("Warm-up: " + " ".join(f"{1e3 * t:.1f}ms" for t in latencies_s))
+
+    def _locked(self, handler: Callable) -> Callable:
+        def locked_handler(data):
+            with self.model_lock:
+                return handler(data)
+
+        return locked_handler
+
+    def _load_pretrained(self, model_path: str):
+        device = next(self.model.parameters()).device
+        return DiffusionPolicy.from_pretrained(model_path).to(device).eval()
+
+    def _model_info(self) -> dict:
+        return dict(self.model_status)
+
+    def _load_model(self, data: dict) -> dict:
+        """Start loading `data["model_path"]`, poll `model_info` to know when it is swapped in."""
+        if self._loader is not None and self._loader.is_alive():
+            return {"status": "busy", **self._model_info()}
+        self.model_status["loading"] = data["model_path"]
+        self.model_status["error"] = None
+        self._loader = threading.Thread(target=self._load_and_swap, args=(data["model_path"],), daemon=True)
+        self._loader.start()
+        return {"status": "loading", **self._model_info()}
+
+    def _load_and_swap(self, model_path: str):
+        try:
+            model = self.model_loader(model_path)
+            # Own buffers and cache: the current ones are in use by the requests served meanwhile.
+            input_buffers = InputBuffers(next(model.parameters()).device)
+            feature_cache = FeatureCache(self.feature_cache.capacity) if self.feature_cache is not None else None
+            sessions = SessionManager(
+                model, stride=self.sessions.stride, feature_cache=feature_cache, input_buffers=input_buffers
+            )
+            latencies_s = warm_up(model, sessions, input_buffers, self.warmup_iters) if self.warmup_iters > 0 else []
+        except Exception as e:
+            print(f"Error loading {model_path}: {e}")
+            self.model_status.update(loading=None, error=str(e))
+            return
+
+        with self.model_lock:
+            self.model = model
+            self.input_buffers = input_buffers
+            self.sessions.set_policy(model, input_buffers)
+        self.model_status.update(
+            model_path=model_path,
+            loading=None,
+            swaps=self.model_status["swaps"] + 1,
+            warmup_ms=[1e3 * t for t in latencies_s],
+        )
+        print(f"Swapped in {model_path}")
+
+    def _select_action(self, observations: dict) -> torch.Tensor:
+        return self.model.select_action(observations)
+
+    def _cache_stats(self) -> dict:
+        return self.feature_cache.stats() if self.feature_cache is not None else {}
+
+    def _open_session(self, data: dict) -> dict:
+        session = self.sessions.open(data.get("session_id"), data.get("gap_policy", "fill"))
+        return {
+            "session_id": session.session_id,
+            "n_obs_steps": self.sessions.n_obs_steps,
+            "history_stride": self.sessions.stride,
+        }
+
+    def _step(self, data: dict) -> dict:
+        """Newest observation of a session in, action for its timestep out, see `deploy/session.py`."""
+        try:
+            return self.sessions.step(data["session_id"], data["timestep"], data["observation"])
+        except SessionGapError as e:
+            # Not a server error: the client decides whether to resend, skip or reopen the session.
+            return {"rejected": str(e), "timestep": data["timestep"]}
+
+    def _close_session(self, data: dict) -> dict:
+        return vars(self.sessions.close(data["session_id"]))
+
+    def _predict_chunk(self, observations: dict) -> torch.Tensor:
+        """
+        Stateless batched prediction: the observations carry the whole history `(B, n_obs_steps, ...)`
+        and the `(B, n_action_steps, action_dim)` chunk is returned. Used by the offline evaluator.
+        """
+        return predict_action_chunk(self.model, self.input_buffers.load(observations)).cpu()
 
     @staticmethod
     def start_server(policy , port: int):
@@ -120,6 +343,37 @@ if __name__ == "__main__":
         help="Path to the model checkpoint directory.",
         default="/home/zhiheng/data/dp_output/jointctrl1"
     )
+    parser.add_argument(
+        "--history_stride",
+        type=int,
+        help="Session timesteps between two observation steps of the policy (0.1 s * client fps).",
+        default=1
+    )
+    parser.add_argument(
+        "--feature_cache_size",
+        type=int,
+        help="Frames of image features cached across the requests of the sessions (0 disables the cache).",
+        default=64
+    )
+    parser.add_argument(
+        "--overload_policy",
+        type=str,
+        choices=OVERLOAD_POLICIES,
+        help="fifo: answer every request in order. latest: only run the newest pending get_action of each client and step of each session.",
+        default="fifo"
+    )
+    parser.add_argument(
+        "--warmup_iters",
+        type=int,
+        help="Warm-up inferences on synthetic observations before serving, and before swapping in a new checkpoint.",
+        default=3
+    )
+    parser.add_argument(
+        "--cpu_profile",
+        type=str,
+        help="CPUProfile JSON (threads, core pinning, int8 quantization) to serve on CPU, see deploy/cpu_profile.py.",
+        default=None
+    )
     # server mode
     args = parser.parse_args()
 
@@ -135,7 +389,26 @@ if __name__ == "__main__":
     # construct your own modality config and transform
     # see gr00t/utils/data.py for more details
 
-    policy = DiffusionPolicy.from_pretrained(args.model_path)
+    model_loader = None
+    if args.cpu_profile is not None:
+        from deploy.cpu_profile import CPUProfile, load_cpu_policy, load_fp32_policy, quantize_policy
+
+        profile = CPUProfile.from_json(args.cpu_profile)
+        policy = load_cpu_policy(args.model_path, profile)
+
+        def model_loader(model_path):
+            return quantize_policy(load_fp32_policy(model_path), profile)
+    else:
+        policy = DiffusionPolicy.from_pretrained(args.model_path)
     # Start the server
-    server = RobotInferenceServer(policy, port=args.port)
+    server = RobotInferenceServer(
+        policy,
+        port=args.port,
+        history_stride=args.history_stride,
+        feature_cache_size=args.feature_cache_size,
+        overload_policy=args.overload_policy,
+        model_loader=model_loader,
+        warmup_iters=args.warmup_iters,
+    )
+    server.model_status["model_path"] = args.model_path
     server.run()
@@ -0,0 +1,209 @@
+"""Server-side observation history for streaming clients.
+
+With `get_action`, the observation history lives in the queues of `DiffusionPolicy.select_action`,
+shared by every client and silently wrong after a reconnect or a dropped tick. A session instead
+keeps its own ring buffer of observations keyed by the timestep supplied by the client, which sends
+only its newest frame. The history fed to the policy is the observations at
+`t - stride * (n_obs_steps - 1), ..., t - stride, t`. A missing one is a gap, and is either filled
+with the closest earlier observation (`gap_policy="fill"`) or rejected with `SessionGapError`
+(`gap_policy="reject"`). At the start of a session the first observation is repeated, like the
+padding used in training.
+
+Every session also keeps the last predicted chunk with the timestep of its first action, so a tick
+is answered from the chunk while it covers the timestep and the policy only runs when it does not.
+With a feature cache, the frames of these ticks that the history of the next inference will use are
+encoded as they arrive (see `deploy/feature_cache.py`).
+"""
+
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import torch
+
+from deploy.feature_cache import FeatureCache, predict_action_chunk_cached, prefetch_frame_features
+from deploy.warmup import InputBuffers
+from train.evaluate import predict_action_chunk
+
+GAP_POLICIES = ["fill", "reject"]
+
+
+class SessionGapError(RuntimeError):
+    pass
+
+
+@dataclass
+class SessionStats:
+    steps: int = 0
+    inferences: int = 0
+    gaps_filled: int = 0
+    gaps_rejected: int = 0
+    stale_rejected: int = 0
+    bytes_received: int = 0
+    inference_s: float = 0.0
+
+
+@dataclass
+class Session:
+    session_id: str
+    gap_policy: str
+    capacity: int
+    history: OrderedDict = field(default_factory=OrderedDict)
+    first_timestep: int | None = None
+    last_timestep: int | None = None
+    chunk: torch.Tensor | None = None
+    chunk_t0: int = 0
+    stats: SessionStats = field(default_factory=SessionStats)
+
+
+class SessionManager:
+    """
+    Args:
+        policy: the diffusion policy, only used through `predict_action_chunk`.
+        stride: timesteps between two observations of the history (and two actions of a chunk), i.e.
+            `0.1 s * fps` when the client numbers its frames at the dataset fps and the policy was
+            trained with `[-0.1, 0.0]`.
+        max_sessions: the least recently used session is dropped beyond this.
+        feature_cache: reuse the image features of the frames already encoded in the session, see
+            `deploy/feature_cache.py`.
+        input_buffers: device tensors the histories are copied into, allocated on the policy device
+            if not given.
+    """
+
+    def __init__(
+        self,
+        policy,
+        stride: int = 1,
+        max_sessions: int = 8,
+        feature_cache: FeatureCache | None = None,
+        input_buffers: InputBuffers | None = None,
+    ):
+        self.policy = policy
+        self.feature_cache = feature_cache
+        self.input_buffers = input_buffers or InputBuffers(next(policy.parameters()).device)
+        self.n_obs_steps = policy.config.n_obs_steps
+        self.stride = stride
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def set_policy(self, policy, input_buffers: InputBuffers):
+        """
+        Serve the sessions with another checkpoint. The histories are kept, the chunks and the cached
+        image features of the previous policy are discarded.
+        """
+        self.policy = policy
+        self.input_buffers = input_buffers
+        if self.feature_cache is not None:
+            self.feature_cache.features.clear()
+        for session in self.sessions.values():
+            session.chunk = None
+
+    def open(self, session_id: str | None = None, gap_policy: str = "fill") -> Session:
+        if gap_policy not in GAP_POLICIES:
+            raise ValueError(f"Unknown gap policy: {gap_policy}. Available: {GAP_POLICIES}")
+        session_id = session_id or uuid.uuid4().hex
+        # Reopening an existing id (e.g. after a client reconnect) starts from an empty history.
+        self._drop(session_id)
+        while len(self.sessions) >= self.max_sessions:
+            self._drop(next(iter(self.sessions)))
+        session = Session(session_id, gap_policy, capacity=self.stride * (self.n_obs_steps - 1) + 1)
+        self.sessions[session_id] = session
+        return session
+
+    def close(self, session_id: str) -> SessionStats:
+        stats = self.get(session_id).stats
+        self._drop(session_id)
+        return stats
+
+    def _drop(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        if self.feature_cache is not None:
+            self.feature_cache.drop_session(session_id)
+
+    def get(self, session_id: str) -> Session:
+        if session_id not in self.sessions:
+            raise KeyError(f"Unknown session: {session_id}, open it first.")
+        self.sessions.move_to_end(session_id)
+        return self.sessions[session_id]
+
+    def _push(self, session: Session, timestep: int, observation: dict):
+        if session.last_timestep is not None and timestep <= session.last_timestep:
+            session.stats.stale_rejected += 1
+            raise SessionGapError(f"Timestep {timestep} is not after the last one ({session.last_timestep}).")
+        session.stats.bytes_received += sum(
+            v.numel() * v.element_size() for v in observation.values() if isinstance(v, torch.Tensor)
+        )
+        session.history[timestep] = observation
+        if session.first_timestep is None:
+            session.first_timestep = timestep
+        session.last_timestep = timestep
+        while next(iter(session.history)) <= timestep - session.capacity:
+            session.history.popitem(last=False)
+
+    def _gather_history(self, session: Session, timestep: int) -> tuple[dict, list[int]]:
+        """Batched `(1, n_obs_steps, ...)` history and the timestep each of its steps comes from."""
+        first = next(iter(session.history))
+        steps = []
+        missing = []
+        for i in range(self.n_obs_steps):
+            t = timestep - self.stride * (self.n_obs_steps - 1 - i)
+            if t in session.history:
+                steps.append(t)
+            elif t < session.first_timestep:
+                # Session start: pad with the oldest observation.
+                steps.append(first)
+            else:
+                missing.append(t)
+                steps.append(None)
+
+        if missing:
+            if session.gap_policy == "reject":
+                session.stats.gaps_rejected += 1
+                raise SessionGapError(f"Missing timesteps {missing} in the history of timestep {timestep}.")
+            session.stats.gaps_filled += len(missing)
+            for i, source in enumerate(steps):
+                if source is None:
+                    # Closest earlier observation, the oldest one if there is none.
+                    t = timestep - self.stride * (self.n_obs_steps - 1 - i)
+                    earlier = [k for k in session.history if k <= t]
+                    steps[i] = earlier[-1] if earlier else first
+
+        observations = [session.history[t] for t in steps]
+        history = {key: torch.stack([obs[key] for obs in observations]).unsqueeze(0) for key in observations[-1]}
+        return history, steps
+
+    def _needed_by_next_inference(self, session: Session, timestep: int) -> bool:
+        """Whether `timestep` is an older step of the history of the first tick after the chunk."""
+        next_inference = session.chunk_t0 + self.stride * len(session.chunk)
+        lag = next_inference - timestep
+        return 0 < lag <= self.stride * (self.n_obs_steps - 1) and lag % self.stride == 0
+
+    def step(self, session_id: str, timestep: int, observation: dict) -> dict:
+        """
+        Add the observation of `timestep` (unbatched tensors, images as float in [0, 1] or uint8) and
+        return the action to execute at `timestep`.
+        """
+        session = self.get(session_id)
+        self._push(session, timestep, observation)
+        session.stats.steps += 1
+
+        offset = (timestep - session.chunk_t0) // self.stride
+        if session.chunk is None or not 0 <= offset < len(session.chunk):
+            history, sources = self._gather_history(session, timestep)
+            history = self.input_buffers.load(history)
+            start = time.perf_counter()
+            if self.feature_cache is not None:
+                chunk = predict_action_chunk_cached(self.policy, history, session.session_id, sources, self.feature_cache)
+            else:
+                chunk = predict_action_chunk(self.policy, history)
+            session.chunk = chunk[0].cpu()
+            session.stats.inference_s += time.perf_counter() - start
+            session.stats.inferences += 1
+            session.chunk_t0 = timestep
+            offset = 0
+        elif self.feature_cache is not None and self._needed_by_next_inference(session, timestep):
+            observation = self.input_buffers.load(observation)
+            prefetch_frame_features(self.policy, observation, session.session_id, timestep, self.feature_cache)
+
+        return {"action": session.chunk[offset], "timestep": timestep, "chunk_offset": offset}
@@ -0,0 +1,81 @@
+"""Warm-up and preallocated inputs of the policy server.
+
+The first inference after `from_pretrained` pays for the CUDA context, the caching allocator growing
+and the kernel selection of every new shape. `warm_up` runs the inference paths of the server (the
+stateless chunk prediction, a session through the feature cache and `select_action`) on synthetic
+observations shaped from the policy config before the first client request.
+
+`InputBuffers` keeps one device tensor per input feature and shape, and copies the observations of
+every request into it instead of allocating new device tensors. The returned tensors are overwritten
+by the next request, so they are only used where the policy does not keep them (the session and
+`predict_chunk` paths, not the queues of `select_action`).
+"""
+
+import time
+
+import torch
+
+from train.evaluate import predict_action_chunk
+
+
+class InputBuffers:
+    def __init__(self, device: torch.device):
+        self.device = device
+        self.buffers: dict[tuple, torch.Tensor] = {}
+
+    def load(self, batch: dict) -> dict:
+        """Copy of `batch` in the preallocated buffers, uint8 images converted to float in [0, 1]."""
+        loaded = {}
+        for key, value in batch.items():
+            if not isinstance(value, torch.Tensor):
+                loaded[key] = value
+                continue
+            dtype = torch.float32 if value.dtype == torch.uint8 else value.dtype
+            buffer_key = (key, tuple(value.shape), dtype)
+            if buffer_key not in self.buffers:
+                self.buffers[buffer_key] = torch.empty(value.shape, dtype=dtype, device=self.device)
+            buffer = self.buffers[buffer_key]
+            buffer.copy_(value, non_blocking=True)
+            if value.dtype == torch.uint8:
+                buffer.div_(255)
+            loaded[key] = buffer
+        return loaded
+
+
+def synthetic_history(policy, batch_size: int = 1) -> dict:
+    """Random `(batch_size, n_obs_steps, *shape)` observations for every input feature of the policy."""
+    n_obs_steps = policy.config.n_obs_steps
+    return {key: torch.rand(batch_size, n_obs_steps, *ft.shape) for key, ft in policy.config.input_features.items()}
+
+
+def _synchronize(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def warm_up(policy, sessions, input_buffers: InputBuffers, num_iters: int = 3) -> list[float]:
+    """
+    Run `num_iters` times every inference path of the server with `policy`. `sessions` is a
+    `SessionManager` of `policy`, a temporary session is opened and closed in it. Returns the latency
+    of every iteration.
+    """
+    device = input_buffers.device
+    history = synthetic_history(policy)
+    session = sessions.open()
+    latencies_s = []
+    for i in range(num_iters):
+        start = time.perf_counter()
+        predict_action_chunk(policy, input_buffers.load(history))
+        # Every step runs the policy, the newest frame through the encoder and the others from the cache.
+        session.chunk = None
+        sessions.step(session.session_id, i * sessions.stride, {key: v[0, -1] for key, v in history.items()})
+        _synchronize(device)
+        latencies_s.append(time.perf_counter() - start)
+    sessions.close(session.session_id)
+
+    # `select_action` keeps the observations in its queues, give it its own tensors.
+    policy.reset()
+    policy.select_action({key: v[:, -1].to(device) for key, v in history.items()})
+    policy.reset()
+    _synchronize(device)
+    return latencies_s
@@ -14,3 +14,19 @@ class TorchSerializer:
         buffer = BytesIO(data)
         obj = torch.load(buffer, weights_only=False)
         return obj
+
+
+class RequestDroppedError(RuntimeError):
+    """The server answered without running the request: superseded by a newer one ("stale") or too late ("deadline")."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Request dropped by the server: {reason}")
+        self.reason = reason
+
+
+def dropped_reply(reason: str) -> dict:
+    return {"dropped": reason}
+
+
+def is_dropped_reply(reply) -> bool:
+    return isinstance(reply, dict) and reply.keys() == {"dropped"}
@@ -0,0 +1,231 @@
+"""Forward and inverse kinematics of the Piper arm, vectorized over N frames with NumPy.
+
+Modified DH (Craig) parameters of `piper_sdk` (`C_PiperForwardKinematics`). At the interface, the
+units are those of the CAN messages and of the recorded datasets: joints in 0.001°, end pose X/Y/Z
+in 0.001 mm and RX/RY/RZ in 0.001° (fixed XYZ angles, R = Rz @ Ry @ Rx).
+
+`inverse_kinematics` is a damped least squares (Levenberg-Marquardt) iteration on all the targets
+at once, seeded with nearby joints (the measured joints of the same frame offline, the last joints
+online).
+
+Agreement with the end pose reported over CAN and speed on a recorded dataset:
+
+    python -m robot.motors.piper.kinematics --dataset_path test2/piper_test86
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+# Lengths in mm, angles in rad.
+DH_A = np.array([0.0, 0.0, 285.03, -21.98, 0.0, 0.0])
+DH_ALPHA = np.array([0.0, -np.pi / 2, 0.0, np.pi / 2, -np.pi / 2, np.pi / 2])
+DH_D = np.array([123.0, 0.0, 0.0, 250.75, 0.0, 91.0])
+# `dh_is_offset` of piper_sdk: the zero of joints 2 and 3 moved by 2° between firmware versions.
+DH_THETA_OFFSET = {
+    0: np.deg2rad([0.0, -172.22, -102.78, 0.0, 0.0, 0.0]),
+    1: np.deg2rad([0.0, -174.22, -100.78, 0.0, 0.0, 0.0]),
+}
+JOINT_LIMITS = np.deg2rad([[-150, 150], [0, 180], [-170, 0], [-100, 100], [-70, 70], [-120, 120]])
+
+JOINT_NAMES = [f"joint_{i}.pos" for i in range(1, 7)]
+POSE_NAMES = ["X_axis.pos", "Y_axis.pos", "Z_axis.pos", "RX_axis.pos", "RY_axis.pos", "RZ_axis.pos"]
+MDEG_TO_RAD = np.pi / 180e3
+UM_TO_MM = 1e-3
+
+
+def link_transforms(q: np.ndarray, dh_is_offset: int = 1) -> np.ndarray:
+    """`(N, 6)` joint angles in rad to the `(N, 6, 4, 4)` transforms from each frame to the next."""
+    theta = q + DH_THETA_OFFSET[dh_is_offset]
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(DH_ALPHA), np.sin(DH_ALPHA)
+    links = np.zeros((*q.shape, 4, 4))
+    links[..., 0, 0] = ct
+    links[..., 0, 1] = -st
+    links[..., 0, 3] = DH_A
+    links[..., 1, 0] = st * ca
+    links[..., 1, 1] = ct * ca
+    links[..., 1, 2] = -sa
+    links[..., 1, 3] = -sa * DH_D
+    links[..., 2, 0] = st * sa
+    links[..., 2, 1] = ct * sa
+    links[..., 2, 2] = ca
+    links[..., 2, 3] = ca * DH_D
+    links[..., 3, 3] = 1.0
+    return links
+
+
+def joint_frames(q: np.ndarray, dh_is_offset: int = 1) -> np.ndarray:
+    """`(N, 6, 4, 4)` base-to-frame transforms, the last one is the flange."""
+    frames = link_transforms(q, dh_is_offset)
+    for i in range(1, 6):
+        frames[:, i] = frames[:, i - 1] @ frames[:, i]
+    return frames
+
+
+def matrix_to_euler(R: np.ndarray) -> np.ndarray:
+    """`(N, 3, 3)` rotations to `(N, 3)` RX, RY, RZ in rad."""
+    rx = np.arctan2(R[:, 2, 1], R[:, 2, 2])
+    ry = np.arctan2(-R[:, 2, 0], np.hypot(R[:, 0, 0], R[:, 1, 0]))
+    rz = np.arctan2(R[:, 1, 0], R[:, 0, 0])
+    return np.stack([rx, ry, rz], axis=-1)
+
+
+def euler_to_matrix(euler: np.ndarray) -> np.ndarray:
+    """`(N, 3)` RX, RY, RZ in rad to `(N, 3, 3)` rotations."""
+    cx, cy, cz = np.cos(euler).T
+    sx, sy, sz = np.sin(euler).T
+    R = np.empty((len(euler), 3, 3))
+    R[:, 0, 0] = cz * cy
+    R[:, 0, 1] = cz * sy * sx - sz * cx
+    R[:, 0, 2] = cz * sy * cx + sz * sx
+    R[:, 1, 0] = sz * cy
+    R[:, 1, 1] = sz * sy * sx + cz * cx
+    R[:, 1, 2] = sz * sy * cx - cz * sx
+    R[:, 2, 0] = -sy
+    R[:, 2, 1] = cy * sx
+    R[:, 2, 2] = cy * cx
+    return R
+
+
+def rotation_error(R_target: np.ndarray, R: np.ndarray) -> np.ndarray:
+    """`(N, 3)` rotation vector taking `R` to `R_target`, in the base frame."""
+    R_err = R_target @ R.transpose(0, 2, 1)
+    cos_angle = np.clip((np.trace(R_err, axis1=1, axis2=2) - 1) / 2, -1.0, 1.0)
+    angle = np.arccos(cos_angle)
+    axis = np.stack(
+        [R_err[:, 2, 1] - R_err[:, 1, 2], R_err[:, 0, 2] - R_err[:, 2, 0], R_err[:, 1, 0] - R_err[:, 0, 1]], axis=-1
+    )
+    sin_angle = np.sin(angle)
+    # angle / (2 sin(angle)) -> 1/2 for small angles
+    scale = np.where(sin_angle > 1e-6, angle / (2 * np.maximum(sin_angle, 1e-6)), 0.5)
+    rotvec = axis * scale[:, None]
+
+    # Toward pi the skew-symmetric part vanishes, the axis n comes from the symmetric part instead:
+    # (R + R^T) / 2 - cos(angle) I = (1 - cos(angle)) n n^T, whose largest column is along n.
+    large = angle > np.pi / 2
+    if large.any():
+        sym = (R_err[large] + R_err[large].transpose(0, 2, 1)) / 2 - cos_angle[large, None, None] * np.eye(3)
+        k = np.argmax(np.diagonal(sym, axis1=1, axis2=2), axis=1)
+        n = sym[np.arange(len(k)), :, k]
+        n /= np.linalg.norm(n, axis=1, keepdims=True)
+        # The sign of the skew-symmetric part, arbitrary at pi exactly
+        n *= np.where(np.sum(n * axis[large], axis=1) < 0, -1.0, 1.0)[:, None]
+        rotvec[large] = angle[large, None] * n
+    return rotvec
+
+
+def forward_kinematics(joints: np.ndarray, dh_is_offset: int = 1) -> np.ndarray:
+    """`(N, 6)` joints in 0.001° to the `(N, 6)` end pose in 0.001 mm and 0.001°."""
+    flange = joint_frames(np.asarray(joints, dtype=np.float64) * MDEG_TO_RAD, dh_is_offset)[:, -1]
+    position = flange[:, :3, 3] / UM_TO_MM
+    euler = matrix_to_euler(flange[:, :3, :3]) / MDEG_TO_RAD
+    return np.concatenate([position, euler], axis=-1)
+
+
+def inverse_kinematics(
+    pose: np.ndarray,
+    seed_joints: np.ndarray,
+    dh_is_offset: int = 1,
+    max_iters: int = 100,
+    damping: float = 0.005,
+    tol_mm: float = 0.01,
+    tol_deg: float = 0.01,
+    max_step_deg: float = 10.0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    `(N, 6)` end poses in 0.001 mm and 0.001° to `(N, 6)` joints in 0.001°, starting from
+    `seed_joints` (`(N, 6)` or `(6,)`, 0.001°). Also returns the `(N,)` mask of the targets reached
+    within `tol_mm` and `tol_deg`; the others (out of reach or beyond the joint limits) keep the
+    closest joints found.
+    """
+    pose = np.atleast_2d(np.asarray(pose, dtype=np.float64))
+    target_p = pose[:, :3] * UM_TO_MM
+    target_R = euler_to_matrix(pose[:, 3:] * MDEG_TO_RAD)
+    q = np.broadcast_to(np.asarray(seed_joints, dtype=np.float64) * MDEG_TO_RAD, pose.shape).copy()
+    q = np.clip(q, JOINT_LIMITS[:, 0], JOINT_LIMITS[:, 1])
+
+    # Positions in m in the error and the Jacobian, so that 1 mm weighs like 1 mrad.
+    tol_m = tol_mm * 1e-3
+    tol_rad = np.deg2rad(tol_deg)
+    max_step = np.deg2rad(max_step_deg)
+    eye = np.eye(6) * damping**2
+    converged = np.zeros(len(pose), dtype=bool)
+    for _ in range(max_iters):
+        frames = joint_frames(q, dh_is_offset)
+        p = frames[:, -1, :3, 3]
+        e_p = (target_p - p) * 1e-3
+        e_w = rotation_error(target_R, frames[:, -1, :3, :3])
+        converged = (np.linalg.norm(e_p, axis=-1) < tol_m) & (np.linalg.norm(e_w, axis=-1) < tol_rad)
+        if converged.all():
+            break
+
+        # Geometric Jacobian: joint i turns about the z axis of frame i.
+        z = frames[:, :, :3, 2]
+        o = frames[:, :, :3, 3]
+        J_v = np.cross(z, p[:, None] - o) * 1e-3
+        J = np.concatenate([J_v, z], axis=-1).transpose(0, 2, 1)
+        e = np.concatenate([e_p, e_w], axis=-1)
+        dq = (J.transpose(0, 2, 1) @ np.linalg.solve(J @ J.transpose(0, 2, 1) + eye, e[..., None]))[..., 0]
+        dq = np.clip(dq, -max_step, max_step)
+        dq[converged] = 0.0
+        q = np.clip(q + dq, JOINT_LIMITS[:, 0], JOINT_LIMITS[:, 1])
+    return q / MDEG_TO_RAD, converged
+
+
+def pose_errors(pose: np.ndarray, reference: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Position (mm) and rotation (°) distances between two `(N, 6)` end poses in 0.001 mm / 0.001°."""
+    position_mm = np.linalg.norm((pose[:, :3] - reference[:, :3]) * UM_TO_MM, axis=-1)
+    rotation = rotation_error(euler_to_matrix(pose[:, 3:] * MDEG_TO_RAD), euler_to_matrix(reference[:, 3:] * MDEG_TO_RAD))
+    return position_mm, np.rad2deg(np.linalg.norm(rotation, axis=-1))
+
+
+def _describe(values: np.ndarray) -> str:
+    return f"mean {values.mean():.3f} p95 {np.percentile(values, 95):.3f} max {values.max():.3f}"
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    from lerobot.datasets.lerobot_dataset import LeRobotDatasetMetadata
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_path", type=str, help="Dataset recorded with joints and CAN end poses.", required=True)
+    parser.add_argument("--max_frames", type=int, help="Frames used for the IK benchmark.", default=5000)
+    args = parser.parse_args()
+
+    meta = LeRobotDatasetMetadata(args.dataset_path)
+    names = meta.features["observation.state"]["names"]
+    state = np.concatenate(
+        [
+            np.stack(pd.read_parquet(meta.root / meta.get_data_file_path(ep_idx), columns=["observation.state"])["observation.state"].to_numpy())
+            for ep_idx in range(meta.total_episodes)
+        ]
+    )
+    joints = state[:, [names.index(name) for name in JOINT_NAMES]]
+    can_pose = state[:, [names.index(name) for name in POSE_NAMES]]
+    print(f"{len(state)} frames from {meta.total_episodes} episodes")
+
+    for dh_is_offset in DH_THETA_OFFSET:
+        start = time.perf_counter()
+        fk_pose = forward_kinematics(joints, dh_is_offset)
+        fk_s = time.perf_counter() - start
+        position_mm, rotation_deg = pose_errors(fk_pose, can_pose)
+        print(
+            f"FK (dh_is_offset={dh_is_offset}): {len(joints) / fk_s:,.0f} frames/s | vs CAN end pose: "
+            f"position [mm] {_describe(position_mm)}, rotation [°] {_describe(rotation_deg)}"
+        )
+
+    # IK of the FK poses, seeded with the joints of the previous frame as when streaming actions.
+    n = min(args.max_frames, len(joints) - 1)
+    target = forward_kinematics(joints[1 : n + 1])
+    start = time.perf_counter()
+    ik_joints, converged = inverse_kinematics(target, joints[:n])
+    ik_s = time.perf_counter() - start
+    joint_error_deg = np.abs(ik_joints - joints[1 : n + 1]).max(axis=-1) * 1e-3
+    position_mm, rotation_deg = pose_errors(forward_kinematics(ik_joints), target)
+    print(
+        f"IK: {n / ik_s:,.0f} frames/s, {converged.mean():.1%} converged | joint error [°] {_describe(joint_error_deg)} | "
+        f"pose error position [mm] {_describe(position_mm)}, rotation [°] {_describe(rotation_deg)}"
+    )
@@ -0,0 +1,58 @@
+import time
+
+from robot.motors.piper.piper_motor import PIPERMotorsBusConfig
+
+
+class SimPIPERMotorsBus():
+    """
+    Drop-in replacement of `PIPERMotorsBus` without CAN hardware, for dry runs. Every command is
+    recorded with its `time.perf_counter()` send time and `read` returns the last commanded state.
+    """
+
+    def __init__(
+        self,
+        config: PIPERMotorsBusConfig
+    ):
+        self.motors = config.motors
+        self._connected = False
+        self._state = {motor: 0.0 for motor in self.motors}
+        self.command_times = []
+        self.commands = []
+
+    @property
+    def is_calibrated(self) -> bool:
+        return True
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def connect(self):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def read(self):
+        return dict(self._state)
+
+    def _write(self, target_state: list, motors: list[str], indices: list[int]):
+        # Same indexing as `PIPERMotorsBus.write_joint` / `write_endpose`
+        self.command_times.append(time.perf_counter())
+        self.commands.append(list(target_state))
+        for motor, i in zip(motors, indices):
+            self._state[motor] = float(target_state[i])
+
+    def write_joint(self, target_state: list):
+        self._write(
+            target_state,
+            ["joint_1", "joint_2", "joint_3", "joint_4", "joint_5", "joint_6", "gripper"],
+            [0, 1, 2, 3, 4, 5, -1],
+        )
+
+    def write_endpose(self, target_state: list):
+        self._write(
+            target_state,
+            ["X_axis", "Y_axis", "Z_axis", "RX_axis", "RY_axis", "RZ_axis", "gripper"],
+            [6, 7, 8, 9, 10, 11, -1],
+        )
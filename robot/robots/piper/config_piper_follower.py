@@ -39,3 +39,10 @@ class PIPERFollowerConfig(RobotConfig):
 
     # Set to `True` for backward compatibility with previous policies/dataset
     use_degrees: bool = False
+
+    # Use a simulated motor bus instead of the CAN interface (dry runs without the arm)
+    mock: bool = False
+
+    # Send end-pose actions (`move_mode=0x00`) as joint targets solved by `robot.motors.piper.kinematics`
+    # instead of `EndPoseCtrl`, so that the joint limits and the IK seed are under our control.
+    endpose_ik: bool = False
@@ -16,8 +16,9 @@
 
 import logging
 import time
+from collections import deque
 from functools import cached_property
-from typing import Any
+from typing import Any, Callable, Sequence
 
 from lerobot.cameras.utils import make_cameras_from_configs
 from lerobot.errors import DeviceAlreadyConnectedError, DeviceNotConnectedError
@@ -28,6 +29,8 @@ from robot.motors.piper.piper_motor import (
     PIPERMotorsBusConfig,
     PIPERMotorsBus,
 )
+from robot.motors.piper.kinematics import inverse_kinematics
+from robot.motors.piper.sim_motor import SimPIPERMotorsBus
 
 from .config_piper_follower import PIPERFollowerConfig
 
@@ -63,8 +66,18 @@ class PIPERFollower(Robot):
                 "gripper": (13, "agilex_piper"),
             }
         )
-        self.bus = PIPERMotorsBus(config=bus_config)
+        self.bus = SimPIPERMotorsBus(config=bus_config) if config.mock else PIPERMotorsBus(config=bus_config)
         self.cameras = make_cameras_from_configs(config.cameras)
+        # `time.perf_counter()` time the camera reader thread received each frame `get_camera_observation`
+        # returned: a few ms (transfer, color conversion) after its capture, whereas the frame `async_read`
+        # returns may have been waiting up to a frame period before the read.
+        self.camera_frame_times = {}
+        # Last frames received by the reader thread of each camera, with their time
+        self._received_frames = {cam_key: deque(maxlen=4) for cam_key in self.cameras}
+        for cam_key, cam in self.cameras.items():
+            cam.read = self._stamped_read(cam.read, self._received_frames[cam_key])
+        # Joints of the last IK solution, seed of the next one (`endpose_ik`)
+        self._ik_joints = None
 
     @property
     def _motors_ft(self) -> dict[str, type]:
@@ -123,17 +136,42 @@ class PIPERFollower(Robot):
         return
 
     def get_observation(self) -> dict[str, Any]:
+        obs_dict = self.get_arm_observation()
+        obs_dict.update(self.get_camera_observation())
+        return obs_dict
+
+    def get_arm_observation(self) -> dict[str, float]:
+        """Arm part of `get_observation`, cheap enough to be polled at the control rate."""
         if not self.is_connected:
             raise DeviceNotConnectedError("Piper is not connected.")
 
         # Read arm position
         obs_dict = self.bus.read()
-        obs_dict = {f"{motor}.pos": val for motor, val in obs_dict.items()}
+        return {f"{motor}.pos": val for motor, val in obs_dict.items()}
 
-        # Capture images from cameras
-        for cam_key, cam in self.cameras.items():
-            obs_dict[cam_key] = cam.async_read()
+    @staticmethod
+    def _stamped_read(read: Callable, received: deque) -> Callable:
+        """`read`, which the camera reader thread calls, keeping each frame with the time it was received at."""
+
+        def stamped_read(*args, **kwargs):
+            frame = read(*args, **kwargs)
+            received.append((frame, time.perf_counter()))
+            return frame
 
+        return stamped_read
+
+    def get_camera_observation(self) -> dict[str, Any]:
+        """Camera part of `get_observation`, paced by the camera FPS."""
+        if not self.is_connected:
+            raise DeviceNotConnectedError("Piper is not connected.")
+
+        # Capture images from cameras, keeping the time the reader thread received each frame at (it may
+        # have received newer ones since).
+        obs_dict = {}
+        for cam_key, cam in self.cameras.items():
+            frame = cam.async_read()
+            self.camera_frame_times[cam_key] = next(t for f, t in reversed(self._received_frames[cam_key]) if f is frame)
+            obs_dict[cam_key] = frame
         return obs_dict
 
     def send_action(self, action: dict[str, Any], move_mode: int = 0x01) -> dict[str, Any]:
@@ -142,18 +180,39 @@ class PIPERFollower(Robot):
             0x00: MOVE P (Position/EndPose)
             0x01: MOVE J (Joint) default
         """
+        target_state = [action[f"{motor}.pos"] for motor in self.bus.motors]
+        self.send_action_array(target_state, move_mode)
+        return action
+
+    def send_action_array(self, target_state: Sequence[float], move_mode: int = 0x01) -> None:
+        """
+        Same as `send_action` with the values already ordered as `self.bus.motors` (e.g. a row of the
+        dataset `action` column), without building a dict on every call.
+        """
         if not self.is_connected:
             raise DeviceNotConnectedError("Piper is not connected.")
 
-        target_state = [action[f"{motor}.pos"] for motor in self.bus.motors]
-
-        if move_mode == 0x00:
+        if move_mode == 0x00 and self.config.endpose_ik:
+            self.bus.write_joint(self._endpose_to_joint_target(target_state))
+        elif move_mode == 0x00:
             self.bus.write_endpose(target_state)
         elif move_mode == 0x01:
             self.bus.write_joint(target_state)
         else:
             raise ValueError(f"Unsupported move_mode: {move_mode}")
-        return action
+
+    def _endpose_to_joint_target(self, target_state: Sequence[float]) -> list[float]:
+        """`target_state` with the joints solved from its end pose, as expected by `write_joint`."""
+        if self._ik_joints is None:
+            state = self.bus.read()
+            self._ik_joints = [state[f"joint_{i}"] for i in range(1, 7)]
+        joints, converged = inverse_kinematics(target_state[6:12], self._ik_joints)
+        if not converged[0]:
+            logger.warning(f"IK did not converge for end pose {list(target_state[6:12])}, sending the closest joints.")
+        target_state = list(target_state)
+        target_state[:6] = joints[0].tolist()
+        self._ik_joints = target_state[:6]
+        return target_state
 
     def disconnect(self):
         if not self.is_connected:
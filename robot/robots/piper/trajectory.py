@@ -0,0 +1,187 @@
+import threading
+import time
+from typing import Sequence
+
+import numpy as np
+
+from lerobot.utils.robot_utils import busy_wait
+
+from robot.robots.piper.piper_follower import PIPERFollower
+
+INTERPOLATIONS = ["cubic", "min_jerk"]
+
+
+def _as_limit(limit: float | Sequence[float] | None, num_dims: int) -> np.ndarray:
+    if limit is None:
+        return np.full(num_dims, np.inf)
+    return np.broadcast_to(np.asarray(limit, dtype=np.float64), (num_dims,)).copy()
+
+
+def knot_velocities(times: np.ndarray, positions: np.ndarray, start_velocity: np.ndarray) -> np.ndarray:
+    """
+    Velocities at the knots: `start_velocity` at the first one, Catmull-Rom central differences in
+    between and zero at the last one (the arm comes to rest if no new chunk arrives).
+    """
+    velocities = np.zeros_like(positions)
+    velocities[0] = start_velocity
+    if len(times) > 2:
+        velocities[1:-1] = (positions[2:] - positions[:-2]) / (times[2:] - times[:-2])[:, None]
+    return velocities
+
+
+def hermite(s: float, h: float, p0, v0, p1, v1, interpolation: str = "min_jerk") -> np.ndarray:
+    """Position at `s` in [0, 1] of a segment of duration `h` between (p0, v0) and (p1, v1)."""
+    if interpolation == "cubic":
+        b_p0 = 2 * s**3 - 3 * s**2 + 1
+        b_v0 = s**3 - 2 * s**2 + s
+        b_p1 = -2 * s**3 + 3 * s**2
+        b_v1 = s**3 - s**2
+    else:
+        # Quintic with zero acceleration at both knots: the minimum-jerk segment for these boundaries.
+        b_p0 = 1 - 10 * s**3 + 15 * s**4 - 6 * s**5
+        b_v0 = s - 6 * s**3 + 8 * s**4 - 3 * s**5
+        b_p1 = 10 * s**3 - 15 * s**4 + 6 * s**5
+        b_v1 = -4 * s**3 + 7 * s**4 - 3 * s**5
+    return b_p0 * p0 + b_v0 * h * v0 + b_p1 * p1 + b_v1 * h * v1
+
+
+class TrajectoryStreamer:
+    """
+    Streams joint targets to the arm at `rate_hz` from a background thread, interpolated between the
+    actions of the last chunk (10 Hz for the policy) with C1-continuous cubic or minimum-jerk segments.
+
+    `set_chunk` may be called at any time: the new trajectory starts from the position and velocity
+    currently commanded, so a chunk preempting the previous one does not make the targets jump. The
+    commanded velocity is limited to `max_velocity`, its change per tick to `max_acceleration`, and
+    it is slowed down when approaching a target so that it can stop within `max_acceleration`.
+    Limits are per dimension of the action, in its units per second (0.001°/s for the joints).
+    An error of the streaming thread (e.g. from `send_action_array`) is raised by the next
+    `set_chunk`, `is_done` or `stop`.
+    """
+
+    def __init__(
+        self,
+        robot: PIPERFollower,
+        rate_hz: float = 200,
+        max_velocity: float | Sequence[float] | None = None,
+        max_acceleration: float | Sequence[float] | None = None,
+        interpolation: str = "min_jerk",
+        move_mode: int = 0x01,
+    ):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation: {interpolation}. Available: {INTERPOLATIONS}")
+        self.robot = robot
+        self.rate_hz = rate_hz
+        self.interpolation = interpolation
+        self.move_mode = move_mode
+        self._max_velocity = max_velocity
+        self._max_acceleration = max_acceleration
+        self.position = None
+        self.velocity = None
+        self._knots = None
+        self.ticks = 0
+        self.overruns = 0
+        self.limited_ticks = 0
+        self.preemptions = 0
+        self.error: Exception | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self, initial_position: Sequence[float]):
+        """Start streaming, holding `initial_position` (e.g. the current state of the arm) until the first chunk."""
+        self.position = np.asarray(initial_position, dtype=np.float64).copy()
+        self.velocity = np.zeros_like(self.position)
+        self.max_velocity = _as_limit(self._max_velocity, len(self.position))
+        self.max_acceleration = _as_limit(self._max_acceleration, len(self.position))
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._check()
+
+    def set_chunk(self, actions: np.ndarray, dt: float = 0.1, t0: float | None = None):
+        """`actions[k]` is the target at `t0 + k * dt` (`time.perf_counter()`, default now)."""
+        t0 = time.perf_counter() if t0 is None else t0
+        self.set_trajectory(np.asarray(actions, dtype=np.float64), t0 + dt * np.arange(len(actions)))
+
+    def set_trajectory(self, positions: np.ndarray, times: np.ndarray):
+        """Waypoints at `time.perf_counter()` times, the past ones are dropped."""
+        self._check()
+        now = time.perf_counter()
+        future = times > now
+        with self._lock:
+            if self._knots is not None and self._knots[0][-1] > now:
+                self.preemptions += 1
+            knot_t = np.concatenate([[now], times[future]])
+            knot_p = np.concatenate([self.position[None], positions[future]])
+            self._knots = (knot_t, knot_p, knot_velocities(knot_t, knot_p, self.velocity))
+
+    def is_done(self) -> bool:
+        """True once the last waypoint is reached (and before the first chunk)."""
+        self._check()
+        with self._lock:
+            return self._knots is None or time.perf_counter() >= self._knots[0][-1]
+
+    def _desired(self, t: float) -> np.ndarray:
+        with self._lock:
+            if self._knots is None:
+                return self.position
+            knot_t, knot_p, knot_v = self._knots
+        if t >= knot_t[-1]:
+            return knot_p[-1]
+        i = max(int(np.searchsorted(knot_t, t, side="right")) - 1, 0)
+        h = knot_t[i + 1] - knot_t[i]
+        s = (t - knot_t[i]) / h
+        return hermite(s, h, knot_p[i], knot_v[i], knot_p[i + 1], knot_v[i + 1], self.interpolation)
+
+    def _limit(self, desired: np.ndarray, desired_velocity: np.ndarray, dt: float) -> np.ndarray:
+        """Velocity toward `desired` within the limits."""
+        error = desired - self.position
+        velocity = error / dt
+        # Slow enough to stop at the target, relative to its own motion: (v - v_d)^2 <= 2 * a * distance
+        limited = np.isfinite(self.max_acceleration)
+        stop_velocity = np.abs(desired_velocity) + np.sqrt(2 * np.where(limited, self.max_acceleration, 0) * np.abs(error))
+        max_velocity = np.minimum(self.max_velocity, np.where(limited, stop_velocity, np.inf))
+        velocity = np.clip(velocity, -max_velocity, max_velocity)
+        velocity = np.clip(
+            velocity, self.velocity - self.max_acceleration * dt, self.velocity + self.max_acceleration * dt
+        )
+        return velocity
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError("The trajectory streamer stopped.") from self.error
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            self.error = e
+
+    def _loop(self):
+        period_s = 1 / self.rate_hz
+        next_t = time.perf_counter()
+        previous_desired = self.position
+        while not self._stop.is_set():
+            desired = self._desired(time.perf_counter())
+            velocity = self._limit(desired, (desired - previous_desired) / period_s, period_s)
+            previous_desired = desired
+            position = self.position + velocity * period_s
+            if not np.allclose(position, desired):
+                self.limited_ticks += 1
+            with self._lock:
+                self.position = position
+                self.velocity = velocity
+            self.robot.send_action_array(position, self.move_mode)
+            self.ticks += 1
+
+            # Absolute schedule, a late tick does not shift the following ones.
+            next_t += period_s
+            remaining_s = next_t - time.perf_counter()
+            if remaining_s < 0:
+                self.overruns += 1
+                next_t = time.perf_counter()
+            busy_wait(remaining_s)
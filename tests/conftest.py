@@ -0,0 +1,40 @@
+import pytest
+import torch
+
+from lerobot.configs.types import FeatureType, PolicyFeature
+from lerobot.policies.diffusion.configuration_diffusion import DiffusionConfig
+from lerobot.policies.diffusion.modeling_diffusion import DiffusionPolicy
+
+
+def tiny_diffusion_policy(
+    image_shape: tuple[int, int, int] = (3, 32, 32),
+    crop_shape: tuple[int, int] = (28, 28),
+    num_inference_steps: int | None = None,
+    train: bool = False,
+    camera_keys: tuple[str, ...] = ("observation.images.front", "observation.images.wrist"),
+    state_dim: int = 7,
+) -> DiffusionPolicy:
+    """Randomly initialized DiffusionPolicy small enough for the CPU, the images normalized with mean/std and the rest with min/max."""
+    input_features = {key: PolicyFeature(FeatureType.VISUAL, image_shape) for key in camera_keys}
+    input_features["observation.state"] = PolicyFeature(FeatureType.STATE, (state_dim,))
+    config = DiffusionConfig(
+        input_features=input_features,
+        output_features={"action": PolicyFeature(FeatureType.ACTION, (state_dim,))},
+        crop_shape=crop_shape,
+        down_dims=(16, 32),
+        num_inference_steps=num_inference_steps,
+        pretrained_backbone_weights=None,
+        device="cpu",
+    )
+    shapes = {**{key: (3, 1, 1) for key in camera_keys}, "observation.state": (state_dim,), "action": (state_dim,)}
+    stats = {
+        key: {"mean": torch.full(shape, 0.5), "std": torch.full(shape, 0.2), "min": -torch.ones(shape), "max": torch.ones(shape)}
+        for key, shape in shapes.items()
+    }
+    return DiffusionPolicy(config, dataset_stats=stats).train(train)
+
+
+@pytest.fixture
+def make_policy():
+    """Factory of `tiny_diffusion_policy`, the tests read the camera keys and state size from `policy.config`."""
+    return tiny_diffusion_policy
@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pytest
+
+from lerobot.datasets.compute_stats import auto_downsample_height_width
+from lerobot.datasets.lerobot_dataset import LeRobotDataset
+
+from data.episode_encoder import JOURNAL_PATH, BackgroundEpisodeEncoder
+from data.image_writers import make_image_writer
+
+CAMERA_KEY = "observation.images.image"
+# Above the 300 px threshold of `auto_downsample_height_width`, so the stats downsample the frames.
+IMAGE_SHAPE = (240, 320, 3)
+
+
+def make_dataset(root, backend: str) -> LeRobotDataset:
+    features = {
+        CAMERA_KEY: {"dtype": "video", "shape": IMAGE_SHAPE, "names": ["height", "width", "channels"]},
+        "observation.state": {"dtype": "float32", "shape": (2,), "names": ["joint_1", "gripper"]},
+        "action": {"dtype": "float32", "shape": (2,), "names": ["joint_1", "gripper"]},
+    }
+    dataset = LeRobotDataset.create(repo_id="test/encoder", fps=10, root=root, features=features, use_videos=True)
+    dataset.image_writer = make_image_writer(backend, num_threads=2)
+    return dataset
+
+
+@pytest.mark.parametrize("backend", ["raw", "png_fast"])
+def test_commit_episode(tmp_path, backend):
+    dataset = make_dataset(tmp_path / "dataset", backend)
+    encoder = BackgroundEpisodeEncoder(dataset, num_workers=1)
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (12, *IMAGE_SHAPE), dtype=np.uint8)
+    for frame in frames:
+        state = rng.normal(size=2).astype(np.float32)
+        dataset.add_frame({CAMERA_KEY: frame, "observation.state": state, "action": state}, task="test")
+    encoder.save_episode()
+    encoder.close()
+    dataset.image_writer.stop()
+
+    assert encoder.jobs[0]["state"] == "done"
+    assert dataset.meta.total_episodes == 1
+    with open(dataset.root / JOURNAL_PATH) as f:
+        assert json.load(f) == []
+    assert (dataset.root / dataset.meta.get_video_file_path(0, CAMERA_KEY)).is_file()
+
+    # 12 frames: all of them are sampled, each downsampled like `sample_images` does.
+    stats = dataset.meta.episodes_stats[0][CAMERA_KEY]
+    images = np.stack([auto_downsample_height_width(frame.transpose(2, 0, 1)) for frame in frames])
+    assert stats["mean"].shape == (3, 1, 1)
+    np.testing.assert_allclose(stats["mean"][:, 0, 0], images.mean(axis=(0, 2, 3)) / 255, rtol=1e-6)
+    np.testing.assert_array_equal(stats["count"], [12])
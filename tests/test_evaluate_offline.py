@@ -0,0 +1,22 @@
+import torch
+
+from deploy.evaluate_offline import interleaved_indices, make_eval_dataset
+from train.synthetic import SYNTHETIC_CAMERA_KEYS, make_synthetic_dataset
+
+
+def test_eval_dataset_on_late_episodes(tmp_path):
+    make_synthetic_dataset(tmp_path / "dataset", num_episodes=4, episode_length=6, image_shape=(16, 16, 3))
+    dataset, observation_keys = make_eval_dataset(str(tmp_path / "dataset"))
+    assert observation_keys == ["observation.state", *SYNTHETIC_CAMERA_KEYS]
+
+    indices = interleaved_indices(dataset.episode_data_index, [2, 3], frame_stride=2)
+    assert indices == [12, 18, 14, 20, 16, 22]
+    loader = torch.utils.data.DataLoader(dataset, batch_size=2, sampler=indices)
+    for batch in loader:
+        # Timestep by timestep across the episodes, with the history and horizon of the training.
+        assert batch["episode_index"].tolist() == [2, 3]
+        assert batch["observation.state"].shape == (2, 2, 7)
+        assert batch["action"].shape == (2, 16, 7)
+        for key in SYNTHETIC_CAMERA_KEYS:
+            assert batch[key].dtype == torch.uint8
+            assert batch[key].shape == (2, 2, 3, 16, 16)
@@ -0,0 +1,35 @@
+import pytest
+import torch
+
+from deploy.feature_cache import FeatureCache
+from deploy.session import SessionManager
+
+IMAGE_SHAPE = (3, 32, 32)
+
+
+@pytest.mark.parametrize("stride", [1, 3])
+def test_cache_hits_over_session_steps(make_policy, stride):
+    policy = make_policy(image_shape=IMAGE_SHAPE, num_inference_steps=2)
+    camera_keys, state_dim = list(policy.config.image_features), policy.config.robot_state_feature.shape[0]
+    cache = FeatureCache()
+    cached_sessions = SessionManager(policy, stride=stride, feature_cache=cache)
+    plain_sessions = SessionManager(policy, stride=stride)
+    cached_id, plain_id = cached_sessions.open().session_id, plain_sessions.open().session_id
+
+    generator = torch.Generator().manual_seed(0)
+    num_ticks = 5 * stride * policy.config.n_action_steps
+    for t in range(num_ticks):
+        observation = {key: torch.randint(0, 256, IMAGE_SHAPE, dtype=torch.uint8, generator=generator) for key in camera_keys}
+        observation["observation.state"] = torch.randn(state_dim, generator=generator)
+        torch.manual_seed(t)
+        cached = cached_sessions.step(cached_id, t, observation)
+        torch.manual_seed(t)
+        plain = plain_sessions.step(plain_id, t, observation)
+        torch.testing.assert_close(cached["action"], plain["action"], rtol=1e-4, atol=1e-5)
+
+    # 5 inferences: the first one has a padded history of one frame, each of the others encodes its
+    # newest frame and finds the older one, encoded on a tick answered from the previous chunk (the
+    # last chunk also prefetches for the inference after the end of the sequence).
+    stats = cache.stats()
+    assert cached_sessions.get(cached_id).stats.inferences == 5
+    assert (stats["requests"], stats["hits"], stats["misses"], stats["prefetched"]) == (5, 4, 5, 5)
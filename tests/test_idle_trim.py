@@ -0,0 +1,64 @@
+import numpy as np
+
+from lerobot.datasets.lerobot_dataset import LeRobotDataset, LeRobotDatasetMetadata
+
+from data.idle_trim import hysteresis, idle_frames, load_motion, motion_speed, write_trimmed
+
+CAMERA_KEY = "observation.images.image"
+NAMES = ["joint_1", "gripper"]
+FPS = 10
+
+
+def make_dataset(root, episodes: list[np.ndarray]) -> LeRobotDataset:
+    """One episode per `(N,)` joint trajectory, every camera frame a flat gray level equal to 4 * its `index`."""
+    features = {
+        CAMERA_KEY: {"dtype": "video", "shape": (32, 32, 3), "names": ["height", "width", "channels"]},
+        "observation.state": {"dtype": "float32", "shape": (2,), "names": NAMES},
+        "action": {"dtype": "float32", "shape": (2,), "names": NAMES},
+    }
+    dataset = LeRobotDataset.create(repo_id="test/idle", fps=FPS, root=root, features=features, use_videos=True)
+    index = 0
+    for joint in episodes:
+        for value in joint:
+            state = np.array([value, 0.0], dtype=np.float32)
+            image = np.full((32, 32, 3), 4 * index, dtype=np.uint8)
+            dataset.add_frame({CAMERA_KEY: image, "observation.state": state, "action": state}, task="test")
+            index += 1
+        dataset.save_episode()
+    return dataset
+
+
+def test_trim_end_to_end(tmp_path):
+    # Episode 0: 1.5s at rest, 1.5s moving at 5000/s, 1s at rest. Episode 1: moving all along.
+    ep0 = np.concatenate([np.zeros(15), 500.0 * np.arange(1, 16), np.full(10, 7500.0)])
+    ep1 = 500.0 * np.arange(20)
+    make_dataset(tmp_path / "dataset", [ep0, ep1])
+
+    meta = LeRobotDatasetMetadata("test/idle", root=tmp_path / "dataset")
+    index, episode_index, motion = load_motion(meta)
+    active = hysteresis(motion_speed(motion, episode_index, FPS), episode_index, 1000, 3000)
+    removed = idle_frames(active, episode_index, FPS, min_idle_s=0.5, margin_s=0.2)
+    # Leading rest 0..14 and trailing rest 30..39 of episode 0, minus 2 frames next to the motion.
+    expected = np.zeros(60, dtype=bool)
+    expected[:13] = True
+    expected[32:40] = True
+    np.testing.assert_array_equal(removed, expected)
+
+    write_trimmed(meta, removed, index, str(tmp_path / "trimmed"), num_workers=1)
+    trimmed = LeRobotDataset("test/idle", root=tmp_path / "trimmed")
+    assert trimmed.meta.total_episodes == 2
+    assert trimmed.meta.total_frames == 60 - expected.sum()
+    assert [ep["length"] for ep in trimmed.meta.episodes.values()] == [19, 20]
+
+    kept = np.flatnonzero(~expected)
+    for i in range(len(trimmed)):
+        item = trimmed[i]
+        assert item["index"].item() == i
+        np.testing.assert_allclose(item["timestamp"].item(), item["frame_index"].item() / FPS, atol=1e-6)
+        assert item["observation.state"][0].item() == np.concatenate([ep0, ep1])[kept[i]]
+        # The video frame is the one of the same source frame.
+        gray = 255 * item[CAMERA_KEY].mean().item()
+        assert abs(gray - 4 * kept[i]) < 2
+    # Re-encoded and hard-linked videos both have their stats.
+    for ep in range(2):
+        assert trimmed.meta.episodes_stats[ep][CAMERA_KEY]["mean"].shape == (3, 1, 1)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from robot.motors.piper.kinematics import rotation_error
+
+
+def axis_angle_matrix(rotvec: np.ndarray) -> np.ndarray:
+    """Rodrigues' formula, `(3,)` rotation vector to `(3, 3)` rotation."""
+    angle = np.linalg.norm(rotvec)
+    x, y, z = rotvec / angle
+    K = np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+    return np.eye(3) + np.sin(angle) * K + (1 - np.cos(angle)) * K @ K
+
+
+@pytest.mark.parametrize("angle", [1e-3, 1.0, np.pi / 2, 3.0, np.pi - 1e-4])
+def test_rotation_error_recovers_the_rotation_vector(angle):
+    rng = np.random.default_rng(0)
+    axis = rng.normal(size=3)
+    rotvec = angle * axis / np.linalg.norm(axis)
+    R = axis_angle_matrix(rng.normal(size=3))
+    R_target = axis_angle_matrix(rotvec) @ R
+    np.testing.assert_allclose(rotation_error(R_target[None], R[None])[0], rotvec, atol=1e-6)
+
+
+def test_rotation_error_at_180_degrees():
+    axis = np.array([1.0, -2.0, 3.0]) / np.sqrt(14)
+    R = np.eye(3)[None]
+    R_target = axis_angle_matrix(np.pi * axis)[None]
+    error = rotation_error(R_target, R)[0]
+    # Rotating by pi about the axis or its opposite is the same rotation.
+    np.testing.assert_allclose(np.abs(error), np.pi * np.abs(axis), atol=1e-6)
+    np.testing.assert_allclose(axis_angle_matrix(error), R_target[0], atol=1e-6)
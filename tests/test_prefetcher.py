@@ -0,0 +1,21 @@
+import threading
+import time
+
+import torch
+
+from train.prefetcher import ThreadPrefetcher
+
+
+def test_stop_with_a_full_queue_after_the_last_batch():
+    dataloader = [{"x": torch.full((2,), i)} for i in range(3)]
+    prefetcher = ThreadPrefetcher(dataloader, torch.device("cpu"), depth=2)
+    batches = iter(prefetcher)
+    assert next(batches)["x"][0].item() == 0
+    # The worker has queued the two other batches and waits to queue the end marker.
+    time.sleep(0.5)
+
+    # The consumer stops early, e.g. `training_steps` reached: closing must not wait for the worker forever.
+    closer = threading.Thread(target=batches.close, daemon=True)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive()
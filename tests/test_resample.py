@@ -0,0 +1,39 @@
+import numpy as np
+
+from lerobot.datasets.lerobot_dataset import LeRobotDataset, LeRobotDatasetMetadata
+
+from data.resample import resample_positions, write_resampled
+from train.synthetic import SYNTHETIC_CAMERA_KEYS, make_synthetic_dataset
+
+
+def test_resample_positions():
+    np.testing.assert_array_equal(resample_positions(31, 30, 10), np.arange(11) * 3)
+    np.testing.assert_array_equal(resample_positions(30, 30, 10), np.arange(10) * 3)
+    np.testing.assert_allclose(resample_positions(5, 30, 20), [0, 1.5, 3])
+
+
+def test_resample_end_to_end(tmp_path):
+    source = make_synthetic_dataset(tmp_path / "dataset", num_episodes=2, episode_length=30, fps=30, image_shape=(48, 64, 3))
+    meta = LeRobotDatasetMetadata(source.repo_id, root=source.root)
+    write_resampled(meta, str(tmp_path / "resampled"), fps=10, resolution=(24, 32), alignment="linear", num_workers=2)
+
+    resampled = LeRobotDataset(source.repo_id, root=tmp_path / "resampled")
+    assert resampled.fps == 10
+    assert [ep["length"] for ep in resampled.meta.episodes.values()] == [10, 10]
+    for key in SYNTHETIC_CAMERA_KEYS:
+        assert resampled.meta.features[key]["shape"] == (24, 32, 3)
+        assert resampled.meta.features[key]["info"]["video.fps"] == 10
+        assert resampled.meta.features[key]["info"]["video.width"] == 32
+
+    # 30 -> 10 fps: new frame k of an episode is source frame 3k, state and action included.
+    source_states = source.hf_dataset.with_format("numpy")["observation.state"]
+    for i in range(len(resampled)):
+        item = resampled[i]
+        ep, k = item["episode_index"].item(), item["frame_index"].item()
+        assert item["index"].item() == i
+        np.testing.assert_allclose(item["timestamp"].item(), k / 10, atol=1e-6)
+        np.testing.assert_allclose(item["observation.state"].numpy(), source_states[30 * ep + 3 * k])
+        for key in SYNTHETIC_CAMERA_KEYS:
+            assert tuple(item[key].shape) == (3, 24, 32)
+    for ep in range(2):
+        assert resampled.meta.episodes_stats[ep][SYNTHETIC_CAMERA_KEYS[0]]["count"][0] == 10
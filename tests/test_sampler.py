@@ -0,0 +1,22 @@
+import torch
+
+from train.sampler import EpisodeBlockBatchSampler
+
+EPISODE_DATA_INDEX = {"from": torch.tensor([0, 50, 130]), "to": torch.tensor([50, 130, 200])}
+
+
+def test_resume_skips_the_trained_batches():
+    for rank in range(2):
+        kwargs = dict(batch_size=8, block_size=16, blocks_per_batch=2, num_workers=2, rank=rank, world_size=2)
+        sampler = EpisodeBlockBatchSampler(EPISODE_DATA_INDEX, **kwargs)
+        sampler.set_epoch(3)
+        full = list(sampler)
+
+        resumed = EpisodeBlockBatchSampler(EPISODE_DATA_INDEX, **kwargs)
+        resumed.set_epoch(3, start_batch=5)
+        assert list(resumed) == full[5:]
+        assert len(resumed) == len(full) - 5
+        # The next epoch starts from its first batch again.
+        resumed.set_epoch(4)
+        sampler.set_epoch(4)
+        assert list(resumed) == list(sampler)
@@ -0,0 +1,54 @@
+import socket
+import threading
+
+from deploy.client import StreamingInferenceClient
+from deploy.server import BaseInferenceServer
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_latest_policy_keeps_reply_order():
+    port = free_port()
+    server = BaseInferenceServer(host="127.0.0.1", port=port, overload_policy="latest")
+    server.register_endpoint("step", lambda data: {"timestep": data["timestep"]})
+    server.register_endpoint("echo", lambda data: data)
+    client = StreamingInferenceClient(host="127.0.0.1", port=port)
+
+    # Queued before the server runs, so that they all are coalesced in its first round.
+    client.submit("echo", {"value": 0})
+    client.submit("step", {"session_id": "a", "timestep": 0})
+    client.submit("step", {"session_id": "b", "timestep": 0})
+    client.socket.send_multipart([b"", b"not a request"])
+    client.in_flight.append((client.next_request_id, 0.0))
+    client.next_request_id += 1
+    client.submit("step", {"session_id": "a", "timestep": 1})
+    client.submit("echo", {"value": 1})
+    client.submit("echo", {"value": 2})
+    client.submit("kill", requires_input=False)
+
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    replies = []
+    while len(replies) < 8:
+        received = client.poll(5000)
+        assert received, "no reply from the server"
+        replies += received
+    thread.join(timeout=5)
+    client.socket.close()
+    server.socket.close(linger=0)
+
+    assert [reply.request_id for reply in replies] == list(range(8))
+    assert [(reply.result, reply.dropped) for reply in replies[:7]] == [
+        ({"value": 0}, None),
+        (None, "stale"),
+        ({"timestep": 0}, None),
+        (None, "error"),
+        ({"timestep": 1}, None),
+        ({"value": 1}, None),
+        ({"value": 2}, None),
+    ]
+    assert server.stats.dropped_stale == 1
@@ -0,0 +1,32 @@
+from functools import partial
+
+import torch
+
+from train.preprocess import BatchImagePreprocessor
+from train.train_modes import check_modes
+
+IMAGE_SIZE = 32
+CROP_SHAPE = (28, 28)
+
+
+def make_batches(camera_keys: list[str], state_dim: int, batch_size: int = 4):
+    generator = torch.Generator().manual_seed(0)
+    while True:
+        batch = {
+            key: torch.randint(0, 256, (batch_size, 2, 3, IMAGE_SIZE, IMAGE_SIZE), dtype=torch.uint8, generator=generator)
+            for key in camera_keys
+        }
+        batch["observation.state"] = torch.rand(batch_size, 2, state_dim, generator=generator) * 2 - 1
+        batch["action"] = torch.rand(batch_size, 16, state_dim, generator=generator) * 2 - 1
+        batch["action_is_pad"] = torch.zeros(batch_size, 16, dtype=torch.bool)
+        yield batch
+
+
+def test_check_modes_match_fp32(make_policy):
+    # The preprocessor crops the images before the policy, which sees them at the crop size.
+    new_policy = partial(make_policy, image_shape=(3, *CROP_SHAPE), crop_shape=CROP_SHAPE, train=True)
+    config = new_policy().config
+    camera_keys, state_dim = list(config.image_features), config.robot_state_feature.shape[0]
+    preprocessor = BatchImagePreprocessor(camera_keys, crop_shape=CROP_SHAPE)
+    batches = partial(make_batches, camera_keys, state_dim)
+    assert check_modes(new_policy, batches, torch.device("cpu"), preprocessor)
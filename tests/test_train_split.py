@@ -0,0 +1,41 @@
+import torch
+
+from train.multi_dataset import make_dataset
+from train.synthetic import make_synthetic_dataset
+from train.train_dp import split_held_out
+
+DELTA_TIMESTAMPS = {"observation.state": [-0.1, 0.0], "action": [0.0, 0.1, 0.2]}
+
+
+def check_split(dataset, num_val_episodes):
+    train_index, val_positions = split_held_out(dataset.episode_data_index, num_val_episodes)
+    num_train = dataset.num_episodes - num_val_episodes
+    assert len(train_index["from"]) == num_train
+    assert train_index["to"][-1].item() == val_positions[0]
+    assert val_positions[-1] == len(dataset) - 1
+
+    # The held-out frames load with their history and horizon, which a dataset on these episodes only can not.
+    val_episodes = set()
+    for position in val_positions:
+        item = dataset[position]
+        val_episodes.add(item["episode_index"].item())
+        assert item["observation.state"].shape[0] == 2
+        assert item["action"].shape[0] == 3
+    assert val_episodes == set(range(num_train, dataset.num_episodes))
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=8, sampler=torch.utils.data.SubsetRandomSampler(val_positions)
+    )
+    assert sum(len(batch["index"]) for batch in loader) == len(val_positions)
+
+
+def test_split_single_dataset(tmp_path):
+    make_synthetic_dataset(tmp_path / "a", num_episodes=3, episode_length=10, image_shape=(16, 16, 3))
+    dataset = make_dataset([str(tmp_path / "a")], delta_timestamps=DELTA_TIMESTAMPS)
+    check_split(dataset, 1)
+
+
+def test_split_multi_dataset(tmp_path):
+    make_synthetic_dataset(tmp_path / "a", num_episodes=2, episode_length=10, image_shape=(16, 16, 3))
+    make_synthetic_dataset(tmp_path / "b", num_episodes=3, episode_length=12, image_shape=(16, 16, 3), seed=1)
+    dataset = make_dataset([str(tmp_path / "a"), str(tmp_path / "b")], delta_timestamps=DELTA_TIMESTAMPS)
+    check_split(dataset, 2)
@@ -0,0 +1,206 @@
+"""Asynchronous checkpointing for the training loop.
+
+`policy.save_pretrained` serializes the weights on the training thread, so the GPU idles while the
+checkpoint is written to disk. `AsyncCheckpointer.save` only copies the state into reusable (pinned)
+CPU buffers and hands the write to a background thread. A checkpoint is written to a temporary
+directory and renamed into place, so a crash never leaves a half-written `step_N`.
+
+A checkpoint directory holds the same `config.json` / `model.safetensors` as `save_pretrained`
+(`DiffusionPolicy.from_pretrained` and the policy server load it unchanged) plus
+`training_state.pt` with the optimizer, grad scaler, step and RNG states to resume from. When EMA
+weights are kept they are saved as a loadable policy directory under `ema/`, and the latest offline
+evaluation metrics as `eval_metrics.json`.
+"""
+
+import copy
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import torch
+from safetensors.torch import load_file, save_file
+
+MODEL_FILE = "model.safetensors"
+TRAINING_STATE_FILE = "training_state.pt"
+EMA_DIR = "ema"
+EVAL_METRICS_FILE = "eval_metrics.json"
+
+
+def unwrap_model(model):
+    return model.module if hasattr(model, "module") else model
+
+
+class AsyncCheckpointer:
+    """
+    Args:
+        output_dir: Directory where the `step_N` checkpoints are written.
+        keep_last: Number of `step_N` checkpoints to keep, None keeps all of them.
+    """
+
+    def __init__(self, output_dir: str | Path, keep_last: int | None = None):
+        self.output_dir = Path(output_dir)
+        self.keep_last = keep_last
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending: Future | None = None
+        self._buffers: dict[str, torch.Tensor] = {}
+        self.stall_s = 0.0
+        self.write_s = 0.0
+        self.num_saves = 0
+
+    def _snapshot(self, obj, path: str = ""):
+        """Copy every tensor of a (nested) state dict into a CPU buffer reused across checkpoints."""
+        if isinstance(obj, torch.Tensor):
+            buffer = self._buffers.get(path)
+            if buffer is None or buffer.shape != obj.shape or buffer.dtype != obj.dtype:
+                buffer = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=obj.is_cuda)
+                self._buffers[path] = buffer
+            return buffer.copy_(obj.detach(), non_blocking=True)
+        if isinstance(obj, dict):
+            return {k: self._snapshot(v, f"{path}/{k}") for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._snapshot(v, f"{path}/{i}") for i, v in enumerate(obj))
+        return obj
+
+    def save(
+        self,
+        policy,
+        name: str,
+        optimizer: torch.optim.Optimizer | None = None,
+        training_state: dict | None = None,
+        ema_policy=None,
+        metrics: dict | None = None,
+    ) -> Future:
+        """
+        Snapshot `policy` (and the optimizer/training state for resuming, the EMA weights and the
+        evaluation metrics) and write it to `output_dir / name` in the background. Returns the
+        future of the write.
+        """
+        start = time.perf_counter()
+        # Only one write in flight, so the snapshot buffers can be reused.
+        self.wait()
+        policy = unwrap_model(policy)
+        model_state = self._snapshot(policy.state_dict(), "model")
+        ema_state = self._snapshot(ema_policy.state_dict(), "ema") if ema_policy is not None else None
+        state = None
+        if optimizer is not None or training_state is not None:
+            state = dict(training_state or {})
+            if optimizer is not None:
+                state["optimizer"] = self._snapshot(optimizer.state_dict(), "optimizer")
+            state["rng"] = {"torch": torch.get_rng_state()}
+            if torch.cuda.is_available():
+                state["rng"]["cuda"] = torch.cuda.get_rng_state_all()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        self.stall_s += time.perf_counter() - start
+
+        self._pending = self._executor.submit(
+            self._write, policy.config, model_state, state, ema_state, copy.deepcopy(metrics), name
+        )
+        return self._pending
+
+    def _write(
+        self, config, model_state: dict, state: dict | None, ema_state: dict | None, metrics: dict | None, name: str
+    ):
+        start = time.perf_counter()
+        final_dir = self.output_dir / name
+        tmp_dir = self.output_dir / f".{name}.tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        config._save_pretrained(tmp_dir)
+        # The snapshot buffers are contiguous copies, so tied weights are saved as separate tensors.
+        save_file(model_state, str(tmp_dir / MODEL_FILE))
+        if state is not None:
+            torch.save(state, tmp_dir / TRAINING_STATE_FILE)
+        if ema_state is not None:
+            (tmp_dir / EMA_DIR).mkdir()
+            config._save_pretrained(tmp_dir / EMA_DIR)
+            save_file(ema_state, str(tmp_dir / EMA_DIR / MODEL_FILE))
+        if metrics is not None:
+            with open(tmp_dir / EVAL_METRICS_FILE, "w") as f:
+                json.dump(metrics, f, indent=4)
+
+        if final_dir.exists():
+            shutil.rmtree(final_dir)
+        os.replace(tmp_dir, final_dir)
+        self._apply_retention()
+        self.write_s += time.perf_counter() - start
+        self.num_saves += 1
+
+    def _apply_retention(self):
+        if self.keep_last is None:
+            return
+        steps = sorted(
+            (int(m.group(1)), path)
+            for path in self.output_dir.iterdir()
+            if path.is_dir() and (m := re.fullmatch(r"step_(\d+)", path.name))
+        )
+        for _, path in steps[: max(len(steps) - self.keep_last, 0)]:
+            shutil.rmtree(path)
+
+    def wait(self):
+        """Block until the pending write is done, re-raising its error if it failed."""
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+        if self.num_saves > 0:
+            print(
+                f"{self.num_saves} checkpoints: {1e3 * self.stall_s / self.num_saves:.1f}ms stall per checkpoint, "
+                f"{1e3 * self.write_s / self.num_saves:.1f}ms written in the background "
+                f"({self.write_s:.1f}s of training stall saved)"
+            )
+
+
+def find_latest_checkpoint(output_dir: str | Path) -> Path | None:
+    """Latest `step_N` directory of `output_dir` with a training state, or None."""
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir():
+        return None
+    steps = sorted(
+        (int(m.group(1)), path)
+        for path in output_dir.iterdir()
+        if (m := re.fullmatch(r"step_(\d+)", path.name)) and (path / TRAINING_STATE_FILE).is_file()
+    )
+    return steps[-1][1] if steps else None
+
+
+def load_checkpoint(
+    checkpoint_dir: str | Path,
+    policy,
+    optimizer: torch.optim.Optimizer | None = None,
+    device: torch.device | str = "cpu",
+    ema_policy=None,
+) -> dict:
+    """
+    Load the weights of `checkpoint_dir` into `policy` and, if present, the optimizer state and the
+    EMA weights.
+    Returns the remaining training state (`step`, `epoch`, ...), empty for weight-only checkpoints
+    written by `save_pretrained`.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    policy = unwrap_model(policy)
+    policy.load_state_dict(load_file(str(checkpoint_dir / MODEL_FILE), device=str(device)))
+    if ema_policy is not None and (checkpoint_dir / EMA_DIR / MODEL_FILE).is_file():
+        ema_policy.load_state_dict(load_file(str(checkpoint_dir / EMA_DIR / MODEL_FILE), device=str(device)))
+
+    state_path = checkpoint_dir / TRAINING_STATE_FILE
+    if not state_path.is_file():
+        return {}
+    state = torch.load(state_path, map_location="cpu", weights_only=False)
+    if optimizer is not None and "optimizer" in state:
+        optimizer.load_state_dict(state.pop("optimizer"))
+    rng = state.pop("rng", {})
+    if "torch" in rng:
+        torch.set_rng_state(rng["torch"])
+    if "cuda" in rng and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng["cuda"])
+    return state
@@ -0,0 +1,104 @@
+"""DistributedDataParallel helpers for `train_dp.py`.
+
+Launch with torchrun, e.g. 4 processes on a CPU-only box (gloo backend):
+
+    torchrun --standalone --nproc_per_node 4 -m train.train_dp --device cpu --synthetic
+
+or one process per GPU (nccl backend):
+
+    torchrun --nnodes 2 --nproc_per_node 8 --rdzv_backend c10d --rdzv_endpoint $MASTER:29500 \\
+        -m train.train_dp --device cuda
+"""
+
+import os
+from dataclasses import dataclass
+
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+
+@dataclass
+class DistInfo:
+    rank: int = 0
+    world_size: int = 1
+    local_rank: int = 0
+
+    @property
+    def is_distributed(self) -> bool:
+        return self.world_size > 1
+
+    @property
+    def is_main(self) -> bool:
+        return self.rank == 0
+
+
+def init_distributed(device_type: str, backend: str | None = None) -> DistInfo:
+    """
+    Initialize the process group from the torchrun environment. Without torchrun (no WORLD_SIZE),
+    this is a single-process run and nothing is initialized.
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return DistInfo()
+    info = DistInfo(
+        rank=int(os.environ["RANK"]),
+        world_size=world_size,
+        local_rank=int(os.environ.get("LOCAL_RANK", 0)),
+    )
+    if backend is None:
+        backend = "nccl" if device_type == "cuda" else "gloo"
+    if device_type == "cuda":
+        torch.cuda.set_device(info.local_rank)
+    dist.init_process_group(backend=backend)
+    return info
+
+
+def resolve_device(device: str, info: DistInfo) -> torch.device:
+    """In distributed GPU runs every process uses the GPU of its local rank."""
+    device = torch.device(device)
+    if info.is_distributed and device.type == "cuda":
+        return torch.device("cuda", info.local_rank)
+    return device
+
+
+def wrap_ddp(policy, device: torch.device, info: DistInfo, bucket_cap_mb: int = 25):
+    """
+    Wrap `policy` with DDP. Gradients are all-reduced in buckets of `bucket_cap_mb` while the
+    backward pass is still running, and the buckets are used as the gradient storage directly.
+    """
+    if not info.is_distributed:
+        return policy
+    return DistributedDataParallel(
+        policy,
+        device_ids=[device.index] if device.type == "cuda" else None,
+        bucket_cap_mb=bucket_cap_mb,
+        gradient_as_bucket_view=True,
+    )
+
+
+def broadcast_object(obj, info: DistInfo):
+    """Send `obj` from rank 0 to every rank."""
+    if not info.is_distributed:
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
+
+
+def all_reduce_mean(value: float, device: torch.device, info: DistInfo) -> float:
+    if not info.is_distributed:
+        return value
+    tensor = torch.tensor(value, device=device)
+    dist.all_reduce(tensor)
+    return tensor.item() / info.world_size
+
+
+def barrier(info: DistInfo):
+    if info.is_distributed:
+        dist.barrier()
+
+
+def cleanup_distributed(info: DistInfo):
+    if info.is_distributed:
+        dist.destroy_process_group()
@@ -0,0 +1,48 @@
+"""Exponential moving average of the policy weights."""
+
+import copy
+
+import torch
+
+from train.checkpoint import unwrap_model
+
+
+class EMAModel:
+    """
+    Keeps `ema = decay * ema + (1 - decay) * weights` after every optimizer step. The update is a
+    single fused multi-tensor `_foreach_lerp_` over all the floating point parameters, so it costs a
+    few kernel launches regardless of the number of layers. Buffers (normalization stats, ...) are
+    copied as is.
+
+    The decay is warmed up as `min(decay, (1 + n) / (10 + n))` so that the early, still random
+    weights are forgotten quickly.
+    """
+
+    def __init__(self, model, decay: float = 0.999):
+        model = unwrap_model(model)
+        self.decay = decay
+        self.num_updates = 0
+        self.model = copy.deepcopy(model).eval().requires_grad_(False)
+        pairs = [
+            (ema_p, p)
+            for ema_p, p in zip(self.model.parameters(), model.parameters())
+            if ema_p.dtype.is_floating_point
+        ]
+        self._ema_params = [ema_p for ema_p, _ in pairs]
+        self._params = [p for _, p in pairs]
+        self._ema_buffers = list(self.model.buffers())
+        self._buffers = list(model.buffers())
+
+    @torch.no_grad()
+    def update(self):
+        decay = min(self.decay, (1 + self.num_updates) / (10 + self.num_updates))
+        self.num_updates += 1
+        torch._foreach_lerp_(self._ema_params, self._params, 1.0 - decay)
+        if self._ema_buffers:
+            torch._foreach_copy_(self._ema_buffers, self._buffers)
+
+    def state_dict(self) -> dict:
+        return self.model.state_dict()
+
+    def load_state_dict(self, state_dict: dict):
+        self.model.load_state_dict(state_dict)
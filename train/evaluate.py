@@ -0,0 +1,119 @@
+"""Offline evaluation of the diffusion policy on held-out episodes while training keeps running.
+
+`BackgroundEvaluator.submit` copies the weights to evaluate into a dedicated model and computes the
+action MSE of its predicted chunks against the ground-truth `action` windows in a background thread,
+batched and under `torch.inference_mode`. On GPU the evaluation runs on its own CUDA stream.
+"""
+
+import copy
+import threading
+
+import numpy as np
+import torch
+
+from train.checkpoint import unwrap_model
+from train.prefetcher import batch_to_device
+
+OBS_IMAGES = "observation.images"
+
+
+@torch.inference_mode()
+def predict_action_chunk(policy, batch: dict) -> torch.Tensor:
+    """
+    Stateless, batched version of `DiffusionPolicy.select_action`: `batch` holds the whole observation
+    history (`(B, n_obs_steps, ...)` for every input feature) instead of relying on the policy queues.
+    Returns the unnormalized `(B, n_action_steps, action_dim)` chunk that would be executed.
+    """
+    batch = policy.normalize_inputs(batch)
+    if policy.config.image_features:
+        batch = dict(batch)
+        batch[OBS_IMAGES] = torch.stack([batch[key] for key in policy.config.image_features], dim=-4)
+    actions = policy.diffusion.generate_actions(batch)
+    return policy.unnormalize_outputs({"action": actions})["action"]
+
+
+def action_window(batch: dict, n_obs_steps: int, n_action_steps: int) -> tuple[torch.Tensor, torch.Tensor]:
+    """Ground-truth actions aligned with `predict_action_chunk` and their validity mask."""
+    start = n_obs_steps - 1
+    end = start + n_action_steps
+    actions = batch["action"][:, start:end]
+    if "action_is_pad" in batch:
+        valid = ~batch["action_is_pad"][:, start:end]
+    else:
+        valid = torch.ones(actions.shape[:2], dtype=torch.bool, device=actions.device)
+    return actions, valid
+
+
+@torch.inference_mode()
+def evaluate_action_mse(policy, dataloader, device: torch.device, preprocessor=None, max_batches: int | None = None) -> dict:
+    """Action MSE (overall and per action dimension) of the predicted chunks over `dataloader`."""
+    policy.eval()
+    sq_err_sum = None
+    count = None
+    for i, batch in enumerate(dataloader):
+        if max_batches is not None and i >= max_batches:
+            break
+        batch = batch_to_device(batch, device)
+        if preprocessor is not None:
+            batch = preprocessor(batch, training=False)
+        pred = predict_action_chunk(policy, batch)
+        gt, valid = action_window(batch, policy.config.n_obs_steps, policy.config.n_action_steps)
+        valid = valid.unsqueeze(-1).to(pred.dtype)
+        batch_sq_err = ((pred - gt) ** 2 * valid).sum(dim=(0, 1))
+        batch_count = valid.sum(dim=(0, 1))
+        sq_err_sum = batch_sq_err if sq_err_sum is None else sq_err_sum + batch_sq_err
+        count = batch_count if count is None else count + batch_count
+
+    per_joint = (sq_err_sum / count.clamp(min=1)).cpu().numpy()
+    return {"action_mse": float(np.mean(per_joint)), "action_mse_per_joint": per_joint.tolist()}
+
+
+class BackgroundEvaluator:
+    """
+    Evaluates snapshots of the weights in a background thread. Only one evaluation runs at a time,
+    a `submit` while the previous one is still running is skipped.
+    """
+
+    def __init__(self, policy, dataloader, device: torch.device, preprocessor=None, max_batches: int | None = None):
+        self.model = copy.deepcopy(unwrap_model(policy)).eval().requires_grad_(False)
+        self.dataloader = dataloader
+        self.device = device
+        self.preprocessor = preprocessor
+        self.max_batches = max_batches
+        self.stream = torch.cuda.Stream(device) if device.type == "cuda" else None
+        self._thread = None
+        self.results: dict[int, dict] = {}
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, state_dict: dict, step: int) -> bool:
+        """Evaluate `state_dict` (e.g. the EMA weights) as of `step`. Returns False if skipped."""
+        if self.busy:
+            return False
+        # Copy on the training stream so the weights are consistent with `step`.
+        with torch.no_grad():
+            self.model.load_state_dict(state_dict)
+        if self.stream is not None:
+            self.stream.wait_stream(torch.cuda.current_stream(self.device))
+        self._thread = threading.Thread(target=self._run, args=(step,), daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, step: int):
+        if self.stream is not None:
+            with torch.cuda.stream(self.stream):
+                metrics = evaluate_action_mse(self.model, self.dataloader, self.device, self.preprocessor, self.max_batches)
+        else:
+            metrics = evaluate_action_mse(self.model, self.dataloader, self.device, self.preprocessor, self.max_batches)
+        metrics["step"] = step
+        self.results[step] = metrics
+        print(f"eval step: {step} action_mse: {metrics['action_mse']:.5f}")
+
+    def latest(self) -> dict | None:
+        return self.results[max(self.results)] if self.results else None
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
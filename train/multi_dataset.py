@@ -0,0 +1,144 @@
+"""Training on several recorded datasets at once without merging them on disk.
+
+`MultiDataset` concatenates `LeRobotDataset`s of the same robot (same fps and features) and exposes
+what the training loop uses from a single dataset: `episode_data_index`, the frame positions and the
+metadata. The items are re-indexed as in a merged dataset (`python -m data.merge_datasets`):
+`episode_index` and `index` are offset by the episodes and frames of the datasets before, and
+`task_index` refers to the union of the task tables. The normalization stats are aggregated from
+the stats of every dataset, the data is not read again.
+
+    python -m train.train_dp --dataset_path test2/piper_test81 test2/piper_test86 ...
+"""
+
+import bisect
+
+import numpy as np
+import torch
+
+from lerobot.datasets.compute_stats import aggregate_stats
+from lerobot.datasets.lerobot_dataset import LeRobotDataset, LeRobotDatasetMetadata
+
+
+def check_compatible(metas: list[LeRobotDatasetMetadata]):
+    """Raise if the datasets cannot be concatenated: different fps, feature keys, dtypes, shapes or names."""
+    first = metas[0]
+    for meta in metas[1:]:
+        if meta.fps != first.fps:
+            raise ValueError(f"{meta.repo_id} is recorded at {meta.fps} fps, {first.repo_id} at {first.fps} fps.")
+        if set(meta.features) != set(first.features):
+            raise ValueError(
+                f"Features of {meta.repo_id} and {first.repo_id} differ: "
+                f"{sorted(set(meta.features) ^ set(first.features))}"
+            )
+        for key, ft in first.features.items():
+            other = meta.features[key]
+            # The video `info` (codec, resolution of the files) may differ, the decoded frames may not.
+            signature = [ft["dtype"], list(ft["shape"]), ft.get("names")]
+            if signature != [other["dtype"], list(other["shape"]), other.get("names")]:
+                raise ValueError(f"Feature {key} of {meta.repo_id} does not match the one of {first.repo_id}.")
+
+
+class MultiDatasetMetadata:
+    """Union of the metadata of several datasets, with the global numbering of their episodes, frames and tasks."""
+
+    def __init__(self, dataset_paths: list[str]):
+        self.metas = [LeRobotDatasetMetadata(path) for path in dataset_paths]
+        check_compatible(self.metas)
+        first = self.metas[0]
+        self.repo_id = "+".join(meta.repo_id for meta in self.metas)
+        self.fps = first.fps
+        self.features = first.features
+        self.camera_keys = first.camera_keys
+        self.video_keys = first.video_keys
+        self.episode_offsets = np.cumsum([0] + [meta.total_episodes for meta in self.metas]).tolist()
+        self.frame_offsets = np.cumsum([0] + [meta.total_frames for meta in self.metas]).tolist()
+        self.total_episodes = self.episode_offsets[-1]
+        self.total_frames = self.frame_offsets[-1]
+
+        # Union of the tasks in order of first appearance, and the local -> global task index of every dataset.
+        self.tasks: dict[int, str] = {}
+        self.task_to_task_index: dict[str, int] = {}
+        self.task_maps = []
+        for meta in self.metas:
+            task_map = {}
+            for task_index, task in sorted(meta.tasks.items()):
+                if task not in self.task_to_task_index:
+                    self.task_to_task_index[task] = len(self.tasks)
+                    self.tasks[len(self.tasks)] = task
+                task_map[task_index] = self.task_to_task_index[task]
+            self.task_maps.append(task_map)
+
+        # Count-weighted combination of the per-dataset stats, exact for mean/std/min/max.
+        self.stats = aggregate_stats([meta.stats for meta in self.metas])
+
+class MultiDataset(torch.utils.data.Dataset):
+    """
+    Args:
+        dataset_paths: datasets to concatenate, in this order. All their episodes are loaded: a
+            `LeRobotDataset` on a subset of the episodes other than a prefix fails with
+            `delta_timestamps`, hold episodes out with a sampler instead.
+        **kwargs: `delta_timestamps`, `image_transforms`, ... passed to every `LeRobotDataset`.
+    """
+
+    def __init__(self, dataset_paths: list[str], **kwargs):
+        super().__init__()
+        self.meta = MultiDatasetMetadata(dataset_paths)
+        self.dataset_ids = list(range(len(dataset_paths)))
+        self.datasets = [LeRobotDataset(path, **kwargs) for path in dataset_paths]
+        self.cumulative_sizes = np.cumsum([0] + [len(ds) for ds in self.datasets]).tolist()
+        self.task_lookups = [
+            torch.tensor([self.meta.task_maps[i][t] for t in sorted(self.meta.task_maps[i])]) for i in self.dataset_ids
+        ]
+
+        ep_from, ep_to = [], []
+        for ds, offset in zip(self.datasets, self.cumulative_sizes, strict=False):
+            ep_from.append(ds.episode_data_index["from"] + offset)
+            ep_to.append(ds.episode_data_index["to"] + offset)
+        self.episode_data_index = {"from": torch.cat(ep_from), "to": torch.cat(ep_to)}
+
+    @property
+    def fps(self) -> int:
+        return self.meta.fps
+
+    @property
+    def features(self) -> dict:
+        return self.meta.features
+
+    @property
+    def num_frames(self) -> int:
+        return self.cumulative_sizes[-1]
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episode_data_index["from"])
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, idx) -> dict:
+        k = bisect.bisect_right(self.cumulative_sizes, idx) - 1
+        item = self.datasets[k][idx - self.cumulative_sizes[k]]
+        i = self.dataset_ids[k]
+        item["episode_index"] = item["episode_index"] + self.meta.episode_offsets[i]
+        item["index"] = item["index"] + self.meta.frame_offsets[i]
+        item["task_index"] = self.task_lookups[k][item["task_index"]]
+        return item
+
+    def local_indices(self) -> list[tuple[int, np.ndarray]]:
+        """For every dataset, its position in `dataset_paths` and the `index` column of its frames."""
+        return [
+            (i, ds.hf_dataset.with_format("numpy")["index"]) for i, ds in zip(self.dataset_ids, self.datasets, strict=True)
+        ]
+
+
+def load_metadata(dataset_paths: list[str]) -> LeRobotDatasetMetadata | MultiDatasetMetadata:
+    if len(dataset_paths) == 1:
+        return LeRobotDatasetMetadata(dataset_paths[0])
+    return MultiDatasetMetadata(dataset_paths)
+
+
+def make_dataset(dataset_paths: list[str], **kwargs) -> LeRobotDataset | MultiDataset:
+    """A plain `LeRobotDataset` for a single path, a `MultiDataset` for several."""
+    if len(dataset_paths) == 1:
+        return LeRobotDataset(dataset_paths[0], **kwargs)
+    return MultiDataset(dataset_paths, **kwargs)
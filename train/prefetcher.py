@@ -0,0 +1,117 @@
+"""Batch prefetchers that overlap the host-to-device copy of batch N+1 with the compute of batch N."""
+
+import queue
+import threading
+
+import torch
+
+
+def batch_to_device(batch: dict, device: torch.device, non_blocking: bool = True) -> dict:
+    return {k: (v.to(device, non_blocking=non_blocking) if isinstance(v, torch.Tensor) else v) for k, v in batch.items()}
+
+
+class CUDAPrefetcher:
+    """
+    Issues the `non_blocking` copy of the next batch on a side CUDA stream. The DataLoader should use
+    `pin_memory=True`, otherwise the copies are synchronous anyway.
+    """
+
+    def __init__(self, dataloader, device: torch.device):
+        self.dataloader = dataloader
+        self.device = device
+        self.stream = torch.cuda.Stream(device)
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def _preload(self, iterator):
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            return batch_to_device(batch, self.device)
+
+    def __iter__(self):
+        iterator = iter(self.dataloader)
+        next_batch = self._preload(iterator)
+        while next_batch is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(self.stream)
+            batch = next_batch
+            # The tensors were allocated on the side stream, tell the allocator they are used here.
+            for v in batch.values():
+                if isinstance(v, torch.Tensor):
+                    v.record_stream(current_stream)
+            next_batch = self._preload(iterator)
+            yield batch
+
+
+class ThreadPrefetcher:
+    """
+    Fallback for CPU (or when no side stream is wanted): a background thread pulls batches from the
+    DataLoader and moves them to `device`, keeping up to `depth` batches ready.
+    """
+
+    _END = object()
+
+    def __init__(self, dataloader, device: torch.device, depth: int = 2):
+        self.dataloader = dataloader
+        self.device = device
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    @staticmethod
+    def _put(batches: queue.Queue, stop: threading.Event, item) -> bool:
+        """Put `item` unless the consumer stops first (the queue may stay full then). Returns whether it was put."""
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, batches: queue.Queue, stop: threading.Event):
+        try:
+            for batch in self.dataloader:
+                if not self._put(batches, stop, batch_to_device(batch, self.device)):
+                    return
+            self._put(batches, stop, self._END)
+        except Exception as e:
+            self._put(batches, stop, e)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._worker, args=(batches, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is self._END:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+
+def make_prefetcher(dataloader, device: torch.device, mode: str = "auto"):
+    """
+    `mode` is one of "none" (synchronous copy in the loop), "cuda", "thread" or "auto" (CUDA stream
+    on GPU, thread otherwise).
+    """
+    if mode == "auto":
+        mode = "cuda" if device.type == "cuda" else "thread"
+    if mode == "cuda":
+        return CUDAPrefetcher(dataloader, device)
+    if mode == "thread":
+        return ThreadPrefetcher(dataloader, device)
+    if mode == "none":
+        return (batch_to_device(batch, device) for batch in dataloader)
+    raise ValueError(f"Unknown prefetch mode: {mode}")
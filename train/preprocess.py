@@ -0,0 +1,90 @@
+"""Batched image preprocessing for the training loop.
+
+The dataset decodes frames as float32 in [0, 1] and the diffusion policy crops them one batch at a
+time, so every worker, the pinned-memory buffers and the host-to-device copy all carry float32
+images. Here the workers only hand out uint8 frames (`ToUint8`), the collated uint8 batch is moved to
+the device, and `BatchImagePreprocessor` converts, resizes and crops it with a single `grid_sample`
+per camera. Crop offsets are drawn per sample.
+"""
+
+import torch
+import torch.nn.functional as F
+
+
+class ToUint8:
+    """
+    Image transform for `LeRobotDataset(image_transforms=...)` that turns the decoded [0, 1] float
+    frames back into uint8, which is 4x smaller in the worker queues and in pinned memory.
+    """
+
+    def __call__(self, image: torch.Tensor) -> torch.Tensor:
+        return image.mul(255).round_().to(torch.uint8)
+
+
+class BatchImagePreprocessor:
+    """
+    Converts uint8 `(B, [T,] C, H, W)` image batches to float in [0, 1], resized to `resize_shape`
+    and cropped to `crop_shape`. The same crop is used for all the time steps of a sample.
+
+    Args:
+        image_keys: Keys of the image features in the batch.
+        resize_shape: `(height, width)` to resize to before cropping, or None to keep the input size.
+        crop_shape: `(height, width)` of the crop, or None to disable cropping.
+        random_crop: Random crop offsets in training, center crop otherwise.
+    """
+
+    def __init__(
+        self,
+        image_keys: list[str],
+        resize_shape: tuple[int, int] | None = None,
+        crop_shape: tuple[int, int] | None = None,
+        random_crop: bool = True,
+    ):
+        self.image_keys = list(image_keys)
+        self.resize_shape = tuple(resize_shape) if resize_shape is not None else None
+        self.crop_shape = tuple(crop_shape) if crop_shape is not None else None
+        self.random_crop = random_crop
+
+    def _affine(self, batch_size: int, in_hw: tuple[int, int], training: bool, device) -> torch.Tensor:
+        # Affine transform from the normalized output grid to the normalized input image. Resizing is
+        # a pure change of resolution, so only the crop window in the resized image matters.
+        rh, rw = self.resize_shape if self.resize_shape is not None else in_hw
+        ch, cw = self.crop_shape if self.crop_shape is not None else (rh, rw)
+        if ch > rh or cw > rw:
+            raise ValueError(f"crop_shape {self.crop_shape} is larger than the image ({rh}, {rw}).")
+        if training and self.random_crop:
+            oy = torch.randint(0, rh - ch + 1, (batch_size,), device=device, dtype=torch.float32)
+            ox = torch.randint(0, rw - cw + 1, (batch_size,), device=device, dtype=torch.float32)
+        else:
+            oy = torch.full((batch_size,), (rh - ch) // 2, device=device, dtype=torch.float32)
+            ox = torch.full((batch_size,), (rw - cw) // 2, device=device, dtype=torch.float32)
+
+        theta = torch.zeros(batch_size, 2, 3, device=device)
+        theta[:, 0, 0] = cw / rw
+        theta[:, 0, 2] = (2 * ox + cw) / rw - 1
+        theta[:, 1, 1] = ch / rh
+        theta[:, 1, 2] = (2 * oy + ch) / rh - 1
+        return theta
+
+    def preprocess_images(self, images: torch.Tensor, training: bool = True) -> torch.Tensor:
+        batch_size = images.shape[0]
+        lead_shape = images.shape[:-3]
+        c, h, w = images.shape[-3:]
+        images = images.reshape(-1, c, h, w).float()
+
+        if self.resize_shape is None and self.crop_shape is None:
+            return images.div_(255).reshape(*lead_shape, c, h, w)
+
+        theta = self._affine(batch_size, (h, w), training, images.device)
+        # Every time step of a sample shares its crop.
+        theta = theta.repeat_interleave(images.shape[0] // batch_size, dim=0)
+        out_h, out_w = self.crop_shape if self.crop_shape is not None else self.resize_shape
+        grid = F.affine_grid(theta, [images.shape[0], c, out_h, out_w], align_corners=False)
+        images = F.grid_sample(images, grid, mode="bilinear", padding_mode="border", align_corners=False)
+        return images.div_(255).reshape(*lead_shape, c, out_h, out_w)
+
+    def __call__(self, batch: dict, training: bool = True) -> dict:
+        for key in self.image_keys:
+            if key in batch:
+                batch[key] = self.preprocess_images(batch[key], training=training)
+        return batch
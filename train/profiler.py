@@ -0,0 +1,173 @@
+"""Data-loader and training-step profiler for `train_dp.py`.
+
+`--profile` reports, per training step, how long the loop waited for data versus how long it spent
+in the host-to-device copy and in forward/backward/step, plus samples/s, worker utilization and
+decode time per frame. `--sweep` runs short profiles over DataLoader settings and prints the
+fastest configuration.
+"""
+
+import itertools
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+
+class TimedDataset(Dataset):
+    """
+    Wraps a dataset and adds the time spent in `__getitem__` (`_load_s`) to every item.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getattr__(self, name):
+        # Forward `meta`, `episode_data_index`, ... to the wrapped dataset.
+        if name == "dataset":
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __getitem__(self, idx):
+        start = time.perf_counter()
+        item = self.dataset[idx]
+        item["_load_s"] = torch.tensor(time.perf_counter() - start, dtype=torch.float64)
+        return item
+
+
+def synchronize(device: torch.device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+class StepProfiler:
+    """
+    Collects per-step timings. `frames_per_sample` is the number of video frames decoded for one
+    sample (cameras x observation steps) and is used to derive the decode time per frame.
+    """
+
+    def __init__(self, device: torch.device, num_workers: int, frames_per_sample: int):
+        self.device = device
+        self.num_workers = max(num_workers, 1)
+        self.frames_per_sample = frames_per_sample
+        self.data_wait_s = []
+        self.h2d_s = []
+        self.compute_s = []
+        self.batch_sizes = []
+        self.load_s = []
+
+    def iterate(self, dataloader):
+        """Iterate over `dataloader`, timing how long every `next` blocks."""
+        iterator = iter(dataloader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.data_wait_s.append(time.perf_counter() - start)
+            self.batch_sizes.append(len(batch["_load_s"]))
+            self.load_s.append(batch.pop("_load_s").sum().item())
+            yield batch
+
+    def to_device(self, batch: dict) -> dict:
+        start = time.perf_counter()
+        batch = {k: (v.to(self.device, non_blocking=True) if isinstance(v, torch.Tensor) else v) for k, v in batch.items()}
+        synchronize(self.device)
+        self.h2d_s.append(time.perf_counter() - start)
+        return batch
+
+    def time_compute(self, step_fn, batch):
+        start = time.perf_counter()
+        out = step_fn(batch)
+        synchronize(self.device)
+        self.compute_s.append(time.perf_counter() - start)
+        return out
+
+    def summary(self, skip: int = 2) -> dict:
+        """Aggregate the timings, ignoring the first `skip` steps (worker startup, allocator warm-up)."""
+        data_wait = np.asarray(self.data_wait_s[skip:])
+        h2d = np.asarray(self.h2d_s[skip:])
+        compute = np.asarray(self.compute_s[skip:])
+        load = np.asarray(self.load_s[skip:])
+        num_samples = int(np.sum(self.batch_sizes[skip:]))
+        wall = float(data_wait.sum() + h2d.sum() + compute.sum())
+        return {
+            "steps": len(data_wait),
+            "data_wait_ms": 1e3 * float(data_wait.mean()),
+            "h2d_ms": 1e3 * float(h2d.mean()),
+            "compute_ms": 1e3 * float(compute.mean()),
+            "samples_per_s": num_samples / wall,
+            "worker_utilization": float(load.sum()) / (self.num_workers * wall),
+            "decode_ms_per_frame": 1e3 * float(load.sum()) / max(num_samples * self.frames_per_sample, 1),
+        }
+
+
+def print_summary(summary: dict):
+    print(
+        f"steps: {summary['steps']} | data wait: {summary['data_wait_ms']:.1f}ms | "
+        f"h2d: {summary['h2d_ms']:.1f}ms | compute: {summary['compute_ms']:.1f}ms | "
+        f"samples/s: {summary['samples_per_s']:.1f} | worker util: {100 * summary['worker_utilization']:.0f}% | "
+        f"decode/frame: {summary['decode_ms_per_frame']:.2f}ms"
+    )
+
+
+def profile_run(
+    make_dataloader,
+    step_fn,
+    device: torch.device,
+    num_workers: int,
+    frames_per_sample: int,
+    num_steps: int,
+) -> dict:
+    """Run `num_steps` training steps on a DataLoader built by `make_dataloader()` and profile them."""
+    profiler = StepProfiler(device, num_workers, frames_per_sample)
+    dataloader = make_dataloader()
+    for step, batch in enumerate(profiler.iterate(dataloader)):
+        batch = profiler.to_device(batch)
+        profiler.time_compute(step_fn, batch)
+        if step + 1 >= num_steps:
+            break
+    return profiler.summary()
+
+
+def sweep(
+    make_dataloader,
+    step_fn,
+    device: torch.device,
+    frames_per_sample: int,
+    num_steps: int,
+    num_workers_options: list[int],
+    batch_size_options: list[int],
+    pin_memory_options: list[bool],
+    prefetch_factor_options: list[int],
+) -> dict:
+    """
+    Profile every combination of the DataLoader options and print the one with the highest
+    samples/s. `make_dataloader(num_workers, batch_size, pin_memory, prefetch_factor)` builds the loader.
+    """
+    results = []
+    for num_workers, batch_size, pin_memory, prefetch_factor in itertools.product(
+        num_workers_options, batch_size_options, pin_memory_options, prefetch_factor_options
+    ):
+        if num_workers == 0 and prefetch_factor != prefetch_factor_options[0]:
+            continue  # prefetch_factor only applies to worker processes
+        config = {
+            "num_workers": num_workers,
+            "batch_size": batch_size,
+            "pin_memory": pin_memory,
+            "prefetch_factor": prefetch_factor if num_workers > 0 else None,
+        }
+        summary = profile_run(
+            lambda: make_dataloader(**config), step_fn, device, num_workers, frames_per_sample, num_steps
+        )
+        print(f"{config} -> ", end="")
+        print_summary(summary)
+        results.append((config, summary))
+
+    best_config, best_summary = max(results, key=lambda result: result[1]["samples_per_s"])
+    print(f"\nRecommended configuration ({best_summary['samples_per_s']:.1f} samples/s): {best_config}")
+    return best_config
@@ -0,0 +1,268 @@
+"""Episode-aware batch sampler for LeRobot video datasets.
+
+`shuffle=True` over frame indices makes every sample land in a random episode at a random
+position of the video, so the decoder keeps seeking. `EpisodeBlockBatchSampler` shuffles at
+the block level instead: episodes are cut into blocks of consecutive frames, the block order
+is random, and every block is streamed by a single DataLoader worker so that the frames it
+decodes are read sequentially.
+
+Benchmark against the plain shuffle:
+
+    python -m train.sampler --dataset_path /path/to/dataset --num_workers 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+
+def valid_runs(valid: np.ndarray, offset: int = 0) -> list[tuple[int, int]]:
+    """`[start, end)` runs of consecutive True values of `valid`, shifted by `offset`."""
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], valid.astype(np.int8), [0]])))
+    return list(zip((edges[::2] + offset).tolist(), (edges[1::2] + offset).tolist()))
+
+
+def make_blocks(
+    episode_data_index: dict[str, torch.Tensor], block_size: int, frame_mask: np.ndarray | None = None
+) -> list[tuple[int, int]]:
+    """
+    Cut every episode into `[start, end)` blocks of at most `block_size` consecutive frames. Frames
+    where `frame_mask` is False are left out and split the blocks around them.
+    """
+    blocks = []
+    for ep_from, ep_to in zip(episode_data_index["from"].tolist(), episode_data_index["to"].tolist()):
+        runs = [(ep_from, ep_to)] if frame_mask is None else valid_runs(frame_mask[ep_from:ep_to], ep_from)
+        for run_from, run_to in runs:
+            for start in range(run_from, run_to, block_size):
+                blocks.append((start, min(start + block_size, run_to)))
+    return blocks
+
+
+class EpisodeBlockBatchSampler(Sampler[list[int]]):
+    """
+    Batch sampler with random block order and sequential frames inside a block.
+
+    The blocks of an epoch are dealt to `num_workers` lanes. A lane keeps `blocks_per_batch`
+    blocks open and every batch it produces takes the next `batch_size // blocks_per_batch`
+    frames of each open block. Batches of the lanes are interleaved, so with the default
+    round-robin dispatch of the DataLoader, lane `l` is always served by worker `l` and a block
+    never changes worker while it is being read.
+
+    For distributed training every rank builds the same shuffled block order from the shared seed
+    and takes its own `num_workers` lanes out of `world_size * num_workers`. All ranks yield the
+    same number of batches, so the DDP collectives stay in step.
+
+    Args:
+        episode_data_index: `{"from": Tensor, "to": Tensor}` of the episodes to sample (`dataset.episode_data_index`
+            or the first entries of it).
+        batch_size: Number of samples per batch.
+        block_size: Number of consecutive frames per block.
+        blocks_per_batch: Degree of mixing inside a batch. 1 gives the best decode locality, larger
+            values give more diverse batches.
+        num_workers: Number of DataLoader workers, must match the DataLoader.
+        drop_last: Drop the last incomplete batch of every lane.
+        shuffle: Shuffle the block order every epoch.
+        seed: Base seed, combined with the epoch set by `set_epoch`.
+        rank: Rank of this process in distributed training.
+        world_size: Number of distributed processes.
+        frame_mask: Optional boolean array over the dataset positions, False frames are never sampled
+            (they can still appear in the observation history / action horizon of their neighbours).
+    """
+
+    def __init__(
+        self,
+        episode_data_index: dict[str, torch.Tensor],
+        batch_size: int,
+        block_size: int = 64,
+        blocks_per_batch: int = 4,
+        num_workers: int = 0,
+        drop_last: bool = True,
+        shuffle: bool = True,
+        seed: int = 0,
+        rank: int = 0,
+        world_size: int = 1,
+        frame_mask: np.ndarray | None = None,
+    ):
+        if blocks_per_batch < 1 or blocks_per_batch > batch_size:
+            raise ValueError(f"blocks_per_batch must be in [1, {batch_size}], got {blocks_per_batch}.")
+        self.batch_size = batch_size
+        self.block_size = block_size
+        self.blocks_per_batch = blocks_per_batch
+        self.num_lanes = max(num_workers, 1)
+        self.drop_last = drop_last
+        self.shuffle = shuffle
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        self.start_batch = 0
+        self.blocks = make_blocks(episode_data_index, block_size, frame_mask)
+
+    def set_epoch(self, epoch: int, start_batch: int = 0):
+        """
+        Batch order of `epoch`. The first `start_batch` batches of the epoch are skipped, to resume
+        in the middle of an epoch (the lanes then start on another worker than in the original run,
+        which only costs some decode locality for the rest of the epoch).
+        """
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def _blocks_for_epoch(self) -> list[tuple[int, int]]:
+        blocks = self.blocks
+        if self.shuffle:
+            rng = np.random.default_rng(self.seed + self.epoch)
+            blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+        return blocks
+
+    def _deal_lanes(self, blocks: list[tuple[int, int]]) -> list[list[np.ndarray]]:
+        # Greedily give the next block to the lane with the fewest frames so that the lanes stay
+        # balanced and the round-robin batch order stays aligned with the workers.
+        num_lanes = self.num_lanes * self.world_size
+        lanes = [[] for _ in range(num_lanes)]
+        lane_frames = np.zeros(num_lanes, dtype=np.int64)
+        for block in blocks:
+            indices = np.arange(*block)
+            lane = int(np.argmin(lane_frames))
+            lanes[lane].append(indices)
+            lane_frames[lane] += len(indices)
+        return lanes
+
+    def _lane_batches(self, lane: list[np.ndarray]):
+        per_stream = [
+            self.batch_size // self.blocks_per_batch + (i < self.batch_size % self.blocks_per_batch)
+            for i in range(self.blocks_per_batch)
+        ]
+        pending = iter(lane)
+        streams = [next(pending, None) for _ in range(self.blocks_per_batch)]
+        while any(stream is not None for stream in streams):
+            batch = []
+            for i, quota in enumerate(per_stream):
+                while quota > 0 and streams[i] is not None:
+                    taken = streams[i][:quota]
+                    batch.extend(taken.tolist())
+                    quota -= len(taken)
+                    streams[i] = streams[i][len(taken):]
+                    if len(streams[i]) == 0:
+                        streams[i] = next(pending, None)
+            # A stream that ran dry leaves a hole in the batch, fill it from the others.
+            for i in range(self.blocks_per_batch):
+                while len(batch) < self.batch_size and streams[i] is not None:
+                    taken = streams[i][: self.batch_size - len(batch)]
+                    batch.extend(taken.tolist())
+                    streams[i] = streams[i][len(taken):]
+                    if len(streams[i]) == 0:
+                        streams[i] = next(pending, None)
+            if len(batch) == self.batch_size or (batch and not self.drop_last):
+                yield batch
+
+    def _rank_lanes(self, lanes: list[list[np.ndarray]], rank: int) -> list[list[np.ndarray]]:
+        return lanes[rank * self.num_lanes : (rank + 1) * self.num_lanes]
+
+    def _num_batches(self, lanes: list[list[np.ndarray]]) -> int:
+        num_batches = 0
+        for lane in lanes:
+            lane_frames = sum(len(indices) for indices in lane)
+            if self.drop_last:
+                num_batches += lane_frames // self.batch_size
+            else:
+                num_batches += -(-lane_frames // self.batch_size)
+        return num_batches
+
+    def __iter__(self):
+        all_lanes = self._deal_lanes(self._blocks_for_epoch())
+        num_batches = self._epoch_batches()
+        lanes = [self._lane_batches(lane) for lane in self._rank_lanes(all_lanes, self.rank)]
+        position = 0
+        while lanes:
+            alive = []
+            for lane in lanes:
+                batch = next(lane, None)
+                if batch is not None:
+                    if position == num_batches:
+                        return
+                    if position >= self.start_batch:
+                        yield batch
+                    position += 1
+                    alive.append(lane)
+            lanes = alive
+
+    def _epoch_batches(self) -> int:
+        all_lanes = self._deal_lanes(self._blocks_for_epoch())
+        return min(self._num_batches(self._rank_lanes(all_lanes, rank)) for rank in range(self.world_size))
+
+    def __len__(self) -> int:
+        return max(self._epoch_batches() - self.start_batch, 0)
+
+
+def count_seeks(batches: list[list[int]], num_workers: int) -> np.ndarray:
+    """
+    Number of decoder seeks per batch, i.e. the number of samples whose frame does not directly
+    follow the previous frame read by the same worker. Batch `i` is served by worker `i % num_workers`.
+    """
+    num_workers = max(num_workers, 1)
+    last_index = [None] * num_workers
+    seeks = np.zeros(len(batches), dtype=np.int64)
+    for i, batch in enumerate(batches):
+        worker = i % num_workers
+        order = np.asarray(batch)
+        prev = np.concatenate([[-2 if last_index[worker] is None else last_index[worker]], order[:-1]])
+        seeks[i] = int(np.count_nonzero(order - prev != 1))
+        last_index[worker] = int(order[-1])
+    return seeks
+
+
+def benchmark_sampler(dataset, batch_sampler, num_workers: int, num_batches: int) -> dict:
+    batches = []
+    for batch in batch_sampler:
+        batches.append(batch)
+        if len(batches) >= num_batches:
+            break
+    seeks = count_seeks(batches, num_workers)
+
+    dataloader = torch.utils.data.DataLoader(dataset, batch_sampler=batches, num_workers=num_workers)
+    num_samples = 0
+    start = time.perf_counter()
+    for batch in dataloader:
+        num_samples += len(batch["index"])
+    elapsed = time.perf_counter() - start
+    return {
+        "seeks_per_batch": float(seeks.mean()),
+        "samples_per_s": num_samples / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    from lerobot.datasets.lerobot_dataset import LeRobotDataset, LeRobotDatasetMetadata
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset_path", type=str, help="Path to the dataset.", required=True)
+    parser.add_argument("--batch_size", type=int, help="Batch size.", default=64)
+    parser.add_argument("--num_workers", type=int, help="Number of DataLoader workers.", default=4)
+    parser.add_argument("--num_batches", type=int, help="Number of batches to time.", default=50)
+    parser.add_argument("--block_size", type=int, help="Consecutive frames per block.", default=64)
+    parser.add_argument("--blocks_per_batch", type=int, help="Blocks mixed in one batch.", default=4)
+    args = parser.parse_args()
+
+    # Same two-frame observation history as train_dp.py
+    dataset_metadata = LeRobotDatasetMetadata(args.dataset_path)
+    delta_timestamps = {key: [-0.1, 0.0] for key in [*dataset_metadata.camera_keys, "observation.state"]}
+    dataset = LeRobotDataset(args.dataset_path, delta_timestamps=delta_timestamps)
+
+    shuffle_sampler = torch.utils.data.BatchSampler(
+        torch.utils.data.RandomSampler(dataset), batch_size=args.batch_size, drop_last=True
+    )
+    block_sampler = EpisodeBlockBatchSampler(
+        dataset.episode_data_index,
+        batch_size=args.batch_size,
+        block_size=args.block_size,
+        blocks_per_batch=args.blocks_per_batch,
+        num_workers=args.num_workers,
+    )
+    for name, sampler in [("shuffle", shuffle_sampler), ("episode_block", block_sampler)]:
+        result = benchmark_sampler(dataset, sampler, args.num_workers, args.num_batches)
+        print(
+            f"{name:<14} seeks/batch: {result['seeks_per_batch']:6.1f}  samples/s: {result['samples_per_s']:8.1f}"
+        )
@@ -0,0 +1,54 @@
+"""Data-parallel scaling benchmark of `train_dp.py` on a CPU box (gloo backend).
+
+Runs the `--profile` mode under torchrun with 1, 2 and 4 processes on the same synthetic dataset and
+prints the global samples/s. The cores are split evenly between the processes.
+
+    python -m train.scaling_benchmark --nproc 1 2 4
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from train.synthetic import make_synthetic_dataset
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nproc", type=int, nargs="+", help="Process counts to benchmark.", default=[1, 2, 4])
+    parser.add_argument("--batch_size", type=int, help="Per-process batch size.", default=16)
+    parser.add_argument("--num_workers", type=int, help="DataLoader workers per process.", default=1)
+    parser.add_argument("--profile_steps", type=int, help="Steps per run.", default=20)
+    parser.add_argument("--dataset_path", type=str, help="Dataset to use instead of a synthetic one.", default=None)
+    args = parser.parse_args()
+
+    dataset_path = args.dataset_path
+    if dataset_path is None:
+        dataset_path = str(make_synthetic_dataset(Path(tempfile.mkdtemp(prefix="synthetic_piper_")) / "dataset").root)
+
+    num_cores = os.cpu_count()
+    results = {}
+    for nproc in args.nproc:
+        env = dict(os.environ, OMP_NUM_THREADS=str(max(num_cores // nproc, 1)))
+        cmd = [
+            sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={nproc}",
+            "-m", "train.train_dp",
+            "--device", "cpu",
+            "--dataset_path", dataset_path,
+            "--profile",
+            "--profile_steps", str(args.profile_steps),
+            "--batch_size", str(args.batch_size),
+            "--num_workers", str(args.num_workers),
+        ]
+        output = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+        match = re.search(r"samples/s: ([\d.]+)", output)
+        results[nproc] = float(match.group(1))
+        print(output.strip())
+
+    base = results[args.nproc[0]] / args.nproc[0]
+    print(f"\n{'processes':>9} | {'samples/s':>9} | {'efficiency':>10}")
+    for nproc, samples_per_s in results.items():
+        print(f"{nproc:>9} | {samples_per_s:>9.1f} | {100 * samples_per_s / (base * nproc):>9.0f}%")
@@ -0,0 +1,50 @@
+"""Tiny synthetic LeRobot dataset, so the training script can be profiled without real data or a GPU."""
+
+import numpy as np
+
+from lerobot.datasets.lerobot_dataset import LeRobotDataset
+
+SYNTHETIC_CAMERA_KEYS = ["observation.images.image", "observation.images.wristimage"]
+SYNTHETIC_MOTOR_NAMES = ["joint_1", "joint_2", "joint_3", "joint_4", "joint_5", "joint_6", "gripper"]
+
+
+def make_synthetic_dataset(
+    root,
+    num_episodes: int = 4,
+    episode_length: int = 60,
+    fps: int = 10,
+    image_shape: tuple[int, int, int] = (96, 96, 3),
+    use_videos: bool = True,
+    seed: int = 0,
+) -> LeRobotDataset:
+    """
+    Create a dataset with the same feature keys as the piper datasets under `root`. States follow a
+    smooth random walk and actions are the next state, as in `process_dataset_3.py`.
+    """
+    rng = np.random.default_rng(seed)
+    image_dtype = "video" if use_videos else "image"
+    features = {
+        key: {"dtype": image_dtype, "shape": image_shape, "names": ["height", "width", "channels"]}
+        for key in SYNTHETIC_CAMERA_KEYS
+    }
+    for key in ["observation.state", "action"]:
+        features[key] = {"dtype": "float32", "shape": (len(SYNTHETIC_MOTOR_NAMES),), "names": SYNTHETIC_MOTOR_NAMES}
+
+    dataset = LeRobotDataset.create(
+        repo_id="synthetic/piper",
+        fps=fps,
+        root=root,
+        features=features,
+        robot_type="piper_follower",
+        use_videos=use_videos,
+    )
+    for _ in range(num_episodes):
+        states = np.cumsum(rng.normal(0, 0.05, (episode_length + 1, len(SYNTHETIC_MOTOR_NAMES))), axis=0)
+        states = states.astype(np.float32)
+        for i in range(episode_length):
+            frame = {"observation.state": states[i], "action": states[i + 1]}
+            for key in SYNTHETIC_CAMERA_KEYS:
+                frame[key] = rng.integers(0, 256, image_shape, dtype=np.uint8)
+            dataset.add_frame(frame, task="synthetic task")
+        dataset.save_episode()
+    return dataset
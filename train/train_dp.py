@@ -16,34 +16,275 @@
 
 Once you have trained a model with this script, you can try to evaluate it on
 examples/2_evaluate_pretrained_policy.py
+
+Profile the input pipeline (works on CPU-only machines with a synthetic dataset):
+
+    python -m train.train_dp --synthetic --device cpu --profile
+    python -m train.train_dp --synthetic --device cpu --sweep
+
+Check the precision / gradient accumulation modes on CPU:
+
+    python -m train.train_dp --synthetic --device cpu --check_modes
+
+Data-parallel training is launched with torchrun, see `train/distributed.py`. Several datasets are
+trained on together with `--dataset_path <dataset> <dataset> ...`, see `train/multi_dataset.py`.
 """
 
+import argparse
+import tempfile
 from pathlib import Path
 
+import numpy as np
 import torch
 
 from lerobot.configs.types import FeatureType
-from lerobot.datasets.lerobot_dataset import LeRobotDataset, LeRobotDatasetMetadata
 from lerobot.datasets.utils import dataset_to_policy_features
 from lerobot.policies.diffusion.configuration_diffusion import DiffusionConfig
 from lerobot.policies.diffusion.modeling_diffusion import DiffusionPolicy
 
-dataset_path = '/data/nvme0/zhiheng/dataset/piper-pickcube-endposectrl2'
-output_directory = Path("/data/nvme0/zhiheng/checkpoints/dp_outputs/train/test")
-device = torch.device("cuda:3")
-output_directory.mkdir(parents=True, exist_ok=True)
+from train.checkpoint import AsyncCheckpointer, find_latest_checkpoint, load_checkpoint
+from train.distributed import (
+    all_reduce_mean,
+    broadcast_object,
+    cleanup_distributed,
+    init_distributed,
+    resolve_device,
+    wrap_ddp,
+)
+from train.ema import EMAModel
+from train.evaluate import BackgroundEvaluator
+from train.prefetcher import make_prefetcher
+from train.preprocess import BatchImagePreprocessor, ToUint8
+from train.profiler import TimedDataset, print_summary, profile_run, sweep
+from train.multi_dataset import MultiDataset, load_metadata, make_dataset
+from train.sampler import EpisodeBlockBatchSampler
+from train.synthetic import make_synthetic_dataset
+from train.train_modes import PRECISIONS, TrainStep, check_modes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dataset_path",
+        type=str,
+        nargs="+",
+        help="Path to the dataset. Several datasets of the same robot are trained on together (train/multi_dataset.py).",
+        default=["/data/nvme0/zhiheng/dataset/piper-pickcube-endposectrl2"]
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        help="Directory for the checkpoints.",
+        default="/data/nvme0/zhiheng/checkpoints/dp_outputs/train/test"
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        help="Device to train on.",
+        default="cuda:3"
+    )
+    parser.add_argument(
+        "--training_steps",
+        type=int,
+        help="Number of offline training steps.",
+        default=50000
+    )
+    parser.add_argument(
+        "--log_freq",
+        type=int,
+        help="Print the mean loss every N optimizer steps, the only point where the loop syncs with the device.",
+        default=100
+    )
+    parser.add_argument(
+        "--save_freq",
+        type=int,
+        help="Save a checkpoint every N steps.",
+        default=10000
+    )
+    parser.add_argument(
+        "--keep_last",
+        type=int,
+        help="Number of step_N checkpoints to keep (default: all).",
+        default=None
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        help="Checkpoint directory to resume from, or 'auto' for the latest step_N in --output_dir.",
+        default=None
+    )
+    parser.add_argument(
+        "--ema_decay",
+        type=float,
+        help="Decay of the exponential moving average of the weights, 0 disables the EMA.",
+        default=0.999
+    )
+    parser.add_argument(
+        "--val_episodes",
+        type=int,
+        help="Number of episodes (the last ones) held out for the offline evaluation, 0 disables it.",
+        default=0
+    )
+    parser.add_argument(
+        "--eval_freq",
+        type=int,
+        help="Evaluate the action MSE on the held-out episodes every N steps.",
+        default=5000
+    )
+    parser.add_argument(
+        "--eval_batches",
+        type=int,
+        help="Maximum number of held-out batches per evaluation.",
+        default=20
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        choices=list(PRECISIONS),
+        help="Autocast precision, fp16 also enables the grad scaler.",
+        default="fp32"
+    )
+    parser.add_argument(
+        "--grad_accum_steps",
+        type=int,
+        help="Micro-batches per optimizer step (effective batch size = grad_accum_steps * batch_size).",
+        default=1
+    )
+    parser.add_argument(
+        "--bucket_cap_mb",
+        type=int,
+        help="DDP gradient all-reduce bucket size in MB.",
+        default=25
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=str,
+        choices=["auto", "cuda", "thread", "none"],
+        help="Overlap the host-to-device copy: CUDA side stream, background thread, or no prefetch.",
+        default="auto"
+    )
+    # Episode-aware sampling: frames are read in blocks of consecutive frames so the video decoder
+    # reads sequentially. Set --blocks_per_batch to the batch size for (almost) the plain shuffle.
+    parser.add_argument("--batch_size", type=int, help="Batch size.", default=64)
+    parser.add_argument("--num_workers", type=int, help="Number of DataLoader workers.", default=4)
+    parser.add_argument("--prefetch_factor", type=int, help="Batches prefetched per worker.", default=2)
+    parser.add_argument("--block_size", type=int, help="Consecutive frames per sampler block.", default=64)
+    parser.add_argument("--blocks_per_batch", type=int, help="Sampler blocks mixed in one batch.", default=4)
+    parser.add_argument(
+        "--frame_mask",
+        type=str,
+        nargs="+",
+        help=(
+            "Frame mask written by data/timestamp_check.py or data/idle_trim.py --write_mask, masked frames are "
+            "not sampled. One per --dataset_path, in the same order."
+        ),
+        default=None
+    )
+    # Optional resize of the camera frames, done on the device together with the crop.
+    # The policy server must then feed frames of the same size.
+    parser.add_argument(
+        "--resize_shape",
+        type=int,
+        nargs=2,
+        help="(height, width) to resize the camera frames to.",
+        default=None
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="Train on a tiny synthetic dataset generated in a temporary directory."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile data wait, host-to-device copy and compute time instead of training."
+    )
+    parser.add_argument("--profile_steps", type=int, help="Number of steps per profile run.", default=30)
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Profile a grid of num_workers/batch_size/pin_memory/prefetch_factor and recommend one."
+    )
+    parser.add_argument(
+        "--check_modes",
+        action="store_true",
+        help="Compare a few steps of every precision / accumulation mode to fp32, exit non-zero on a mismatch."
+    )
+    return parser.parse_args()
+
+
+def load_frame_mask(dataset, mask_paths):
+    """Masks over the `index` column of every dataset, mapped to the positions of the dataset."""
+    if not isinstance(dataset, MultiDataset):
+        return np.load(mask_paths[0])[dataset.hf_dataset.with_format("numpy")["index"]]
+    if len(mask_paths) != len(dataset.meta.metas):
+        raise ValueError(f"{len(mask_paths)} frame masks for {len(dataset.meta.metas)} datasets.")
+    return np.concatenate([np.load(mask_paths[i])[index] for i, index in dataset.local_indices()])
+
+
+def split_held_out(episode_data_index, num_val_episodes):
+    """
+    Bounds of the training episodes and frame positions of the last `num_val_episodes` episodes.
+
+    Both index the full dataset: lerobot looks the episode bounds up by `episode_index`, so a
+    dataset loaded on a subset of the episodes other than a prefix cannot use `delta_timestamps`.
+    """
+    num_train = len(episode_data_index["from"]) - num_val_episodes
+    train_index = {key: bounds[:num_train] for key, bounds in episode_data_index.items()}
+    if num_val_episodes == 0:
+        return train_index, []
+    val_positions = list(range(episode_data_index["from"][num_train].item(), episode_data_index["to"][-1].item()))
+    return train_index, val_positions
+
+
+def make_dataloader(
+    dataset, episode_data_index, device, num_workers, batch_size, pin_memory, prefetch_factor, block_size,
+    blocks_per_batch, dist_info=None, frame_mask=None,
+):
+    """`episode_data_index`: bounds of the episodes to sample from (the training ones)."""
+    batch_sampler = EpisodeBlockBatchSampler(
+        episode_data_index,
+        batch_size=batch_size,
+        block_size=block_size,
+        blocks_per_batch=min(blocks_per_batch, batch_size),
+        num_workers=num_workers,
+        drop_last=True,
+        rank=dist_info.rank if dist_info is not None else 0,
+        world_size=dist_info.world_size if dist_info is not None else 1,
+        frame_mask=frame_mask,
+    )
+    dataloader = torch.utils.data.DataLoader(
+        dataset,
+        num_workers=num_workers,
+        batch_sampler=batch_sampler,
+        pin_memory=pin_memory and device.type != "cpu",
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+    )
+    return dataloader, batch_sampler
+
 
 def main():
-    # Number of offline training steps (we'll only do offline training for this example.)
-    # Adjust as you prefer. 5000 steps are needed to get something worth evaluating.
-    training_steps = 50000
-    log_freq = 1
+    args = parse_args()
+    dist_info = init_distributed(torch.device(args.device).type)
+    device = resolve_device(args.device, dist_info)
+    if dist_info.is_distributed and (args.sweep or args.check_modes):
+        raise ValueError("--sweep and --check_modes run in a single process, launch them without torchrun.")
+
+    if args.synthetic:
+        dataset_path = None
+        if dist_info.is_main:
+            synthetic_root = Path(tempfile.mkdtemp(prefix="synthetic_piper_")) / "dataset"
+            dataset_path = str(make_synthetic_dataset(synthetic_root).root)
+        dataset_paths = [broadcast_object(dataset_path, dist_info)]
+    else:
+        dataset_paths = args.dataset_path
+    output_directory = Path(args.output_dir)
 
     # When starting from scratch (i.e. not from a pretrained policy), we need to specify 2 things before
     # creating the policy:
     #   - input/output shapes: to properly size the policy
     #   - dataset stats: for normalization and denormalization of input/outputs
-    dataset_metadata = LeRobotDatasetMetadata(dataset_path)
+    dataset_metadata = load_metadata(dataset_paths)
     features = dataset_to_policy_features(dataset_metadata.features)
     output_features = {key: ft for key, ft in features.items() if ft.type is FeatureType.ACTION}
     input_features = {key: ft for key, ft in features.items() if key not in output_features}
@@ -55,65 +296,196 @@ def main():
     policy = DiffusionPolicy(cfg, dataset_stats=dataset_metadata.stats)
     policy.train()
     policy.to(device)
+    # Every rank starts from the weights of rank 0 (DDP broadcasts them) and all-reduces the gradients.
+    ddp_policy = wrap_ddp(policy, device, dist_info, args.bucket_cap_mb)
 
     # Another policy-dataset interaction is with the delta_timestamps. Each policy expects a given number frames
     # which can differ for inputs, outputs and rewards (if there are some).
     delta_timestamps = {
-        "observation.images.image": [i / dataset_metadata.fps for i in cfg.observation_delta_indices],
-        "observation.images.wristimage": [i / dataset_metadata.fps for i in cfg.observation_delta_indices],
         "observation.state": [i / dataset_metadata.fps for i in cfg.observation_delta_indices],
         "action": [i / dataset_metadata.fps for i in cfg.action_delta_indices],
     }
+    for key in dataset_metadata.camera_keys:
+        delta_timestamps[key] = [i / dataset_metadata.fps for i in cfg.observation_delta_indices]
 
     # In this case with the standard configuration for Diffusion Policy, it is equivalent to this:
     delta_timestamps = {
-        # Load the previous image and state at -0.1 seconds before current frame,
-        # then load current image and state corresponding to 0.0 second.
-        "observation.images.image": [-0.1, 0.0],
-        "observation.images.wristimage": [-0.1, 0.0],
+        # Load the previous state at -0.1 seconds before current frame,
+        # then load current state corresponding to 0.0 second.
         "observation.state": [-0.1, 0.0],
         # Load the previous action (-0.1), the next action to be executed (0.0),
         # and 14 future actions with a 0.1 seconds spacing. All these actions will be
         # used to supervise the policy.
         "action": [-0.1, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4],
     }
+    # Same previous/current frames for every camera (e.g. "observation.images.image" and
+    # "observation.images.wristimage").
+    for key in dataset_metadata.camera_keys:
+        delta_timestamps[key] = [-0.1, 0.0]
 
     # We can then instantiate the dataset with these delta_timestamps configuration.
-    dataset = LeRobotDataset(dataset_path, delta_timestamps=delta_timestamps)
+    # Workers hand out uint8 frames, float conversion, resize and crop run batched on the device.
+    # All the episodes are loaded, the held-out ones are only left out of the training sampler.
+    dataset = make_dataset(dataset_paths, delta_timestamps=delta_timestamps, image_transforms=ToUint8())
+    train_index, val_positions = split_held_out(dataset.episode_data_index, args.val_episodes)
+    preprocessor = BatchImagePreprocessor(
+        dataset_metadata.camera_keys,
+        resize_shape=args.resize_shape,
+        crop_shape=cfg.crop_shape,
+        random_crop=cfg.crop_is_random,
+    )
     # Then we create our optimizer and dataloader for offline training.
     optimizer = torch.optim.Adam(policy.parameters(), lr=1e-4)
-    dataloader = torch.utils.data.DataLoader(
-        dataset,
-        num_workers=4,
-        batch_size=64,
-        shuffle=True,
-        pin_memory=device.type != "cpu",
-        drop_last=True,
+    train_step = TrainStep(ddp_policy, optimizer, device, args.precision, args.grad_accum_steps, preprocessor)
+
+    if args.check_modes:
+        def make_policy():
+            return DiffusionPolicy(cfg, dataset_stats=dataset_metadata.stats).to(device).train()
+
+        def make_batches():
+            dataloader, _ = make_dataloader(dataset, train_index, device, 0, 4, False, None, args.block_size, 1)
+            return make_prefetcher(dataloader, device, args.prefetch)
+
+        # The check builds its own policies and keeps an fp32 reference, free the training one first.
+        del train_step, optimizer, ddp_policy, policy
+        if not check_modes(make_policy, make_batches, device, preprocessor):
+            raise SystemExit("check_modes: some modes do not match the fp32 reference, see above.")
+        return
+
+    if args.profile or args.sweep:
+        frames_per_sample = len(dataset_metadata.camera_keys) * len(cfg.observation_delta_indices)
+        timed_dataset = TimedDataset(dataset)
+
+        def make_profiled_dataloader(num_workers, batch_size, pin_memory, prefetch_factor):
+            dataloader, _ = make_dataloader(
+                timed_dataset, train_index, device, num_workers, batch_size, pin_memory, prefetch_factor,
+                args.block_size, args.blocks_per_batch, dist_info,
+            )
+            return dataloader
+
+        if args.sweep:
+            sweep(
+                make_profiled_dataloader,
+                train_step,
+                device,
+                frames_per_sample,
+                args.profile_steps,
+                num_workers_options=sorted({0, 2, 4, args.num_workers}),
+                batch_size_options=sorted({32, args.batch_size}),
+                pin_memory_options=[False, True] if device.type == "cuda" else [False],
+                prefetch_factor_options=sorted({2, 4, args.prefetch_factor}),
+            )
+        else:
+            summary = profile_run(
+                lambda: make_profiled_dataloader(args.num_workers, args.batch_size, True, args.prefetch_factor),
+                train_step,
+                device,
+                args.num_workers,
+                frames_per_sample,
+                args.profile_steps,
+            )
+            # Every rank processes its own batches, the global throughput is the sum over ranks.
+            summary["samples_per_s"] = all_reduce_mean(summary["samples_per_s"], device, dist_info) * dist_info.world_size
+            if dist_info.is_main:
+                print_summary(summary)
+        cleanup_distributed(dist_info)
+        return
+
+    if dist_info.is_main:
+        output_directory.mkdir(parents=True, exist_ok=True)
+    frame_mask = None
+    if args.frame_mask is not None:
+        frame_mask = load_frame_mask(dataset, args.frame_mask)
+        if dist_info.is_main:
+            print(f"frame mask: {int((~frame_mask).sum())} of {len(frame_mask)} frames excluded")
+    dataloader, batch_sampler = make_dataloader(
+        dataset, train_index, device, args.num_workers, args.batch_size, True, args.prefetch_factor,
+        args.block_size, args.blocks_per_batch, dist_info, frame_mask,
     )
 
-    # Run training loop.
+    # EMA weights and the held-out evaluation only live on rank 0.
+    ema = EMAModel(policy, args.ema_decay) if args.ema_decay > 0 and dist_info.is_main else None
+    evaluator = None
+    if args.val_episodes > 0 and dist_info.is_main:
+        val_dataloader = torch.utils.data.DataLoader(
+            dataset,
+            batch_size=args.batch_size,
+            sampler=torch.utils.data.SubsetRandomSampler(val_positions),
+            num_workers=min(args.num_workers, 2),
+            pin_memory=device.type != "cpu",
+        )
+        evaluator = BackgroundEvaluator(policy, val_dataloader, device, preprocessor, args.eval_batches)
+
+    # Run training loop. `step` counts optimizer steps, `epoch_batches` the batches of the current epoch
+    # already trained on, so that a resumed run continues the epoch where the checkpoint was taken.
     step = 0
-    done = False
+    epoch = 0
+    epoch_batches = 0
+    resume_dir = find_latest_checkpoint(output_directory) if args.resume == "auto" else args.resume
+    if resume_dir is not None:
+        training_state = load_checkpoint(
+            resume_dir, policy, optimizer, device, ema_policy=ema.model if ema is not None else None
+        )
+        if "scaler" in training_state:
+            train_step.scaler.load_state_dict(training_state["scaler"])
+        if ema is not None:
+            ema.num_updates = training_state.get("ema_num_updates", 0)
+        step = training_state.get("step", 0)
+        epoch = training_state.get("epoch", 0)
+        epoch_batches = training_state.get("epoch_batches", 0)
+        if dist_info.is_main:
+            print(f"Resumed from {resume_dir} at step {step} (epoch {epoch}, batch {epoch_batches})")
+    checkpointer = AsyncCheckpointer(output_directory, keep_last=args.keep_last)
+    done = step >= args.training_steps
     while not done:
-        for batch in dataloader:
-            batch = {k: (v.to(device) if isinstance(v, torch.Tensor) else v) for k, v in batch.items()}
-            loss, _ = policy.forward(batch)
-            loss.backward()
-            optimizer.step()
-            optimizer.zero_grad()
-
-            if step % log_freq == 0:
-                print(f"step: {step} loss: {loss.item():.3f}")
+        batch_sampler.set_epoch(epoch, start_batch=epoch_batches)
+        epoch += 1
+        for batch in make_prefetcher(dataloader, device, args.prefetch):
+            epoch_batches += 1
+            if not train_step(batch):
+                continue
+            if ema is not None:
+                ema.update()
+
+            if step % args.log_freq == 0:
+                loss = all_reduce_mean(train_step.pop_mean_loss(), device, dist_info)
+                if dist_info.is_main:
+                    print(f"step: {step} loss: {loss:.3f}")
             step += 1
-            if step >= training_steps:
+            if step >= args.training_steps:
                 done = True
                 break
-            # 每1w步保存一次权重
-            if step % 10000 == 0:
-                policy.save_pretrained(output_directory / f"step_{step}")
+            if evaluator is not None and step % args.eval_freq == 0:
+                evaluator.submit((ema.model if ema is not None else policy).state_dict(), step)
+            # 每1w步保存一次权重（后台线程写盘，不阻塞训练），只在 rank 0 保存
+            if step % args.save_freq == 0 and dist_info.is_main:
+                training_state = {
+                    "step": step,
+                    "epoch": epoch - 1,
+                    "epoch_batches": epoch_batches,
+                    "scaler": train_step.scaler.state_dict(),
+                }
+                if ema is not None:
+                    training_state["ema_num_updates"] = ema.num_updates
+                checkpointer.save(
+                    policy,
+                    f"step_{step}",
+                    optimizer,
+                    training_state,
+                    ema_policy=ema.model if ema is not None else None,
+                    metrics=evaluator.latest() if evaluator is not None else None,
+                )
+        epoch_batches = 0
 
     # Save a policy checkpoint.
-    policy.save_pretrained(output_directory)
+    checkpointer.close()
+    if evaluator is not None:
+        evaluator.wait()
+    if dist_info.is_main:
+        policy.save_pretrained(output_directory)
+        if ema is not None:
+            ema.model.save_pretrained(output_directory / "ema")
+    cleanup_distributed(dist_info)
 
 
 if __name__ == "__main__":
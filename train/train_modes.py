@@ -0,0 +1,165 @@
+"""Training step with mixed precision and gradient accumulation.
+
+    --precision fp32|bf16|fp16   autocast dtype, fp16 also enables the grad scaler
+    --grad_accum_steps N         optimizer step every N micro-batches (effective batch = N x batch_size)
+"""
+
+import contextlib
+import itertools
+import math
+
+import torch
+
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+class TrainStep:
+    """
+    Callable running forward/backward for one micro-batch. The optimizer steps (and the gradients are
+    reset with `set_to_none=True`) once every `grad_accum_steps` calls, `__call__` returns True then.
+    With a DDP-wrapped policy the gradient all-reduce is skipped on the accumulating micro-batches.
+    """
+
+    def __init__(
+        self,
+        policy,
+        optimizer: torch.optim.Optimizer,
+        device: torch.device,
+        precision: str = "fp32",
+        grad_accum_steps: int = 1,
+        preprocessor=None,
+    ):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}, expected one of {list(PRECISIONS)}")
+        self.policy = policy
+        self.optimizer = optimizer
+        self.device = device
+        self.dtype = PRECISIONS[precision]
+        self.grad_accum_steps = grad_accum_steps
+        self.preprocessor = preprocessor
+        self.scaler = torch.amp.GradScaler(device.type, enabled=precision == "fp16")
+        self.micro_step = 0
+        # Running sum of the loss on the device, only synced by `pop_mean_loss`.
+        self._loss_sum = torch.zeros((), device=device)
+        self._loss_count = 0
+
+    def __call__(self, batch: dict) -> bool:
+        if self.preprocessor is not None:
+            batch = self.preprocessor(batch)
+        self.micro_step += 1
+        sync_step = self.micro_step % self.grad_accum_steps == 0
+        no_sync = self.policy.no_sync if hasattr(self.policy, "no_sync") and not sync_step else contextlib.nullcontext
+        with no_sync():
+            with torch.autocast(device_type=self.device.type, dtype=self.dtype, enabled=self.dtype is not None):
+                loss, _ = self.policy.forward(batch)
+            self.scaler.scale(loss / self.grad_accum_steps).backward()
+        self._loss_sum += loss.detach().float()
+        self._loss_count += 1
+
+        if not sync_step:
+            return False
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+        self.optimizer.zero_grad(set_to_none=True)
+        return True
+
+    def pop_mean_loss(self) -> float:
+        """Mean loss since the last call. This is the only place the loop waits for the device."""
+        mean_loss = (self._loss_sum / max(self._loss_count, 1)).item()
+        self._loss_sum.zero_()
+        self._loss_count = 0
+        return mean_loss
+
+
+def _micro_batch(batch: dict) -> dict:
+    # The preprocessor replaces the image entries of the dict it is given, the tensors are not modified.
+    return dict(batch)
+
+
+def reference_update(
+    make_policy, micro_batches: list[dict], grad_accum_steps: int, lr: float, preprocessor=None
+) -> tuple[list[torch.Tensor], float]:
+    """
+    fp32 SGD steps, each on the gradient of the mean loss over the samples of `grad_accum_steps`
+    micro-batches in a single backward, i.e. a step of accumulation 1 over the whole batch. The
+    diffusion loss draws its noise on every forward, so the loss of the whole batch is built from the
+    forwards of its micro-batches with the seeds `check_modes` uses (micro-batch `j` after
+    `torch.manual_seed(j)`). Returns the parameters after the steps and the norm of the update.
+    """
+    torch.manual_seed(0)
+    policy = make_policy()
+    optimizer = torch.optim.SGD(policy.parameters(), lr=lr)
+    before = [p.detach().clone() for p in policy.parameters()]
+    for start in range(0, len(micro_batches), grad_accum_steps):
+        losses = []
+        for j in range(start, start + grad_accum_steps):
+            torch.manual_seed(j)
+            batch = _micro_batch(micro_batches[j])
+            if preprocessor is not None:
+                batch = preprocessor(batch)
+            losses.append(policy.forward(batch)[0])
+        torch.stack(losses).mean().backward()
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+    after = [p.detach() for p in policy.parameters()]
+    norm = math.sqrt(sum((a.double() - b.double()).square().sum().item() for a, b in zip(after, before)))
+    return after, norm
+
+
+def check_modes(
+    make_policy,
+    make_batches,
+    device: torch.device,
+    preprocessor=None,
+    num_steps: int = 2,
+    lr: float = 1e-2,
+    tolerances: dict[str, float] | None = None,
+) -> bool:
+    """
+    Correctness check of every precision / accumulation combination on `device` (meant for CPU).
+    `make_policy()` returns a fresh policy, `make_batches()` an iterable of device micro-batches.
+
+    Every mode runs `num_steps` SGD steps through `TrainStep` from the same weights, with micro-batch
+    `j` drawn after `torch.manual_seed(j)`, and its parameter update is compared to the fp32 update
+    of `reference_update` over the same samples: accumulation 2 over two micro-batches must match
+    one step over both, and the bf16 / fp16 updates must stay close to fp32. A mode passes when its
+    losses are finite and the relative error `|update - reference| / |reference|` is within the
+    tolerance of its precision. SGD and not Adam, whose first steps only keep the sign of the
+    gradient and would hide a gradient scaled by the wrong factor.
+    """
+    tolerances = {"fp32": 1e-4, "bf16": 0.1, "fp16": 0.05, **(tolerances or {})}
+    micro_batches = list(itertools.islice(make_batches(), 2 * num_steps))
+    if len(micro_batches) < 2 * num_steps:
+        raise ValueError(f"check_modes needs {2 * num_steps} micro-batches, got {len(micro_batches)}.")
+
+    all_ok = True
+    for grad_accum_steps in [1, 2]:
+        batches = micro_batches[: grad_accum_steps * num_steps]
+        reference, reference_norm = reference_update(make_policy, batches, grad_accum_steps, lr, preprocessor)
+        for precision in PRECISIONS:
+            # Same initial weights as the reference, so the distance of the parameters after the steps
+            # is the distance of the updates.
+            torch.manual_seed(0)
+            policy = make_policy()
+            optimizer = torch.optim.SGD(policy.parameters(), lr=lr)
+            train_step = TrainStep(policy, optimizer, device, precision, grad_accum_steps, preprocessor)
+
+            losses = []
+            for j, batch in enumerate(batches):
+                torch.manual_seed(j)
+                if train_step(_micro_batch(batch)):
+                    losses.append(train_step.pop_mean_loss())
+            after = [p.detach() for p in policy.parameters()]
+
+            distance = math.sqrt(sum((a.double() - r.double()).square().sum().item() for a, r in zip(after, reference)))
+            error = distance / reference_norm
+            finite = all(math.isfinite(x) for x in losses) and all(bool(torch.isfinite(a).all()) for a in after)
+            del policy, optimizer, train_step, after
+            ok = finite and error <= tolerances[precision]
+            all_ok &= ok
+            print(
+                f"precision: {precision:<4} grad_accum_steps: {grad_accum_steps} | "
+                f"losses: {', '.join(f'{x:.3f}' for x in losses)} | "
+                f"update error vs fp32: {error:.2e} (tolerance {tolerances[precision]:.0e}) | {'OK' if ok else 'FAILED'}"
+            )
+    return all_ok